@@ -3,10 +3,35 @@ from reportlab.lib.pagesizes import A4
 from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.pdfgen import canvas
 
+AVISO_PARCIAL = "Pré-visualização - o documento completo está sendo gerado"
+
+class _LimiteDePaginas(Exception):
+    """Interrompe a renderização ao atingir o número máximo de páginas"""
+
+class _CanvasLimitado(canvas.Canvas):
+    """Canvas que para ao tentar abrir uma página além de max_paginas"""
+
+    def __init__(self, *args, max_paginas=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._max_paginas = max_paginas
+
+    def showPage(self):
+        if self._max_paginas and self.getPageNumber() >= self._max_paginas:
+            raise _LimiteDePaginas()
+        super().showPage()
+
+    def liberar_limite(self):
+        self._max_paginas = None
+
 def gerar_pdf(
     caminho, texto_relatorio, campos, titulo="RELATÓRIO DE CORTES",
-    fonte_normal="Times-Roman", fonte_bold="Times-Bold", descricao_material=None
+    fonte_normal="Times-Roman", fonte_bold="Times-Bold", descricao_material=None,
+    max_paginas=None, aviso_parcial=AVISO_PARCIAL
 ):
+    """
+    Gera o PDF do relatório. Com max_paginas, desenha apenas as primeiras páginas
+    (cabeçalho, descrição do material e primeiras barras) como pré-visualização rápida.
+    """
     # Não registra fontes customizadas, usa apenas as padrões do ReportLab
     try:
         from reportlab.pdfbase import pdfmetrics
@@ -16,7 +41,7 @@ def gerar_pdf(
     except:
         fonte_calibri = 'Helvetica'
 
-    c = canvas.Canvas(caminho, pagesize=A4)
+    c = _CanvasLimitado(caminho, pagesize=A4, max_paginas=max_paginas)
     largura, altura = A4
     x = 40
     y = altura - 60
@@ -36,83 +61,62 @@ def gerar_pdf(
         linhas_filtradas.append(linha)
     linhas = linhas_filtradas
 
-    c.rect(30, 30, largura - 60, altura - 60, stroke=1, fill=0)
-    numero_pagina = c.getPageNumber()
-    texto_pagina = f"Página {numero_pagina}"
-    c.setFont(fonte_normal, 10)
-    largura_texto = stringWidth(texto_pagina, fonte_normal, 10)
-    c.drawString((largura - largura_texto) / 2, 15, texto_pagina)
-
-    caixa_altura = 22
-    caixa_largura = 130
-    margem = 30
-    num_caixas = 4
-    largura_util = largura - 2 * margem
-    espacamento_caixas = (largura_util - num_caixas * caixa_largura) / (num_caixas - 1)
-    x_caixa = margem
-    y_caixa = altura - 50
-
-    c.setFont(fonte_normal, 11)
-    for rotulo, valor in campos:
-        c.roundRect(x_caixa, y_caixa - caixa_altura, caixa_largura, caixa_altura, 5, stroke=1, fill=0)
-        c.drawString(x_caixa + 8, y_caixa - caixa_altura + 6, f"{rotulo} {valor}")
-        x_caixa += caixa_largura + espacamento_caixas
-
-    y_titulo = y_caixa - caixa_altura - 40
-    c.setFont(fonte_bold, tamanho_titulo)
-    largura_titulo = stringWidth(titulo, fonte_bold, tamanho_titulo)
-    c.drawString((largura - largura_titulo) / 2, y_titulo, titulo)
-    y = y_titulo - 2 * line_height
-
-    # Adicionar seção de descrição do material, se fornecida
-    if descricao_material:
-        c.setFont(fonte_bold, tamanho_subtitulo)
-        c.drawString(x, y, "Descrição do Material:")
-        y -= line_height * 1.2
-        c.setFont(fonte_normal, tamanho_normal)
-        
-        # Quebrar a descrição em múltiplas linhas se necessário
-        for sublinha in textwrap.wrap(descricao_material, width=85):
-            if y < margem + 60:
-                c.showPage()
-                c.rect(margem, margem, largura - 2 * margem, altura - 2 * margem, stroke=1, fill=0)
-                numero_pagina = c.getPageNumber()
-                texto_pagina = f"Página {numero_pagina}"
-                c.setFont(fonte_normal, 10)
-                largura_texto = stringWidth(texto_pagina, fonte_normal, 10)
-                c.drawString((largura - largura_texto) / 2, margem - 15, texto_pagina)
-                y = altura - 80
-                c.setFont(fonte_normal, tamanho_normal)
-            c.drawString(x, y, sublinha)
-            y -= line_height
-        y -= line_height  # Espaço extra após a descrição
-
-    c.setFont(fonte_normal, tamanho_normal)
-    i = 0
-
-    if any(linha.lower().startswith("barra 1") for linha in linhas) and "minuta" not in titulo.lower():
-        if y < margem + 60:
-            c.showPage()
-            c.rect(margem, margem, largura - 2 * margem, altura - 2 * margem, stroke=1, fill=0)
-            numero_pagina = c.getPageNumber()
-            texto_pagina = f"Página {numero_pagina}"
-            c.setFont(fonte_normal, 10)
-            largura_texto = stringWidth(texto_pagina, fonte_normal, 10)
-            c.drawString((largura - largura_texto) / 2, margem - 15, texto_pagina)
-            y = altura - 80
+    try:
+        c.rect(30, 30, largura - 60, altura - 60, stroke=1, fill=0)
+        numero_pagina = c.getPageNumber()
+        texto_pagina = f"Página {numero_pagina}"
+        c.setFont(fonte_normal, 10)
+        largura_texto = stringWidth(texto_pagina, fonte_normal, 10)
+        c.drawString((largura - largura_texto) / 2, 15, texto_pagina)
+
+        caixa_altura = 22
+        caixa_largura = 130
+        margem = 30
+        num_caixas = 4
+        largura_util = largura - 2 * margem
+        espacamento_caixas = (largura_util - num_caixas * caixa_largura) / (num_caixas - 1)
+        x_caixa = margem
+        y_caixa = altura - 50
+
+        c.setFont(fonte_normal, 11)
+        for rotulo, valor in campos:
+            c.roundRect(x_caixa, y_caixa - caixa_altura, caixa_largura, caixa_altura, 5, stroke=1, fill=0)
+            c.drawString(x_caixa + 8, y_caixa - caixa_altura + 6, f"{rotulo} {valor}")
+            x_caixa += caixa_largura + espacamento_caixas
+
+        y_titulo = y_caixa - caixa_altura - 40
+        c.setFont(fonte_bold, tamanho_titulo)
+        largura_titulo = stringWidth(titulo, fonte_bold, tamanho_titulo)
+        c.drawString((largura - largura_titulo) / 2, y_titulo, titulo)
+        y = y_titulo - 2 * line_height
+
+        # Adicionar seção de descrição do material, se fornecida
+        if descricao_material:
+            c.setFont(fonte_bold, tamanho_subtitulo)
+            c.drawString(x, y, "Descrição do Material:")
+            y -= line_height * 1.2
             c.setFont(fonte_normal, tamanho_normal)
-        c.setFont(fonte_bold, tamanho_subtitulo)
-        c.drawString(x, y, "Cortes Realizados")
-        y -= line_height * 1.2
+        
+            # Quebrar a descrição em múltiplas linhas se necessário
+            for sublinha in textwrap.wrap(descricao_material, width=85):
+                if y < margem + 60:
+                    c.showPage()
+                    c.rect(margem, margem, largura - 2 * margem, altura - 2 * margem, stroke=1, fill=0)
+                    numero_pagina = c.getPageNumber()
+                    texto_pagina = f"Página {numero_pagina}"
+                    c.setFont(fonte_normal, 10)
+                    largura_texto = stringWidth(texto_pagina, fonte_normal, 10)
+                    c.drawString((largura - largura_texto) / 2, margem - 15, texto_pagina)
+                    y = altura - 80
+                    c.setFont(fonte_normal, tamanho_normal)
+                c.drawString(x, y, sublinha)
+                y -= line_height
+            y -= line_height  # Espaço extra após a descrição
+
         c.setFont(fonte_normal, tamanho_normal)
-    while i < len(linhas):
-        linha = linhas[i]
-
-        if linha.lower().startswith("resumo final") or \
-           linha.lower().startswith("sugestão de barras") or \
-           linha.lower().startswith("sugestão de barras para a rm") or \
-           linha.lower().startswith("sugestão de novas barras") or \
-           linha.lower().startswith("relatório de minuta"):
+        i = 0
+
+        if any(linha.lower().startswith("barra 1") for linha in linhas) and "minuta" not in titulo.lower():
             if y < margem + 60:
                 c.showPage()
                 c.rect(margem, margem, largura - 2 * margem, altura - 2 * margem, stroke=1, fill=0)
@@ -123,27 +127,18 @@ def gerar_pdf(
                 c.drawString((largura - largura_texto) / 2, margem - 15, texto_pagina)
                 y = altura - 80
                 c.setFont(fonte_normal, tamanho_normal)
-            y -= line_height
             c.setFont(fonte_bold, tamanho_subtitulo)
-            c.drawString(x, y, linha)
+            c.drawString(x, y, "Cortes Realizados")
+            y -= line_height * 1.2
             c.setFont(fonte_normal, tamanho_normal)
-            y -= line_height
-            i += 1
-            continue
-
-        if linha == "":
-            y -= line_height // 2
-            i += 1
-            continue
-
-        if linha.strip().startswith("• Nova barra"):
-            import re
-            match = re.match(r"• Nova barra (\d+): (\d+)mm \((.*?)\) \| Sobra: (.*)", linha.strip())
-            if match:
-                barra_num = match.group(1)
-                barra_comp = match.group(2)
-                cortes_str = match.group(3)
-                sobra = match.group(4)
+        while i < len(linhas):
+            linha = linhas[i]
+
+            if linha.lower().startswith("resumo final") or \
+               linha.lower().startswith("sugestão de barras") or \
+               linha.lower().startswith("sugestão de barras para a rm") or \
+               linha.lower().startswith("sugestão de novas barras") or \
+               linha.lower().startswith("relatório de minuta"):
                 if y < margem + 60:
                     c.showPage()
                     c.rect(margem, margem, largura - 2 * margem, altura - 2 * margem, stroke=1, fill=0)
@@ -154,23 +149,70 @@ def gerar_pdf(
                     c.drawString((largura - largura_texto) / 2, margem - 15, texto_pagina)
                     y = altura - 80
                     c.setFont(fonte_normal, tamanho_normal)
-                c.drawString(x, y, f"• Nova barra {barra_num}: {barra_comp}mm")
                 y -= line_height
-                cortes_lista = [corte.strip() for corte in cortes_str.split(",")]
-                for corte in cortes_lista:
-                    if corte:
-                        if y < margem + 60:
-                            c.showPage()
-                            c.rect(margem, margem, largura - 2 * margem, altura - 2 * margem, stroke=1, fill=0)
-                            numero_pagina = c.getPageNumber()
-                            texto_pagina = f"Página {numero_pagina}"
-                            c.setFont(fonte_normal, 10)
-                            largura_texto = stringWidth(texto_pagina, fonte_normal, 10)
-                            c.drawString((largura - largura_texto) / 2, margem - 15, texto_pagina)
-                            y = altura - 80
-                            c.setFont(fonte_normal, tamanho_normal)
-                        c.drawString(x + 20, y, f"• {corte}")
-                        y -= line_height
+                c.setFont(fonte_bold, tamanho_subtitulo)
+                c.drawString(x, y, linha)
+                c.setFont(fonte_normal, tamanho_normal)
+                y -= line_height
+                i += 1
+                continue
+
+            if linha == "":
+                y -= line_height // 2
+                i += 1
+                continue
+
+            if linha.strip().startswith("• Nova barra"):
+                import re
+                match = re.match(r"• Nova barra (\d+): (\d+)mm \((.*?)\) \| Sobra: (.*)", linha.strip())
+                if match:
+                    barra_num = match.group(1)
+                    barra_comp = match.group(2)
+                    cortes_str = match.group(3)
+                    sobra = match.group(4)
+                    if y < margem + 60:
+                        c.showPage()
+                        c.rect(margem, margem, largura - 2 * margem, altura - 2 * margem, stroke=1, fill=0)
+                        numero_pagina = c.getPageNumber()
+                        texto_pagina = f"Página {numero_pagina}"
+                        c.setFont(fonte_normal, 10)
+                        largura_texto = stringWidth(texto_pagina, fonte_normal, 10)
+                        c.drawString((largura - largura_texto) / 2, margem - 15, texto_pagina)
+                        y = altura - 80
+                        c.setFont(fonte_normal, tamanho_normal)
+                    c.drawString(x, y, f"• Nova barra {barra_num}: {barra_comp}mm")
+                    y -= line_height
+                    cortes_lista = [corte.strip() for corte in cortes_str.split(",")]
+                    for corte in cortes_lista:
+                        if corte:
+                            if y < margem + 60:
+                                c.showPage()
+                                c.rect(margem, margem, largura - 2 * margem, altura - 2 * margem, stroke=1, fill=0)
+                                numero_pagina = c.getPageNumber()
+                                texto_pagina = f"Página {numero_pagina}"
+                                c.setFont(fonte_normal, 10)
+                                largura_texto = stringWidth(texto_pagina, fonte_normal, 10)
+                                c.drawString((largura - largura_texto) / 2, margem - 15, texto_pagina)
+                                y = altura - 80
+                                c.setFont(fonte_normal, tamanho_normal)
+                            c.drawString(x + 20, y, f"• {corte}")
+                            y -= line_height
+                    if y < margem + 60:
+                        c.showPage()
+                        c.rect(margem, margem, largura - 2 * margem, altura - 2 * margem, stroke=1, fill=0)
+                        numero_pagina = c.getPageNumber()
+                        texto_pagina = f"Página {numero_pagina}"
+                        c.setFont(fonte_normal, 10)
+                        largura_texto = stringWidth(texto_pagina, fonte_normal, 10)
+                        c.drawString((largura - largura_texto) / 2, margem - 15, texto_pagina)
+                        y = altura - 80
+                        c.setFont(fonte_normal, tamanho_normal)
+                    c.drawString(x + 20, y, f"• Sobra: {sobra}")
+                    y -= line_height * 1.2
+                    i += 1
+                    continue
+
+            for sublinha in textwrap.wrap(linha, width=110):
                 if y < margem + 60:
                     c.showPage()
                     c.rect(margem, margem, largura - 2 * margem, altura - 2 * margem, stroke=1, fill=0)
@@ -181,25 +223,16 @@ def gerar_pdf(
                     c.drawString((largura - largura_texto) / 2, margem - 15, texto_pagina)
                     y = altura - 80
                     c.setFont(fonte_normal, tamanho_normal)
-                c.drawString(x + 20, y, f"• Sobra: {sobra}")
-                y -= line_height * 1.2
-                i += 1
-                continue
-
-        for sublinha in textwrap.wrap(linha, width=110):
-            if y < margem + 60:
-                c.showPage()
-                c.rect(margem, margem, largura - 2 * margem, altura - 2 * margem, stroke=1, fill=0)
-                numero_pagina = c.getPageNumber()
-                texto_pagina = f"Página {numero_pagina}"
-                c.setFont(fonte_normal, 10)
-                largura_texto = stringWidth(texto_pagina, fonte_normal, 10)
-                c.drawString((largura - largura_texto) / 2, margem - 15, texto_pagina)
-                y = altura - 80
-                c.setFont(fonte_normal, tamanho_normal)
-            c.drawString(x, y, sublinha)
-            y -= line_height
-        i += 1
+                c.drawString(x, y, sublinha)
+                y -= line_height
+            i += 1
+    except _LimiteDePaginas:
+        # Pré-visualização: apenas as primeiras páginas, com aviso no rodapé
+        c.setFont(fonte_bold, 10)
+        largura_aviso = stringWidth(aviso_parcial, fonte_bold, 10)
+        c.drawString((largura - largura_aviso) / 2, margem + 8, aviso_parcial)
+    # save() chama showPage() para fechar a última página
+    c.liberar_limite()
 
     numero_pagina = c.getPageNumber()
     texto_pagina = f"Página {numero_pagina}"
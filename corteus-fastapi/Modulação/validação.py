@@ -17,12 +17,9 @@ def validar_cod_material_com_base(cod):
         return False
     
     try:
+        # Import tardio (evita dependência de app ao usar só a Modulação); o serviço
+        # já trata a base vazia aceitando o código, e avisa só uma vez
         from app.services.material_service import material_service
-        # Se não há materiais carregados, usa validação básica
-        if not material_service.materiais_db:
-            print("Base de materiais vazia, usando validação básica")
-            return True
-        # Verifica se existe na base
         return material_service.validar_codigo_material(cod)
     except Exception as e:
         print(f"Erro na validação com base: {e}")
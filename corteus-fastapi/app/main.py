@@ -5,10 +5,15 @@ from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 import os
 import base64
 import hashlib
+import asyncio
 from decouple import config
 
-from app.routers import cortes, relatorios, analytics, materiais
+from app.routers import cortes, relatorios, analytics, materiais, artefatos
 from app.auth import auth_manager
+from app.services.artifact_store import artifact_store
+from app.services.material_service import material_service
+from app.models.analytics import analytics_storage
+from app.models.analytics_buffer import analytics_buffer
 
 app = FastAPI(
     title="Corteus - Gestor de Cortes",
@@ -28,9 +33,31 @@ templates = Jinja2Templates(directory="app/templates")
 app.include_router(cortes.router, prefix="/api", tags=["cortes"])
 app.include_router(relatorios.router, prefix="/api", tags=["relatorios"])
 app.include_router(materiais.router, prefix="/api", tags=["materiais"])
+app.include_router(artefatos.router, prefix="/api", tags=["artefatos"])
 # Analytics router sem prefixo para aceitar tanto /track quanto /analytics-data
 app.include_router(analytics.router, tags=["analytics"])
 
+# Tarefas em segundo plano iniciadas no startup
+background_tasks = []
+
+@app.on_event("startup")
+async def iniciar_tarefas_background():
+    """Inicia a limpeza dos PDFs temporários, o monitoramento do CSV de materiais, a gravação dos eventos de analytics e a manutenção do log"""
+    background_tasks.append(asyncio.create_task(artifact_store.executar_limpeza_periodica()))
+    background_tasks.append(asyncio.create_task(material_service.monitorar_alteracoes()))
+    background_tasks.append(asyncio.create_task(analytics_buffer.run()))
+    background_tasks.append(asyncio.create_task(analytics_storage.run_maintenance_loop()))
+
+@app.on_event("shutdown")
+async def encerrar_tarefas_background():
+    """Cancela as tarefas em segundo plano e grava os eventos de analytics ainda na fila e os agregados"""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+    await analytics_buffer.drain()
+    analytics_storage.aggregates.save(force=True)
+
 def get_base64_image(image_path):
     """Converte imagem para base64"""
     try:
@@ -1,9 +1,46 @@
 from pydantic import BaseModel
-from datetime import datetime, timezone, timedelta
-from typing import Optional, Dict, Any
-import json
+from datetime import datetime, time, timezone, timedelta
+from typing import Optional, Dict, Any, Iterable, Iterator, Tuple
+from decouple import config
+import asyncio
 import os
 
+from app.models.analytics_log import (
+    AnalyticsLog, MS_POR_MINUTO, datetime_de_ts, dia_do_evento, normalizar_evento, timestamp_ms, ts_do_evento
+)
+from app.models.analytics_aggregates import AnalyticsRollups, CAPACIDADE_TOP_K, DailyAggregates, StatsAggregate
+from app.models.analytics_sqlite import AnalyticsLogSQLite, SQLiteAggregates
+from app.services.result_cache import CacheLRU
+
+# Armazenamento dos eventos: "jsonl" (segmentos diários + agregados) ou "sqlite"
+# (banco em WAL com índices, estatísticas por agregações SQL)
+ANALYTICS_BACKEND = config("ANALYTICS_BACKEND", default="jsonl")
+BACKENDS_ANALYTICS = ("jsonl", "sqlite")
+# Diretório dos dados de analytics (segmentos JSONL ou banco SQLite)
+ANALYTICS_DATA_DIR = config("ANALYTICS_DATA_DIR", default="analytics_data")
+# fsync das gravações: "always", "interval" (a cada ANALYTICS_FSYNC_INTERVAL segundos) ou "never"
+ANALYTICS_FSYNC = config("ANALYTICS_FSYNC", default="interval")
+ANALYTICS_FSYNC_INTERVAL = config("ANALYTICS_FSYNC_INTERVAL", default=1.0, cast=float)
+# Arquivo do formato antigo (lista JSON única), migrado para os segmentos na primeira execução
+ANALYTICS_LEGACY_FILE = "analytics_data.json"
+
+# Segmentos de dias com mais de N dias são comprimidos em gzip (0 desativa)
+ANALYTICS_COMPRESS_AFTER_DAYS = config("ANALYTICS_COMPRESS_AFTER_DAYS", default=2, cast=int)
+
+# Retenção em camadas: eventos brutos por N dias; depois disso cada dia vira um rollup
+# (agregado diário com todas as métricas do dashboard), mantido por M dias (0 = sempre)
+ANALYTICS_RAW_RETENTION_DAYS = config("ANALYTICS_RAW_RETENTION_DAYS", default=30, cast=int)
+ANALYTICS_ROLLUP_RETENTION_DAYS = config("ANALYTICS_ROLLUP_RETENTION_DAYS", default=1825, cast=int)
+
+# Respostas do dashboard em cache por (período, versão dos dados): entradas na memória de cada worker
+ANALYTICS_CACHE_ITENS = config("ANALYTICS_CACHE_ITENS", default=64, cast=int)
+
+# Compactação: tipos de evento relevantes
+COMPACTED_EVENT_TYPES = {'page_view', 'button_click', 'form_submission', 'report_generated',
+                         'help_clicked', 'pdf_download', 'corte_generated', 'performance_metrics'}
+# Intervalo da manutenção em segundo plano (retenção, compressão, compactação)
+ANALYTICS_COMPACT_INTERVAL = config("ANALYTICS_COMPACT_INTERVAL", default=3600, cast=int)  # segundos
+
 # Definir fuso horário do Brasil (UTC-3)
 BRAZIL_TZ = timezone(timedelta(hours=-3))
 
@@ -28,9 +65,30 @@ class AnalyticsEvent(BaseModel):
 class AnalyticsStorage:
     """Sistema otimizado de armazenamento com rate limiting e compactação"""
     
-    def __init__(self, file_path: str = "analytics_data.json"):
-        self.file_path = file_path
-        self.ensure_file_exists()
+    def __init__(self, data_dir: str = ANALYTICS_DATA_DIR, legacy_file: str = ANALYTICS_LEGACY_FILE,
+                 backend: str = ANALYTICS_BACKEND):
+        if backend not in BACKENDS_ANALYTICS:
+            raise ValueError(f"ANALYTICS_BACKEND inválido: {backend!r} (use {' ou '.join(BACKENDS_ANALYTICS)})")
+        self.backend = backend
+        if backend == "sqlite":
+            self.log = AnalyticsLogSQLite(data_dir, ANALYTICS_FSYNC, ANALYTICS_FSYNC_INTERVAL)
+        else:
+            self.log = AnalyticsLog(data_dir, ANALYTICS_FSYNC, ANALYTICS_FSYNC_INTERVAL)
+        self.ensure_file_exists(legacy_file)
+        self.event_count = self.log.count_events()
+        # Estatísticas do dashboard: agregados diários atualizados a cada gravação no
+        # log (JSONL) ou consultas agregadas direto no banco (SQLite)
+        if backend == "sqlite":
+            self.aggregates = SQLiteAggregates(self.log)
+        else:
+            self.aggregates = DailyAggregates(self.log)
+        self.aggregates.sync()
+        # Rollups diários dos dias que já saíram da retenção de eventos brutos
+        self.rollups = AnalyticsRollups(data_dir)
+        # Estatísticas já calculadas, válidas enquanto a versão dos dados não mudar
+        self.stats_cache = CacheLRU(ANALYTICS_CACHE_ITENS)
+        # Dia da última compressão de segmentos antigos (roda uma vez por dia, na gravação)
+        self.compressed_on = None
         # Cache para rate limiting
         self.session_event_count = {}
         self.last_cleanup = datetime.now()
@@ -38,11 +96,14 @@ class AnalyticsStorage:
         self.recent_events_cache = {}
         self.cache_cleanup_interval = 300  # 5 minutos
     
-    def ensure_file_exists(self):
-        """Garante que o arquivo existe"""
-        if not os.path.exists(self.file_path):
-            with open(self.file_path, 'w') as f:
-                json.dump([], f)
+    def ensure_file_exists(self, legacy_file: str):
+        """Garante que o log existe, migrando o analytics_data.json antigo se houver"""
+        try:
+            migrated = self.log.migrate_legacy_file(legacy_file)
+            if migrated:
+                print(f"Migrados {migrated} eventos de {legacy_file} para {self.log.directory}")
+        except Exception as e:
+            print(f"Erro ao migrar {legacy_file}: {e}")
     
     def should_accept_event(self, event: AnalyticsEvent) -> bool:
         """Rate limiting e deduplicação - limitar eventos por sessão"""
@@ -78,450 +139,313 @@ class AnalyticsStorage:
         
         return True
     
+    def accept_event(self, event: AnalyticsEvent) -> bool:
+        """Aplica rate limiting e deduplicação e, se aceito, conta o evento na sessão"""
+        if not self.should_accept_event(event):
+            return False
+        session_id = event.session_id
+        self.session_event_count[session_id] = self.session_event_count.get(session_id, 0) + 1
+        return True
+    
+    def accept_events(self, events: list) -> list:
+        """Aplica rate limiting e deduplicação a um lote em memória, retornando os aceitos"""
+        return [event for event in events if self.accept_event(event)]
+    
     def save_event(self, event: AnalyticsEvent):
         """Salva um evento com rate limiting e compactação automática inteligente"""
         try:
             # Verificar rate limiting
-            if not self.should_accept_event(event):
+            if not self.accept_event(event):
                 return False
-            
-            # Ler dados existentes
-            with open(self.file_path, 'r') as f:
-                data = json.load(f)
-            
-            # Adicionar novo evento
-            event_dict = event.dict()
-            event_dict['timestamp'] = event.timestamp.isoformat()
-            data.append(event_dict)
-            
-            # Verificar se precisa de compactação automática (apenas a cada 50 eventos para não sobrecarregar)
-            if len(data) % 50 == 0:
-                auto_compact_result = self.auto_compact_if_needed()
-                if auto_compact_result.get("performed", False):
-                    print(f"Compactação automática executada: {auto_compact_result}")
-                    # Recarregar dados após compactação
-                    with open(self.file_path, 'r') as f:
-                        data = json.load(f)
-                    # Adicionar o evento atual novamente
-                    data.append(event_dict)
-            
-            # Limite de segurança mais alto para permitir análise antes da compactação automática
-            if len(data) > 800:
-                data = data[-800:]
-            
-            # Salvar dados
-            with open(self.file_path, 'w') as f:
-                json.dump(data, f, indent=2)
-            
-            # Atualizar contador da sessão
-            session_id = event.session_id
-            self.session_event_count[session_id] = self.session_event_count.get(session_id, 0) + 1
-            
+            self.save_events([event])
             return True
             
         except Exception as e:
             print(f"Erro ao salvar evento de analytics: {e}")
             return False
     
+    def save_events(self, events: list) -> int:
+        """Grava eventos já aceitos (accept_event) em uma única escrita no log"""
+        event_dicts = []
+        for event in events:
+            event_dict = event.dict()
+            event_dict['timestamp'] = event.timestamp.isoformat()
+            # Timestamp normalizado, calculado uma única vez aqui
+            event_dict['ts'] = timestamp_ms(event.timestamp)
+            event_dicts.append(event_dict)
+        if not event_dicts:
+            return 0
+        
+        # Acrescentar os eventos aos segmentos dos seus dias (sem reler o histórico);
+        # retenção, compressão e compactação ficam na manutenção em segundo plano
+        with self.log.write_lock():
+            self.log.append(event_dicts)
+            self.event_count += len(event_dicts)
+        # Os eventos já estão no log: uma falha nos agregados não pode devolver o lote à
+        # fila (seria gravado de novo); o próximo sync ou rebuild recupera os agregados
+        try:
+            self.aggregates.sync({dia_do_evento(e) for e in event_dicts})
+        except Exception as e:
+            print(f"Erro ao atualizar os agregados de analytics: {e}")
+        
+        return len(event_dicts)
+    
+    async def run_maintenance_loop(self):
+        """Manutenção do log em segundo plano (iniciada no startup), fora do caminho da ingestão"""
+        while True:
+            await asyncio.sleep(ANALYTICS_COMPACT_INTERVAL)
+            try:
+                await asyncio.to_thread(self.run_maintenance)
+            except Exception as e:
+                print(f"Erro na manutenção do log de analytics: {e}")
+    
+    def run_maintenance(self) -> dict:
+        """Aplica a retenção (rollups), comprime dias antigos e compacta o log se necessário"""
+        with self.log.maintenance_lock() as acquired:
+            if not acquired:
+                # Outro worker já está fazendo a manutenção do mesmo diretório
+                return {"performed": False, "reason": "Manutenção em andamento em outro processo"}
+            
+            # Com vários workers, cada um só soma os próprios eventos: recontar pelo log
+            with self.log.write_lock():
+                self.event_count = self.log.count_events()
+            self.apply_retention()
+            self.compress_old_segments()
+            
+            result = self.auto_compact_if_needed()
+            if result.get("performed", False):
+                print(f"Compactação automática executada: {result}")
+            return result
+    
+    @staticmethod
+    def _raw_cutoff_day() -> str:
+        """Primeiro dia mantido em eventos brutos; os anteriores ficam só nos rollups"""
+        return (datetime.now().date() - timedelta(days=ANALYTICS_RAW_RETENTION_DAYS)).isoformat()
+    
+    def roll_up_before(self, day: str) -> int:
+        """
+        Transforma em rollups os dias anteriores a `day` e apaga seus eventos brutos
+        
+        Um dia por vez, sob o write_lock: o agregado do dia é calculado a partir dos
+        eventos, somado ao rollup do dia (eventos atrasados de um dia já agregado) e
+        gravado antes de os eventos serem apagados. Retorna quantos eventos saíram do log.
+        """
+        removed = 0
+        for old_day in self.log.days():
+            # Dias sem data válida não têm onde entrar nos rollups: ficam no log
+            if not old_day[:1].isdigit() or old_day >= day:
+                continue
+            with self.log.write_lock():
+                aggregate = StatsAggregate()
+                for event in self.log.iter_events(old_day, old_day):
+                    aggregate.add(event)
+                aggregate.trim_top(CAPACIDADE_TOP_K)
+                if aggregate.total_events:
+                    self.rollups.add(old_day, aggregate)
+                self.log.replace_day(old_day, [])
+                self.event_count -= aggregate.total_events
+                removed += aggregate.total_events
+        if removed:
+            self.aggregates.sync()
+        return removed
+    
+    def apply_retention(self) -> dict:
+        """Retenção em camadas: dias fora da retenção de eventos brutos viram rollups; rollups vencidos são apagados"""
+        try:
+            rolled_up = self.roll_up_before(self._raw_cutoff_day())
+            dropped_rollups = 0
+            if ANALYTICS_ROLLUP_RETENTION_DAYS > 0:
+                rollup_cutoff = (datetime.now().date() - timedelta(days=ANALYTICS_ROLLUP_RETENTION_DAYS)).isoformat()
+                with self.log.write_lock():
+                    dropped_rollups = self.rollups.drop_before(rollup_cutoff)
+                    if dropped_rollups:
+                        self.log.bump_version()
+            if rolled_up or dropped_rollups:
+                print(f"Retenção de analytics: {rolled_up} eventos agregados em rollups, {dropped_rollups} dias de rollup apagados")
+            return {"rolled_up_events": rolled_up, "dropped_rollup_days": dropped_rollups}
+        except Exception as e:
+            print(f"Erro ao aplicar retenção de analytics: {e}")
+            return {"rolled_up_events": 0, "dropped_rollup_days": 0, "error": str(e)}
+    
+    def compress_old_segments(self):
+        """Comprime os segmentos de dias com mais de ANALYTICS_COMPRESS_AFTER_DAYS dias (uma vez por dia)"""
+        today = datetime.now(BRAZIL_TZ).date()
+        if ANALYTICS_COMPRESS_AFTER_DAYS <= 0 or self.compressed_on == today:
+            return
+        self.compressed_on = today
+        try:
+            cutoff = (today - timedelta(days=ANALYTICS_COMPRESS_AFTER_DAYS)).isoformat()
+            with self.log.write_lock():
+                compressed = self.log.compress_before(cutoff)
+            if compressed:
+                self.aggregates.sync()
+                print(f"Comprimidos {compressed} segmentos de analytics anteriores a {cutoff}")
+        except Exception as e:
+            print(f"Erro ao comprimir segmentos de analytics: {e}")
+    
+    def iter_events(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> Iterator[dict]:
+        """Percorre os eventos do período sob demanda, abrindo só os segmentos dos dias do período"""
+        # Limites em milissegundos (horário local, sem fuso), comparados com o "ts" de cada evento
+        start_ms = timestamp_ms(start_date) if start_date else None
+        end_ms = timestamp_ms(end_date) if end_date else None
+        start_day = start_date.date().isoformat() if start_date else None
+        end_day = end_date.date().isoformat() if end_date else None
+        
+        for event in self.log.iter_events(start_day, end_day):
+            if start_ms is None and end_ms is None:
+                yield event
+                continue
+            ts = ts_do_evento(event)
+            if ts is None:
+                print(f"Erro ao processar timestamp {event.get('timestamp', 'N/A')}")
+                continue
+            if start_ms is not None and ts < start_ms:
+                continue
+            if end_ms is not None and ts > end_ms:
+                continue
+            yield event
+    
     def get_events(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> list:
         """Recupera eventos filtrados por data"""
         try:
-            with open(self.file_path, 'r') as f:
-                data = json.load(f)
-            
-            if start_date or end_date:
-                filtered_data = []
-                for event in data:
-                    try:
-                        timestamp_str = event['timestamp']
-                        # Remover timezone se presente para normalizar
-                        if 'Z' in timestamp_str:
-                            timestamp_str = timestamp_str.replace('Z', '+00:00')
-                        
-                        event_time = datetime.fromisoformat(timestamp_str)
-                        
-                        # Converter para naive datetime se necessário
-                        if event_time.tzinfo is not None:
-                            event_time = event_time.replace(tzinfo=None)
-                        
-                        # Normalizar start_date e end_date também
-                        if start_date:
-                            start_naive = start_date.replace(tzinfo=None) if start_date.tzinfo else start_date
-                            if event_time < start_naive:
-                                continue
-                        
-                        if end_date:
-                            end_naive = end_date.replace(tzinfo=None) if end_date.tzinfo else end_date
-                            if event_time > end_naive:
-                                continue
-                        
-                        filtered_data.append(event)
-                    except Exception as e:
-                        print(f"Erro ao processar timestamp {event.get('timestamp', 'N/A')}: {e}")
-                        continue
-                
-                return filtered_data
-            
-            return data
-            
+            return list(self.iter_events(start_date, end_date))
         except Exception as e:
             print(f"Erro ao ler eventos de analytics: {e}")
             return []
     
+    @staticmethod
+    def _day_range(start_date: Optional[datetime], end_date: Optional[datetime]) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        """Dias (YYYY-MM-DD) do período se ele cobre dias inteiros, senão None"""
+        if start_date is not None and start_date.time() != time.min:
+            return None
+        if end_date is not None and end_date.time() < time(23, 59, 59):
+            return None
+        return (
+            start_date.date().isoformat() if start_date else None,
+            end_date.date().isoformat() if end_date else None,
+        )
+    
+    @staticmethod
+    def _full_days(start_date: Optional[datetime], end_date: Optional[datetime]) -> Optional[Tuple[Optional[str], Optional[str]]]:
+        """Primeiro e último dias inteiramente dentro do período (None se não houver nenhum)"""
+        first = last = None
+        if start_date is not None:
+            first = start_date.date() + timedelta(days=0 if start_date.time() == time.min else 1)
+        if end_date is not None:
+            last = end_date.date() - timedelta(days=0 if end_date.time() >= time(23, 59, 59) else 1)
+        if first is not None and last is not None and first > last:
+            return None
+        return (first.isoformat() if first else None, last.isoformat() if last else None)
+    
     def get_stats(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None) -> dict:
         """Gera estatísticas avançadas dos eventos"""
-        events = self.get_events(start_date, end_date)
-        
-        if not events:
-            # Retornar estrutura completa com valores padrão quando não há dados
-            return {
-                "total_views": 0,
-                "unique_users": 0,
-                "top_pages": [],
-                "daily_views": [],
-                "user_engagement": {
-                    "avg_time_on_page": 0,
-                    "total_interactions": 0
-                },
-                "performance_metrics": {
-                    "total_events": 0,
-                    "events_per_user": 0,
-                    "active_sessions": 0,
-                    "avg_sessions_per_user": 0
-                },
-                "device_analytics": {
-                    "devices": [],
-                    "browsers": [],
-                    "top_resolutions": []
-                },
-                "time_analytics": {
-                    "hourly_activity": [],
-                    "peak_hour": 0
-                },
-                "interaction_analytics": {
-                    "top_buttons": [],
-                    "form_completions": 0,
-                    "help_clicks": 0
-                }
-            }
-        
-        # Processar eventos - garantir que events é uma lista
-        if not isinstance(events, list):
-            print(f"Erro: events não é uma lista, é {type(events)}")
-            events = []
-        
-        # RESTAURADO: filtrar eventos específicos do sistema
-        page_views = [e for e in events if e.get('event') == 'page_view']
-        button_clicks = [e for e in events if e.get('event') == 'button_click']
-        form_submissions = [e for e in events if e.get('event') == 'form_submission']
-        help_clicks = [e for e in events if e.get('event') == 'help_clicked']
-        report_generated_events = [e for e in events if e.get('event') == 'report_generated']
-        pdf_download_events = [e for e in events if e.get('event') == 'pdf_download']
-        corte_events = [e for e in events if e.get('event') == 'corte_generated']
-        
-        # Obter usuários únicos de forma segura
-        unique_user_ids = set()
-        unique_session_ids = set()
-        
-        for event in events:
-            if isinstance(event, dict):
-                user_id = event.get('user_id', '')
-                session_id = event.get('session_id', '')
-                
-                if user_id and user_id.strip():
-                    unique_user_ids.add(user_id)
-                if session_id and session_id.strip():
-                    unique_session_ids.add(session_id)
-        
-        unique_users = len(unique_user_ids)
-        unique_sessions = len(unique_session_ids)
-        
-        # Top páginas
-        page_counts = {}
-        for event in page_views:
-            page = event.get('page', '/')
-            page_counts[page] = page_counts.get(page, 0) + 1
-        
-        top_pages = [{"page": page, "views": count} for page, count in 
-                    sorted(page_counts.items(), key=lambda x: x[1], reverse=True)[:5]]
-        
-        # Views diárias - CORRIGIDO: contar apenas page_views como estava antes
-        daily_counts = {}
-        for event in page_views:  # Voltar a usar apenas page_views
-            try:
-                timestamp_str = event['timestamp']
-                if 'Z' in timestamp_str:
-                    timestamp_str = timestamp_str.replace('Z', '+00:00')
-                
-                event_date = datetime.fromisoformat(timestamp_str).date()
-                daily_counts[event_date] = daily_counts.get(event_date, 0) + 1
-            except:
-                continue
-        
-        daily_views = [{"date": str(date), "views": count} for date, count in 
-                      sorted(daily_counts.items())]
-        
-        # Tempo médio na página (calculado a partir dos eventos page_exit)
-        page_exit_events = [e for e in events if e.get('event') == 'page_exit']
-        total_time = 0
-        valid_sessions = 0
-        
-        for exit_event in page_exit_events:
-            data = exit_event.get('data', {})
-            time_on_page = data.get('time_on_page')
-            
-            if time_on_page and isinstance(time_on_page, (int, float)) and time_on_page > 0:
-                # Converter de milissegundos para segundos
-                time_in_seconds = time_on_page / 1000
-                # Filtrar valores muito altos (mais de 1 hora) que podem ser outliers
-                if time_in_seconds <= 3600:
-                    total_time += time_in_seconds
-                    valid_sessions += 1
-        
-        # Calcular média ou usar fallback baseado em page views
-        if valid_sessions > 0:
-            avg_time_on_page = total_time / valid_sessions
-        elif page_views:
-            # Fallback: estimar baseado no número de page views (usuários que ficaram pouco tempo)
-            avg_time_on_page = min(30, len(page_views) * 2)  # Máximo 30s, mínimo baseado em atividade
+        day_range = self._day_range(start_date, end_date)
+        if day_range is not None:
+            # Período em dias inteiros (o caso do dashboard): somar os agregados diários
+            # dos eventos brutos e os rollups dos dias que já saíram da retenção
+            self.aggregates.sync()
+            stats = self.aggregates.aggregate(*day_range)
+        elif self.backend == "sqlite":
+            # Período avulso no SQLite: agregações pelo índice de timestamp
+            stats = self.aggregates.aggregate_between(
+                timestamp_ms(start_date) if start_date else None,
+                timestamp_ms(end_date) if end_date else None
+            )
         else:
-            avg_time_on_page = 0
-        
-        # Análise de dispositivos
-        device_users = {}
-        browser_users = {}
-        for event in events:
-            user_agent = event.get('user_agent', '').lower()
-            user_id = event.get('user_id', '')
-            
-            if user_id and user_agent:
-                if 'mobile' in user_agent or 'android' in user_agent or 'iphone' in user_agent:
-                    device_users['Mobile'] = device_users.get('Mobile', set())
-                    device_users['Mobile'].add(user_id)
-                elif 'tablet' in user_agent or 'ipad' in user_agent:
-                    device_users['Tablet'] = device_users.get('Tablet', set())
-                    device_users['Tablet'].add(user_id)
-                else:
-                    device_users['Desktop'] = device_users.get('Desktop', set())
-                    device_users['Desktop'].add(user_id)
-                
-                if 'chrome' in user_agent:
-                    browser_users['Chrome'] = browser_users.get('Chrome', set())
-                    browser_users['Chrome'].add(user_id)
-                elif 'firefox' in user_agent:
-                    browser_users['Firefox'] = browser_users.get('Firefox', set())
-                    browser_users['Firefox'].add(user_id)
-                elif 'safari' in user_agent:
-                    browser_users['Safari'] = browser_users.get('Safari', set())
-                    browser_users['Safari'].add(user_id)
-                else:
-                    browser_users['Other'] = browser_users.get('Other', set())
-                    browser_users['Other'].add(user_id)
-        
-        # Converter sets para contadores
-        for device in device_users:
-            device_users[device] = len(device_users[device])
-        for browser in browser_users:
-            browser_users[browser] = len(browser_users[browser])
-        
-        # Atividade por hora
-        hourly_activity = {}
-        for event in events:
+            # Período avulso: uma única passada pelos eventos, com acumuladores de tamanho fixo
+            stats = StatsAggregate(capacidade_top=CAPACIDADE_TOP_K)
             try:
-                timestamp_str = event['timestamp']
-                if 'Z' in timestamp_str:
-                    timestamp_str = timestamp_str.replace('Z', '+00:00')
-                
-                event_time = datetime.fromisoformat(timestamp_str)
-                hour = event_time.hour
-                hourly_activity[hour] = hourly_activity.get(hour, 0) + 1
-            except:
-                continue
-        
-        # Top botões clicados - RESTAURADO: detecção correta de botões
-        button_counts = {}
-        pdf_downloads = len(pdf_download_events) # Contar eventos diretos de PDF
-        report_generations = len(report_generated_events) # Contar eventos diretos de relatório
-        
-        for click in button_clicks:
-            # Extrair informações do botão de forma mais robusta
-            data = click.get('data', {})
-            button_text = data.get('buttonText', data.get('button_text', 'Unknown'))
-            button_id = data.get('buttonId', data.get('button_id', ''))
-            
-            # Detectar downloads de PDF e relatórios gerados via cliques de botão
-            if 'download' in button_text.lower() or 'baixar' in button_text.lower() or 'pdf' in button_text.lower():
-                pdf_downloads += 1
-            if 'gerar' in button_text.lower() or 'relatório' in button_text.lower() or 'relatorio' in button_text.lower():
-                report_generations += 1
-            
-            # Contar cliques por botão
-            button_key = f"{button_text} ({button_id})" if button_id else button_text
-            button_counts[button_key] = button_counts.get(button_key, 0) + 1
-        
-        # Adicionar eventos de corte ao contador de relatórios
-        report_generations += len(corte_events)
-        
-        top_buttons = [{"button": button, "clicks": count} for button, count in 
-                      sorted(button_counts.items(), key=lambda x: x[1], reverse=True)[:5]]
-        
-        return {
-            "total_views": len(page_views),
-            "unique_users": unique_users,
-            "total_sessions": unique_sessions,  # unique_sessions já é um inteiro
-            "top_pages": top_pages,
-            "daily_views": daily_views,
-            "user_engagement": {
-                "avg_time_on_page": round(avg_time_on_page, 2),
-                "total_interactions": len(button_clicks) + len(form_submissions) + len(help_clicks)  # CORRIGIDO: incluir help_clicks
-            },
-            "performance_metrics": {
-                "total_events": len(events),
-                "events_per_user": round(len(events) / unique_users, 2) if unique_users else 0,
-                "events_per_session": round(len(events) / unique_sessions, 2) if unique_sessions else 0,
-                "active_sessions": unique_sessions,  # unique_sessions já é um inteiro
-                "avg_sessions_per_user": round(unique_sessions / unique_users, 2) if unique_users else 0
-            },
-            "device_analytics": {
-                "devices": [{"type": device, "count": count} for device, count in device_users.items()],
-                "browsers": [{"browser": browser, "count": count} for browser, count in browser_users.items()],
-                "top_resolutions": self._get_top_resolutions(events)
-            },
-            "time_analytics": {
-                "hourly_activity": [{"hour": hour, "activity": count} for hour, count in sorted(hourly_activity.items())],
-                "peak_hour": max(hourly_activity, key=hourly_activity.get) if hourly_activity else 0
-            },
-            "interaction_analytics": {
-                "top_buttons": top_buttons,
-                "form_completions": len(form_submissions),
-                "help_clicks": len(help_clicks),
-                "pdf_downloads": pdf_downloads,  # RESTAURADO: downloads de PDF
-                "report_generations": report_generations,  # RESTAURADO: relatórios gerados
-                "corte_generations": len(corte_events),  # RESTAURADO: cortes gerados
-                "total_button_clicks": len(button_clicks)  # RESTAURADO: total de cliques
-            }
-        }
+                for event in self.iter_events(start_date, end_date):
+                    stats.add(event)
+            except Exception as e:
+                print(f"Erro ao ler eventos de analytics: {e}")
+        
+        # Rollups só têm dias inteiros: entram os dias completamente dentro do período
+        rollup_days = day_range or self._full_days(start_date, end_date)
+        if rollup_days is not None:
+            try:
+                stats.merge(self.rollups.aggregate(*rollup_days))
+            except Exception as e:
+                print(f"Erro ao ler rollups de analytics: {e}")
+        return stats.to_stats()
     
-    def _get_top_resolutions(self, events) -> list:
-        """Obter resoluções de tela mais comuns"""
-        resolutions = {}
-        for event in events:
-            resolution = event.get('screen_resolution', '')
-            if resolution:
-                resolutions[resolution] = resolutions.get(resolution, 0) + 1
-        
-        return [{"resolution": res, "count": count} for res, count in 
-               sorted(resolutions.items(), key=lambda x: x[1], reverse=True)[:5]]
+    def data_version(self) -> int:
+        """Versão dos dados do diretório: muda a cada gravação concluída, em qualquer worker"""
+        return self.log.version()
+    
+    def get_stats_cached(self, start_date: Optional[datetime] = None, end_date: Optional[datetime] = None,
+                         version: Optional[int] = None) -> dict:
+        """
+        get_stats em cache por (período, versão dos dados)
+        
+        A versão deve ser lida antes do cálculo (é a mesma do ETag da resposta): uma
+        gravação concluída durante o cálculo muda a versão, e a entrada fica só com a
+        versão antiga, que não é mais consultada. O dict devolvido é compartilhado.
+        """
+        if version is None:
+            version = self.data_version()
+        return self.stats_cache.obter_ou_calcular(
+            ("stats", start_date, end_date, version), lambda: self.get_stats(start_date, end_date)
+        )
+    
+    def storage_summary(self) -> dict:
+        """Tamanho do log, número de segmentos e dias de rollup, em cache pela versão dos dados"""
+        def calcular():
+            return {
+                "file_size_bytes": self.log.size_bytes(),
+                "segments": len(self.log.segments()),
+                "rollup_days": len(self.rollups.days()),
+            }
+        return self.stats_cache.obter_ou_calcular(("storage", self.data_version()), calcular)
     
     def clear_all_data(self):
         """Limpa todos os dados de analytics"""
         try:
-            with open(self.file_path, 'w') as f:
-                json.dump([], f)
+            with self.log.write_lock():
+                self.log.clear()
+                self.event_count = 0
+            self.aggregates.clear()
+            with self.log.write_lock():
+                self.rollups.clear()
+                self.log.bump_version()
             print("Dados de analytics limpos com sucesso")
         except Exception as e:
             print(f"Erro ao limpar dados de analytics: {e}")
             raise e
     
     def compact_log(self) -> dict:
-        """Compacta o log removendo duplicatas e eventos antigos"""
+        """
+        Compacta o log removendo duplicatas e eventos antigos
+        
+        Dias fora da retenção de eventos brutos viram rollups (roll_up_before); os demais
+        são processados em uma única passada, um dia por vez do mais recente para o mais
+        antigo: cada dia é lido, deduplicado e gravado em um segmento novo trocado
+        atomicamente. A gravação de eventos só espera a troca do dia em processamento,
+        nunca a compactação inteira. Não há limite de eventos mantidos.
+        """
         try:
-            with open(self.file_path, 'r') as f:
-                data = json.load(f)
-            
-            original_count = len(data)
-            print(f"Iniciando compactação: {original_count} eventos")
-            
-            # 1. Remover eventos mais antigos que 30 dias
-            cutoff_date = datetime.now() - timedelta(days=30)
-            recent_events = []
-            
-            for event in data:
-                try:
-                    timestamp_str = event['timestamp']
-                    if 'Z' in timestamp_str:
-                        timestamp_str = timestamp_str.replace('Z', '+00:00')
-                    
-                    event_time = datetime.fromisoformat(timestamp_str)
-                    if event_time.tzinfo is not None:
-                        event_time = event_time.replace(tzinfo=None)
-                    
-                    if event_time >= cutoff_date:
-                        recent_events.append(event)
-                except Exception as e:
-                    print(f"Erro ao processar timestamp: {e}")
-                    continue
-            
-            # 2. Remover duplicatas em múltiplos níveis
-            unique_events = {}
-            
-            # Primeiro passo: remover duplicatas exatas no mesmo minuto
-            for event in recent_events:
-                try:
-                    timestamp_str = event['timestamp']
-                    if 'Z' in timestamp_str:
-                        timestamp_str = timestamp_str.replace('Z', '+00:00')
-                    event_time = datetime.fromisoformat(timestamp_str)
-                    minute_key = event_time.replace(second=0, microsecond=0)
-                    
-                    # Chave para duplicatas no mesmo minuto
-                    key = f"{event.get('event', '')}_{event.get('page', '')}_{event.get('session_id', '')}_{minute_key}"
-                    
-                    # Manter apenas o evento mais recente para cada chave
-                    if key not in unique_events or event['timestamp'] > unique_events[key]['timestamp']:
-                        unique_events[key] = event
-                except:
-                    continue
-            
-            minute_deduplicated = list(unique_events.values())
-            
-            # Segundo passo: remover duplicatas de eventos frequentes da mesma sessão (relaxar critério temporal)
-            session_events = {}
-            for event in minute_deduplicated:
-                try:
-                    session_id = event.get('session_id', '')
-                    event_type = event.get('event', '')
-                    page = event.get('page', '')
-                    
-                    # Para eventos de performance_metrics, permitir apenas 1 por sessão por página
-                    if event_type == 'performance_metrics':
-                        session_key = f"{event_type}_{page}_{session_id}"
-                        if session_key not in session_events or event['timestamp'] > session_events[session_key]['timestamp']:
-                            session_events[session_key] = event
-                    # Para outros eventos, usar a deduplicação por minuto
-                    else:
-                        timestamp_str = event['timestamp']
-                        if 'Z' in timestamp_str:
-                            timestamp_str = timestamp_str.replace('Z', '+00:00')
-                        event_time = datetime.fromisoformat(timestamp_str)
-                        minute_key = event_time.replace(second=0, microsecond=0)
-                        
-                        session_key = f"{event_type}_{page}_{session_id}_{minute_key}"
-                        session_events[session_key] = event
-                except:
-                    continue
-            
-            deduplicated_events = list(session_events.values())
-            
-            # 3. Filtrar eventos irrelevantes ou muito frequentes - RESTAURADO: manter eventos do sistema
-            filtered_events = []
-            for event in deduplicated_events:
-                event_type = event.get('event', '')
-                
-                # RESTAURADO: Manter todos os eventos importantes do sistema
-                if event_type in ['page_view', 'button_click', 'form_submission', 'report_generated', 
-                                'help_clicked', 'pdf_download', 'corte_generated', 'performance_metrics']:
-                    filtered_events.append(event)
-            
-            # 4. Limitar a 300 eventos mais recentes
-            filtered_events.sort(key=lambda x: x['timestamp'], reverse=True)
-            final_events = filtered_events[:300]
-            
-            # Salvar dados compactados
-            with open(self.file_path, 'w') as f:
-                json.dump(final_events, f, indent=2)
+            final_count = 0
+            print(f"Iniciando compactação: {self.event_count} eventos")
+            
+            # 1. Tirar do log os dias fora da retenção, preservando suas métricas em rollups
+            cutoff_day = self._raw_cutoff_day()
+            cutoff_ms = timestamp_ms(cutoff_day)
+            original_count = self.roll_up_before(cutoff_day)
+            
+            for day in reversed(self.log.days()):
+                with self.log.write_lock():
+                    events = list(self.log.iter_events(day, day))
+                    normalized = all(isinstance(e.get('ts'), int) for e in events)
+                    compacted = self._compact_events(events, cutoff_ms)
+                    original_count += len(events)
+                    final_count += len(compacted)
+                    if len(compacted) == len(events) and normalized:
+                        # Dia já compactado: não reescrever
+                        continue
+                    self.log.replace_day(day, compacted)
+                    self.event_count += len(compacted) - len(events)
             
-            final_count = len(final_events)
+            self.aggregates.sync()
             removed_count = original_count - final_count
             
             result = {
@@ -546,9 +470,41 @@ class AnalyticsStorage:
                 "compression_ratio": "0%"
             }
     
-    def _analyze_compaction_needs(self, data: list, file_size: int) -> dict:
+    @staticmethod
+    def _compact_events(events: list, cutoff_ms: int) -> list:
+        """Eventos de um dia depois da compactação, em ordem cronológica"""
+        unique_events = {}
+        for event in events:
+            ts = ts_do_evento(event)
+            if ts is None:
+                print(f"Erro ao processar timestamp {event.get('timestamp', 'N/A')}")
+                continue
+            event['ts'] = ts
+            if ts < cutoff_ms:
+                continue
+            
+            # 3. Filtrar eventos irrelevantes ou muito frequentes - manter eventos do sistema
+            event_type = event.get('event', '')
+            if event_type not in COMPACTED_EVENT_TYPES:
+                continue
+            
+            # 2. Remover duplicatas: performance_metrics apenas 1 por sessão por página,
+            # demais eventos 1 por sessão, página e minuto (o mais recente de cada chave)
+            page = event.get('page', '')
+            session_id = event.get('session_id', '')
+            if event_type == 'performance_metrics':
+                key = (event_type, page, session_id)
+            else:
+                key = (event_type, page, session_id, ts // MS_POR_MINUTO)
+            if key not in unique_events or ts > unique_events[key]['ts']:
+                unique_events[key] = event
+        
+        return sorted(unique_events.values(), key=lambda x: x['ts'])
+    
+    def _analyze_compaction_needs(self, profile: dict, file_size: int) -> dict:
         """Análise inteligente da necessidade de compactação baseada em padrões reais"""
-        if not data:
+        total_events = profile["total_events"]
+        if not total_events:
             return {
                 "needs_compaction": False,
                 "compaction_score": 0,
@@ -559,122 +515,49 @@ class AnalyticsStorage:
         compaction_score = 0
         reasons = []
         
-        # 1. Análise de densidade temporal (eventos muito próximos no tempo)
-        duplicate_groups = 0
-        time_buckets = {}  # Agrupar eventos por minutos
-        
-        for event in data:
-            try:
-                timestamp_str = event['timestamp']
-                if 'Z' in timestamp_str:
-                    timestamp_str = timestamp_str.replace('Z', '+00:00')
-                
-                event_time = datetime.fromisoformat(timestamp_str)
-                minute_key = event_time.replace(second=0, microsecond=0).isoformat()
-                session_id = event.get('session_id', '')
-                event_type = event.get('event', '')
-                
-                bucket_key = f"{minute_key}_{session_id}_{event_type}"
-                time_buckets[bucket_key] = time_buckets.get(bucket_key, 0) + 1
-            except:
-                continue
-        
-        # Contar grupos com muitos eventos no mesmo minuto
-        high_density_buckets = sum(1 for count in time_buckets.values() if count > 3)
+        # 1. Análise de densidade temporal (eventos muito próximos no tempo):
+        # grupos por (minuto, sessão, tipo) com muitos eventos no mesmo minuto
+        time_buckets = profile["time_buckets"]
+        high_density_buckets = profile["high_density_buckets"]
         if high_density_buckets > 0:
-            density_ratio = high_density_buckets / len(time_buckets) if time_buckets else 0
+            density_ratio = high_density_buckets / time_buckets if time_buckets else 0
             if density_ratio > 0.1:  # Mais de 10% dos buckets têm alta densidade
                 compaction_score += 30
                 reasons.append(f"Alta densidade temporal: {high_density_buckets} grupos com eventos repetitivos")
         
-        # 2. Análise de idade dos dados
-        now = datetime.now()
-        old_events = 0
-        
-        for event in data:
-            try:
-                timestamp_str = event['timestamp']
-                if 'Z' in timestamp_str:
-                    timestamp_str = timestamp_str.replace('Z', '+00:00')
-                
-                event_time = datetime.fromisoformat(timestamp_str)
-                if event_time.tzinfo:
-                    event_time = event_time.replace(tzinfo=None)
-                
-                age_days = (now - event_time).days
-                if age_days > 30:
-                    old_events += 1
-            except:
-                continue
-        
+        # 2. Análise de idade dos dados (fora da retenção de eventos brutos: viram rollups)
+        old_events = profile["old_events"]
         if old_events > 0:
-            old_ratio = old_events / len(data)
+            old_ratio = old_events / total_events
             if old_ratio > 0.2:  # Mais de 20% são eventos antigos
                 compaction_score += 25
-                reasons.append(f"Dados antigos: {old_events} eventos com mais de 30 dias ({old_ratio:.1%})")
+                reasons.append(f"Dados antigos: {old_events} eventos com mais de {ANALYTICS_RAW_RETENTION_DAYS} dias ({old_ratio:.1%})")
         
         # 3. Análise de eventos redundantes/desnecessários
-        event_types = {}
-        for event in data:
-            event_type = event.get('event', 'unknown')
-            event_types[event_type] = event_types.get(event_type, 0) + 1
+        event_types = profile["event_types"]
         
         # Identificar tipos de eventos com muito volume mas baixo valor
         low_value_events = ['heartbeat', 'mouse_move', 'scroll', 'focus', 'blur']
         redundant_count = sum(event_types.get(evt_type, 0) for evt_type in low_value_events)
         
         if redundant_count > 0:
-            redundant_ratio = redundant_count / len(data)
+            redundant_ratio = redundant_count / total_events
             if redundant_ratio > 0.3:  # Mais de 30% são eventos de baixo valor
                 compaction_score += 20
                 reasons.append(f"Eventos redundantes: {redundant_count} eventos de baixo valor ({redundant_ratio:.1%})")
         
         # 4. Análise de crescimento do arquivo
-        avg_event_size = file_size / len(data) if len(data) > 0 else 0
+        avg_event_size = file_size / total_events
         if file_size > 50000:  # 50KB
             size_score = min(25, (file_size - 50000) / 2000)  # Gradual até 100KB
             compaction_score += size_score
             reasons.append(f"Tamanho do arquivo: {file_size/1024:.1f}KB (média {avg_event_size:.0f} bytes/evento)")
         
-        # 5. Análise de duplicatas em múltiplos níveis
-        
-        # 5a. Duplicatas temporais (mesmo minuto) - removidas pela compactação
-        temporal_duplicates = 0
-        temporal_patterns = set()
-        
-        # 5b. Duplicatas de sessão (eventos repetitivos da mesma sessão) - parcialmente removidas
-        session_duplicates = 0
-        session_patterns = set()
-        
-        for event in data:
-            try:
-                # Análise temporal (mesmo minuto)
-                timestamp_str = event['timestamp']
-                if 'Z' in timestamp_str:
-                    timestamp_str = timestamp_str.replace('Z', '+00:00')
-                
-                event_time = datetime.fromisoformat(timestamp_str)
-                minute_key = event_time.replace(second=0, microsecond=0).isoformat()
-                
-                temporal_pattern = f"{event.get('event', '')}_{event.get('page', '')}_{event.get('session_id', '')}_{minute_key}"
-                if temporal_pattern in temporal_patterns:
-                    temporal_duplicates += 1
-                temporal_patterns.add(temporal_pattern)
-                
-                # Análise de sessão (eventos repetitivos, especialmente performance_metrics)
-                event_type = event.get('event', '')
-                if event_type == 'performance_metrics':
-                    session_pattern = f"{event_type}_{event.get('page', '')}_{event.get('session_id', '')}"
-                    if session_pattern in session_patterns:
-                        session_duplicates += 1
-                    session_patterns.add(session_pattern)
-                
-            except:
-                # Fallback para padrão sem tempo se houver erro de parsing
-                fallback_pattern = f"{event.get('event', '')}_{event.get('page', '')}_{event.get('session_id', '')}"
-                if fallback_pattern in temporal_patterns:
-                    temporal_duplicates += 1
-                temporal_patterns.add(fallback_pattern)
+        # 5. Análise de duplicatas em múltiplos níveis:
+        # 5a. duplicatas temporais (mesmo minuto) - removidas pela compactação
+        # 5b. duplicatas de sessão (performance_metrics repetidos na sessão) - parcialmente removidas
+        temporal_duplicates = profile["temporal_duplicates"]
+        session_duplicates = profile["session_duplicates"]
         
         # Calcular total de duplicatas removíveis
         total_duplicates = temporal_duplicates + session_duplicates
@@ -683,13 +566,10 @@ class AnalyticsStorage:
             compaction_score += min(15, temporal_duplicates * 0.3)
             reasons.append(f"Duplicatas temporais: {temporal_duplicates} eventos no mesmo minuto")
         
-        if session_duplicates > len(data) * 0.1:  # Mais de 10% de duplicatas de performance
+        if session_duplicates > total_events * 0.1:  # Mais de 10% de duplicatas de performance
             compaction_score += min(10, session_duplicates * 0.2)
             reasons.append(f"Eventos de performance repetitivos: {session_duplicates} na mesma sessão")
         
-        # Usar total de duplicatas para estimativa
-        potential_duplicates = total_duplicates
-        
         # Calcular redução estimada
         estimated_reduction = min(80, compaction_score)  # Máximo 80% de redução
         
@@ -702,15 +582,15 @@ class AnalyticsStorage:
             "reasons": reasons,
             "estimated_reduction": f"{estimated_reduction:.0f}%",
             "analysis_details": {
-                "total_events": len(data),
+                "total_events": total_events,
                 "file_size_kb": round(file_size / 1024, 2),
                 "avg_event_size": round(avg_event_size, 0),
                 "old_events": old_events,
                 "redundant_events": redundant_count,
                 "temporal_duplicates": temporal_duplicates,
                 "session_duplicates": session_duplicates,
-                "total_duplicates": potential_duplicates,
-                "time_buckets": len(time_buckets),
+                "total_duplicates": total_duplicates,
+                "time_buckets": time_buckets,
                 "high_density_buckets": high_density_buckets
             }
         }
@@ -718,52 +598,29 @@ class AnalyticsStorage:
     def get_log_info(self) -> dict:
         """Retorna informações sobre o estado atual do log com análise inteligente de compactação"""
         try:
-            # Informações do arquivo
-            file_size = os.path.getsize(self.file_path) if os.path.exists(self.file_path) else 0
-            
-            with open(self.file_path, 'r') as f:
-                data = json.load(f)
-            
-            event_count = len(data)
-            
-            # Analisar tipos de eventos
-            event_types = {}
-            oldest_event = None
-            newest_event = None
-            
-            for event in data:
-                event_type = event.get('event', 'unknown')
-                event_types[event_type] = event_types.get(event_type, 0) + 1
-                
-                try:
-                    timestamp_str = event['timestamp']
-                    if 'Z' in timestamp_str:
-                        timestamp_str = timestamp_str.replace('Z', '+00:00')
-                    
-                    event_time = datetime.fromisoformat(timestamp_str)
-                    
-                    if oldest_event is None or event_time < oldest_event:
-                        oldest_event = event_time
-                    if newest_event is None or event_time > newest_event:
-                        newest_event = event_time
-                except:
-                    continue
+            # Informações do log: contagens em uma passada pelos eventos (JSONL) ou
+            # agregações SQL (SQLite), sem carregar o histórico em memória
+            file_size = self.log.size_bytes()
+            old_cutoff_ms = timestamp_ms(self._raw_cutoff_day()) - 1
+            profile = self.log.compaction_profile(old_cutoff_ms)
+            oldest_event = profile["oldest_ts"]
+            newest_event = profile["newest_ts"]
             
             # Análise inteligente de compactação
-            compaction_analysis = self._analyze_compaction_needs(data, file_size)
+            compaction_analysis = self._analyze_compaction_needs(profile, file_size)
             
             return {
                 "file_size_bytes": file_size,
                 "file_size_kb": round(file_size / 1024, 2),
-                "event_count": event_count,
-                "event_types": event_types,
-                "oldest_event": oldest_event.isoformat() if oldest_event else None,
-                "newest_event": newest_event.isoformat() if newest_event else None,
+                "event_count": profile["total_events"],
+                "event_types": profile["event_types"],
+                "oldest_event": datetime_de_ts(oldest_event).isoformat() if oldest_event is not None else None,
+                "newest_event": datetime_de_ts(newest_event).isoformat() if newest_event is not None else None,
                 "needs_compaction": compaction_analysis["needs_compaction"],
                 "compaction_score": compaction_analysis["compaction_score"],
                 "compaction_reasons": compaction_analysis["reasons"],
                 "estimated_reduction": compaction_analysis["estimated_reduction"],
-                "analysis_details": compaction_analysis["analysis_details"]
+                "analysis_details": compaction_analysis.get("analysis_details", {})
             }
             
         except Exception as e:
@@ -779,25 +636,76 @@ class AnalyticsStorage:
                 "error": str(e)
             }
     
+    def replace_all_events(self, events: Iterable[dict], allow_empty: bool = True,
+                           backup: bool = False) -> Tuple[int, Optional[str]]:
+        """
+        Substitui todo o histórico (importação de backup)
+        
+        `events` pode ser um fluxo (leitura do arquivo enviado): os eventos são gravados
+        em lotes em uma área temporária do log e trocados de uma vez no final. Com
+        allow_empty=False, um fluxo sem eventos gera ValueError e nada é alterado.
+        
+        O write_lock só é mantido durante a troca, não durante a leitura e validação do
+        fluxo: a ingestão dos outros workers continua enquanto o arquivo é processado.
+        Com `backup`, o histórico atual é copiado sob o mesmo lock, logo antes da troca:
+        nenhum evento gravado no meio fica fora da cópia, e uma importação rejeitada não
+        deixa backup. Retorna (eventos gravados, diretório do backup ou None).
+        """
+        days = set()
+        backup_path = None
+        
+        def antes_da_troca():
+            nonlocal backup_path
+            # Histórico vazio não precisa de backup
+            if backup and (self.log.segments() or self.rollups.days()):
+                backup_path = self.backup()
+        
+        def depois_da_troca():
+            # Dias importados voltam a ser eventos brutos: seus rollups seriam contados em dobro
+            self.rollups.remove_days(days)
+        
+        def registrar_dias(eventos):
+            for event in eventos:
+                days.add(dia_do_evento(normalizar_evento(event)))
+                yield event
+        
+        self.event_count = self.log.rewrite(registrar_dias(events), allow_empty,
+                                            before_swap=antes_da_troca, after_swap=depois_da_troca)
+        self.aggregates.rebuild()
+        return self.event_count, backup_path
+    
+    def export_gzip(self, start_day: Optional[str] = None, end_day: Optional[str] = None) -> Iterator[bytes]:
+        """
+        Eventos dos dias [start_day, end_day] (todos, por padrão) em NDJSON com gzip, em blocos
+        
+        Um membro gzip por dia: segmentos já comprimidos são enviados como estão, sem
+        descomprimir, e os demais são comprimidos à medida que são lidos.
+        """
+        for day in self.log.days():
+            if (start_day is not None or end_day is not None) and not day[:1].isdigit():
+                continue
+            if (start_day is not None and day < start_day) or (end_day is not None and day > end_day):
+                continue
+            yield from self.log.export_gzip(day)
+    
+    def backup(self) -> str:
+        """Copia o log atual e os rollups para analytics_data_backup_<data>/ ao lado do diretório de dados"""
+        name = f"{os.path.basename(os.path.normpath(self.log.directory))}_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        destination = os.path.join(os.path.dirname(os.path.abspath(self.log.directory)), name)
+        self.log.backup(destination)
+        self.rollups.backup(destination)
+        return destination
+    
     def _is_today(self, timestamp_str: str) -> bool:
         """Verifica se um timestamp é de hoje"""
-        try:
-            if 'Z' in timestamp_str:
-                timestamp_str = timestamp_str.replace('Z', '+00:00')
-            
-            event_time = datetime.fromisoformat(timestamp_str)
-            if event_time.tzinfo is not None:
-                event_time = event_time.replace(tzinfo=None)
-            
-            today = datetime.now().date()
-            return event_time.date() == today
-        except:
-            return False
+        ts = timestamp_ms(timestamp_str)
+        return ts is not None and datetime_de_ts(ts).date() == datetime.now().date()
     
-    def should_auto_compact(self) -> bool:
+    def should_auto_compact(self, log_info: Optional[dict] = None) -> bool:
         """Determina se deve executar compactação automática baseado em critérios inteligentes"""
         try:
-            log_info = self.get_log_info()
+            if log_info is None:
+                log_info = self.get_log_info()
             
             # Auto-compactação apenas se score for muito alto (>80) para evitar operações desnecessárias
             return log_info.get("compaction_score", 0) > 80
@@ -809,11 +717,13 @@ class AnalyticsStorage:
     def auto_compact_if_needed(self) -> dict:
         """Executa compactação automática se necessário"""
         try:
-            if not self.should_auto_compact():
+            # Uma única análise do log (percorre o histórico) para decidir e informar o score
+            log_info = self.get_log_info()
+            if not self.should_auto_compact(log_info):
                 return {
                     "performed": False,
                     "reason": "Compactação não necessária",
-                    "score": self.get_log_info().get("compaction_score", 0)
+                    "score": log_info.get("compaction_score", 0)
                 }
             
             print("Executando compactação automática...")
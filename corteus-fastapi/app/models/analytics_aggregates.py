@@ -0,0 +1,652 @@
+import base64
+import gzip
+import hashlib
+import math
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from typing import Dict, Iterable, List, Optional
+
+from app.models.analytics_log import (
+    AnalyticsLog, dia_de_ts, dia_do_segmento, hora_de_ts, segmento_comprimido, ts_do_evento
+)
+
+# Contagem de únicos: exata até LIMITE_EXATO elementos, depois HyperLogLog com 2^PRECISAO_HLL
+# registradores (erro padrão ~1,6%), para os agregados não crescerem com o número de usuários
+LIMITE_EXATO = 512
+PRECISAO_HLL = 12
+
+# Intervalo mínimo entre gravações de aggregates.json; o estado inclui até onde cada
+# segmento foi lido, então perder as últimas atualizações só faz reler o final do log
+INTERVALO_PERSISTENCIA = 10  # segundos
+
+ARQUIVO_AGREGADOS = "aggregates.json"
+FORMATO_AGREGADOS = 2
+
+# Rollups: agregados diários dos dias cujos eventos brutos já saíram da retenção,
+# um arquivo por mês (rollups/2024-05.json) no diretório de dados
+DIRETORIO_ROLLUPS = "rollups"
+FORMATO_ROLLUPS = 1
+
+# Capacidade dos contadores top-k (Space-Saving) na agregação em streaming de períodos avulsos:
+# os 5 primeiros exibidos saem exatos enquanto as chaves mais frequentes couberem aqui
+CAPACIDADE_TOP_K = 100
+
+# Tipos de evento contados separadamente no dashboard
+EVENTOS_INTERACAO = ("button_click", "form_submission", "help_clicked")
+
+
+def _hash64(valor: str) -> int:
+    return int.from_bytes(hashlib.blake2b(valor.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class UniqueCounter:
+    """
+    Contador de elementos únicos mesclável (usuários, sessões)
+
+    Guarda os hashes exatos enquanto são poucos e passa para HyperLogLog quando
+    ultrapassa LIMITE_EXATO; a união de dois contadores é a união dos conjuntos ou
+    o máximo registrador a registrador.
+    """
+
+    __slots__ = ("hashes", "registers")
+
+    def __init__(self):
+        self.hashes: Optional[set] = set()
+        self.registers: Optional[bytearray] = None
+
+    def add(self, valor: str):
+        self._add_hash(_hash64(valor))
+
+    def _add_hash(self, h: int):
+        if self.hashes is not None:
+            self.hashes.add(h)
+            if len(self.hashes) > LIMITE_EXATO:
+                self._to_hll()
+            return
+        indice = h >> (64 - PRECISAO_HLL)
+        resto = h & ((1 << (64 - PRECISAO_HLL)) - 1)
+        rank = (64 - PRECISAO_HLL) - resto.bit_length() + 1
+        if rank > self.registers[indice]:
+            self.registers[indice] = rank
+
+    def _to_hll(self):
+        hashes = self.hashes
+        self.hashes = None
+        self.registers = bytearray(1 << PRECISAO_HLL)
+        for h in hashes:
+            self._add_hash(h)
+
+    def merge(self, other: "UniqueCounter"):
+        if other.hashes is not None:
+            for h in other.hashes:
+                self._add_hash(h)
+            return
+        if self.hashes is not None:
+            self._to_hll()
+        self.registers = bytearray(max(a, b) for a, b in zip(self.registers, other.registers))
+
+    def count(self) -> int:
+        if self.hashes is not None:
+            return len(self.hashes)
+        m = len(self.registers)
+        estimativa = (0.7213 / (1 + 1.079 / m)) * m * m / sum(2.0 ** -r for r in self.registers)
+        vazios = self.registers.count(0)
+        if estimativa <= 2.5 * m and vazios:
+            # Correção para cardinalidades pequenas (contagem linear)
+            estimativa = m * math.log(m / vazios)
+        return int(round(estimativa))
+
+    def to_dict(self) -> dict:
+        if self.hashes is not None:
+            return {"h": sorted(self.hashes)}
+        return {"r": base64.b64encode(zlib.compress(bytes(self.registers))).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, dados: dict) -> "UniqueCounter":
+        contador = cls()
+        if "r" in dados:
+            contador.hashes = None
+            contador.registers = bytearray(zlib.decompress(base64.b64decode(dados["r"])))
+        else:
+            contador.hashes = set(dados.get("h", []))
+        return contador
+
+
+def _somar(destino: Dict, origem: Dict):
+    for chave, valor in origem.items():
+        destino[chave] = destino.get(chave, 0) + valor
+
+
+def _contar_top_k(contagens: Dict[str, int], chave: str, capacidade: Optional[int]):
+    """
+    Incrementa `chave`; com `capacidade`, mantém no máximo esse número de chaves (Space-Saving)
+
+    Cheio, uma chave nova substitui a de menor contagem e herda essa contagem + 1, o que
+    preserva as chaves frequentes com memória constante.
+    """
+    if chave in contagens or capacidade is None or len(contagens) < capacidade:
+        contagens[chave] = contagens.get(chave, 0) + 1
+        return
+    menor = min(contagens, key=contagens.get)
+    contagens[chave] = contagens.pop(menor) + 1
+
+
+def _texto(valor, padrao: str = "") -> str:
+    """Campo de texto de um evento: eventos importados ou de /track podem trazer null ou números"""
+    if valor is None:
+        return padrao
+    return valor if isinstance(valor, str) else str(valor)
+
+
+def _tipo_dispositivo(user_agent: str) -> str:
+    if 'mobile' in user_agent or 'android' in user_agent or 'iphone' in user_agent:
+        return 'Mobile'
+    if 'tablet' in user_agent or 'ipad' in user_agent:
+        return 'Tablet'
+    return 'Desktop'
+
+
+def _navegador(user_agent: str) -> str:
+    if 'chrome' in user_agent:
+        return 'Chrome'
+    if 'firefox' in user_agent:
+        return 'Firefox'
+    if 'safari' in user_agent:
+        return 'Safari'
+    return 'Other'
+
+
+class StatsAggregate:
+    """
+    Contadores de todas as métricas do dashboard para um conjunto de eventos
+
+    Atualizado evento a evento (add) e mesclável (merge): o dashboard de um período
+    é a soma dos agregados diários, sem reler os eventos. Com `capacidade_top`, páginas,
+    botões e resoluções ficam em contadores top-k de tamanho fixo, para agregar um
+    fluxo de eventos de qualquer tamanho com memória constante.
+    """
+
+    def __init__(self, capacidade_top: Optional[int] = None):
+        self.capacidade_top = capacidade_top
+        self.total_events = 0
+        self.event_types: Dict[str, int] = {}
+        self.pages: Dict[str, int] = {}
+        self.daily_views: Dict[str, int] = {}
+        self.hourly: Dict[str, int] = {}
+        self.buttons: Dict[str, int] = {}
+        self.resolutions: Dict[str, int] = {}
+        self.button_pdf_downloads = 0
+        self.button_report_generations = 0
+        self.time_on_page_total = 0.0
+        self.time_on_page_count = 0
+        self.users = UniqueCounter()
+        self.sessions = UniqueCounter()
+        self.devices: Dict[str, UniqueCounter] = {}
+        self.browsers: Dict[str, UniqueCounter] = {}
+
+    def add(self, event: dict):
+        event_type = _texto(event.get('event'))
+        self.total_events += 1
+        self.event_types[event_type] = self.event_types.get(event_type, 0) + 1
+
+        user_id = _texto(event.get('user_id'))
+        session_id = _texto(event.get('session_id'))
+        if user_id.strip():
+            self.users.add(user_id)
+        if session_id.strip():
+            self.sessions.add(session_id)
+
+        ts = ts_do_evento(event)
+        if ts is not None:
+            hora = str(hora_de_ts(ts))
+            self.hourly[hora] = self.hourly.get(hora, 0) + 1
+
+        resolution = _texto(event.get('screen_resolution'))
+        if resolution:
+            _contar_top_k(self.resolutions, resolution, self.capacidade_top)
+
+        user_agent = _texto(event.get('user_agent')).lower()
+        if user_id and user_agent:
+            self.devices.setdefault(_tipo_dispositivo(user_agent), UniqueCounter()).add(user_id)
+            self.browsers.setdefault(_navegador(user_agent), UniqueCounter()).add(user_id)
+
+        data = event.get('data')
+        if not isinstance(data, dict):
+            data = {}
+        if event_type == 'page_view':
+            page = _texto(event.get('page'), '/')
+            _contar_top_k(self.pages, page, self.capacidade_top)
+            if ts is not None:
+                dia = dia_de_ts(ts)
+                self.daily_views[dia] = self.daily_views.get(dia, 0) + 1
+        elif event_type == 'page_exit':
+            time_on_page = data.get('time_on_page')
+            if time_on_page and isinstance(time_on_page, (int, float)) and time_on_page > 0:
+                # Converter de milissegundos para segundos, ignorando outliers (mais de 1 hora)
+                time_in_seconds = time_on_page / 1000
+                if time_in_seconds <= 3600:
+                    self.time_on_page_total += time_in_seconds
+                    self.time_on_page_count += 1
+        elif event_type == 'button_click':
+            button_text = _texto(data.get('buttonText', data.get('button_text')), 'Unknown')
+            button_id = _texto(data.get('buttonId', data.get('button_id')))
+            texto = button_text.lower()
+            # Detectar downloads de PDF e relatórios gerados via cliques de botão
+            if 'download' in texto or 'baixar' in texto or 'pdf' in texto:
+                self.button_pdf_downloads += 1
+            if 'gerar' in texto or 'relatório' in texto or 'relatorio' in texto:
+                self.button_report_generations += 1
+            button_key = f"{button_text} ({button_id})" if button_id else button_text
+            _contar_top_k(self.buttons, button_key, self.capacidade_top)
+
+    def merge(self, other: "StatsAggregate"):
+        self.total_events += other.total_events
+        _somar(self.event_types, other.event_types)
+        _somar(self.pages, other.pages)
+        _somar(self.daily_views, other.daily_views)
+        _somar(self.hourly, other.hourly)
+        _somar(self.buttons, other.buttons)
+        _somar(self.resolutions, other.resolutions)
+        self.button_pdf_downloads += other.button_pdf_downloads
+        self.button_report_generations += other.button_report_generations
+        self.time_on_page_total += other.time_on_page_total
+        self.time_on_page_count += other.time_on_page_count
+        self.users.merge(other.users)
+        self.sessions.merge(other.sessions)
+        for destino, origem in ((self.devices, other.devices), (self.browsers, other.browsers)):
+            for nome, contador in origem.items():
+                destino.setdefault(nome, UniqueCounter()).merge(contador)
+
+    def trim_top(self, capacidade: int):
+        """Mantém só as `capacidade` chaves mais frequentes de páginas, botões e resoluções (rollups)"""
+        for campo in ("pages", "buttons", "resolutions"):
+            setattr(self, campo, dict(_top(getattr(self, campo), capacidade)))
+
+    def to_dict(self) -> dict:
+        return {
+            "total_events": self.total_events,
+            "event_types": self.event_types,
+            "pages": self.pages,
+            "daily_views": self.daily_views,
+            "hourly": self.hourly,
+            "buttons": self.buttons,
+            "resolutions": self.resolutions,
+            "button_pdf_downloads": self.button_pdf_downloads,
+            "button_report_generations": self.button_report_generations,
+            "time_on_page_total": self.time_on_page_total,
+            "time_on_page_count": self.time_on_page_count,
+            "users": self.users.to_dict(),
+            "sessions": self.sessions.to_dict(),
+            "devices": {nome: c.to_dict() for nome, c in self.devices.items()},
+            "browsers": {nome: c.to_dict() for nome, c in self.browsers.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, dados: dict) -> "StatsAggregate":
+        agregado = cls()
+        for campo in ("total_events", "event_types", "pages", "daily_views", "hourly", "buttons",
+                      "resolutions", "button_pdf_downloads", "button_report_generations",
+                      "time_on_page_total", "time_on_page_count"):
+            setattr(agregado, campo, dados[campo])
+        agregado.users = UniqueCounter.from_dict(dados["users"])
+        agregado.sessions = UniqueCounter.from_dict(dados["sessions"])
+        agregado.devices = {nome: UniqueCounter.from_dict(c) for nome, c in dados["devices"].items()}
+        agregado.browsers = {nome: UniqueCounter.from_dict(c) for nome, c in dados["browsers"].items()}
+        return agregado
+
+    def to_stats(self) -> dict:
+        """Resposta de /analytics-data (mesmo formato de AnalyticsStorage.get_stats)"""
+        if not self.total_events:
+            return empty_stats()
+
+        tipos = self.event_types
+        page_views = tipos.get('page_view', 0)
+        button_clicks = tipos.get('button_click', 0)
+        form_submissions = tipos.get('form_submission', 0)
+        help_clicks = tipos.get('help_clicked', 0)
+        corte_events = tipos.get('corte_generated', 0)
+        unique_users = self.users.count()
+        unique_sessions = self.sessions.count()
+
+        # Tempo médio na página (page_exit) ou estimativa a partir das page views
+        if self.time_on_page_count > 0:
+            avg_time_on_page = self.time_on_page_total / self.time_on_page_count
+        elif page_views:
+            avg_time_on_page = min(30, page_views * 2)
+        else:
+            avg_time_on_page = 0
+
+        hourly_activity = sorted((int(hora), count) for hora, count in self.hourly.items())
+
+        return {
+            "total_views": page_views,
+            "unique_users": unique_users,
+            "total_sessions": unique_sessions,
+            "top_pages": [{"page": page, "views": count} for page, count in _top(self.pages)],
+            "daily_views": [{"date": date, "views": count} for date, count in sorted(self.daily_views.items())],
+            "user_engagement": {
+                "avg_time_on_page": round(avg_time_on_page, 2),
+                "total_interactions": sum(tipos.get(t, 0) for t in EVENTOS_INTERACAO)
+            },
+            "performance_metrics": {
+                "total_events": self.total_events,
+                "events_per_user": round(self.total_events / unique_users, 2) if unique_users else 0,
+                "events_per_session": round(self.total_events / unique_sessions, 2) if unique_sessions else 0,
+                "active_sessions": unique_sessions,
+                "avg_sessions_per_user": round(unique_sessions / unique_users, 2) if unique_users else 0
+            },
+            "device_analytics": {
+                "devices": [{"type": nome, "count": c.count()} for nome, c in sorted(self.devices.items())],
+                "browsers": [{"browser": nome, "count": c.count()} for nome, c in sorted(self.browsers.items())],
+                "top_resolutions": [{"resolution": res, "count": count} for res, count in _top(self.resolutions)]
+            },
+            "time_analytics": {
+                "hourly_activity": [{"hour": hora, "activity": count} for hora, count in hourly_activity],
+                "peak_hour": max(hourly_activity, key=lambda item: item[1])[0] if hourly_activity else 0
+            },
+            "interaction_analytics": {
+                "top_buttons": [{"button": button, "clicks": count} for button, count in _top(self.buttons)],
+                "form_completions": form_submissions,
+                "help_clicks": help_clicks,
+                "pdf_downloads": tipos.get('pdf_download', 0) + self.button_pdf_downloads,
+                "report_generations": tipos.get('report_generated', 0) + self.button_report_generations + corte_events,
+                "corte_generations": corte_events,
+                "total_button_clicks": button_clicks
+            }
+        }
+
+
+def _top(contagens: Dict[str, int], quantidade: int = 5) -> List[tuple]:
+    # Empates em ordem alfabética, para o resultado não depender da ordem de mesclagem dos dias
+    return sorted(contagens.items(), key=lambda x: (-x[1], x[0]))[:quantidade]
+
+
+def empty_stats() -> dict:
+    """Estrutura completa do dashboard com valores padrão, para períodos sem eventos"""
+    return {
+        "total_views": 0,
+        "unique_users": 0,
+        "top_pages": [],
+        "daily_views": [],
+        "user_engagement": {
+            "avg_time_on_page": 0,
+            "total_interactions": 0
+        },
+        "performance_metrics": {
+            "total_events": 0,
+            "events_per_user": 0,
+            "active_sessions": 0,
+            "avg_sessions_per_user": 0
+        },
+        "device_analytics": {
+            "devices": [],
+            "browsers": [],
+            "top_resolutions": []
+        },
+        "time_analytics": {
+            "hourly_activity": [],
+            "peak_hour": 0
+        },
+        "interaction_analytics": {
+            "top_buttons": [],
+            "form_completions": 0,
+            "help_clicks": 0
+        }
+    }
+
+
+class DailyAggregates:
+    """
+    Agregados diários mantidos junto com o log (aggregates.json no diretório de dados)
+
+    Cada segmento guarda seu StatsAggregate e até onde já foi lido (inode e offset).
+    sync() lê apenas os bytes acrescentados desde a última vez; um segmento reescrito
+    (compactação, importação) tem outro inode e é reagregado do início, assim como um
+    .gz que mudou. Assim os agregados acompanham qualquer escrita no log, inclusive
+    as feitas antes de uma queda ou por outro processo.
+    """
+
+    def __init__(self, log: AnalyticsLog):
+        self.log = log
+        self.path = os.path.join(log.directory, ARQUIVO_AGREGADOS)
+        self.segments: Dict[str, StatsAggregate] = {}
+        self.offsets: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                dados = json.load(f)
+            if dados.get("formato") != FORMATO_AGREGADOS:
+                return
+            self.segments = {nome: StatsAggregate.from_dict(a) for nome, a in dados["segments"].items()}
+            self.offsets = dados["offsets"]
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            # Arquivo corrompido: os agregados são refeitos a partir do log no próximo sync
+            print(f"Agregados de analytics inválidos, recalculando: {e}")
+            self.segments, self.offsets = {}, {}
+
+    def save(self, force: bool = False):
+        """Grava aggregates.json (tmp + rename), no máximo a cada INTERVALO_PERSISTENCIA segundos"""
+        with self._lock:
+            if not self._dirty or (not force and time.time() - self._saved_at < INTERVALO_PERSISTENCIA):
+                return
+            dados = {
+                "formato": FORMATO_AGREGADOS,
+                "segments": {nome: a.to_dict() for nome, a in self.segments.items()},
+                "offsets": self.offsets,
+            }
+            self._dirty = False
+            self._saved_at = time.time()
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.log.directory, suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(dados, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"Não foi possível gravar os agregados de analytics: {e}")
+
+    def sync(self, days: Optional[Iterable[str]] = None):
+        """Incorpora ao agregado o que foi escrito no log desde o último sync (só em `days`, se informado)"""
+        with self._lock:
+            segmentos = {os.path.basename(path): path for path in self.log.segments()}
+            if days is None:
+                # Segmentos que sumiram (compressão, compactação, limpeza) deixam de contar
+                for nome in set(self.offsets) - set(segmentos):
+                    self.segments.pop(nome, None)
+                    self.offsets.pop(nome, None)
+                    self._dirty = True
+            else:
+                days = set(days)
+                segmentos = {nome: path for nome, path in segmentos.items() if dia_do_segmento(nome) in days}
+            for nome, path in segmentos.items():
+                self._sync_segment(nome, path)
+        self.save()
+
+    def _sync_segment(self, nome: str, path: str):
+        try:
+            info = os.stat(path)
+        except FileNotFoundError:
+            return
+        estado = self.offsets.get(nome)
+        if (estado is None or estado["ino"] != info.st_ino or info.st_size < estado["offset"]
+                or (segmento_comprimido(path) and info.st_size != estado["offset"])):
+            # Segmento novo ou reescrito: agregar do início
+            estado = {"ino": info.st_ino, "offset": 0}
+            self.segments[nome] = StatsAggregate()
+            self.offsets[nome] = estado
+            self._dirty = True
+        if info.st_size == estado["offset"]:
+            return
+
+        agregado = self.segments[nome]
+        if segmento_comprimido(path):
+            # Comprimido: lido inteiro, uma vez (não recebe appends)
+            with open(path, "rb") as f:
+                novos = gzip.decompress(f.read())
+            lido = info.st_size
+        else:
+            with open(path, "rb") as f:
+                f.seek(estado["offset"])
+                novos = f.read(info.st_size - estado["offset"])
+            # Só linhas completas: uma escrita em andamento é lida no próximo sync
+            novos = novos[:novos.rfind(b"\n") + 1]
+            lido = len(novos)
+        for linha in novos.splitlines():
+            if not linha.strip():
+                continue
+            try:
+                agregado.add(json.loads(linha))
+            except Exception:
+                # Linha corrompida ou evento em formato inesperado: pular, sem travar o offset
+                continue
+        estado["offset"] += lido
+        self._dirty = True
+
+    def aggregate(self, start_day: Optional[str] = None, end_day: Optional[str] = None) -> StatsAggregate:
+        """Soma dos agregados dos segmentos dos dias [start_day, end_day]"""
+        total = StatsAggregate()
+        with self._lock:
+            for nome, agregado in self.segments.items():
+                dia = dia_do_segmento(nome)
+                if (start_day is None or dia >= start_day) and (end_day is None or dia <= end_day):
+                    total.merge(agregado)
+        return total
+
+    def stats(self, start_day: Optional[str] = None, end_day: Optional[str] = None) -> dict:
+        """Estatísticas do dashboard para os dias [start_day, end_day], somando os agregados diários"""
+        return self.aggregate(start_day, end_day).to_stats()
+
+    def clear(self):
+        with self._lock:
+            self.segments, self.offsets = {}, {}
+            self._dirty = True
+        self.save(force=True)
+
+    def rebuild(self):
+        """Reagrega o log inteiro (depois de uma reescrita: compactação, corte, importação)"""
+        with self._lock:
+            self.segments, self.offsets = {}, {}
+        self.sync()
+        self.save(force=True)
+
+
+class AnalyticsRollups:
+    """
+    Rollups diários: o StatsAggregate de cada dia que já saiu da retenção de eventos brutos
+
+    Guardam todas as métricas do dashboard (inclusive a atividade por hora do dia) em
+    poucos KB por dia, então o histórico de anos continua consultável depois que os
+    eventos brutos são apagados. Cada mês fica em um arquivo JSON gravado com tmp +
+    os.replace; as gravações são feitas pelo chamador sob o write_lock do log, e os
+    meses lidos ficam em cache até o arquivo mudar (outro worker pode ter gravado).
+    """
+
+    def __init__(self, directory: str):
+        self.directory = os.path.join(directory, DIRETORIO_ROLLUPS)
+        os.makedirs(self.directory, exist_ok=True)
+        self._cache: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def _path(self, mes: str) -> str:
+        return os.path.join(self.directory, f"{mes}.json")
+
+    def months(self) -> List[str]:
+        return sorted(nome[:-len(".json")] for nome in os.listdir(self.directory) if nome.endswith(".json"))
+
+    def _load(self, mes: str) -> Dict[str, StatsAggregate]:
+        """Dias de um mês (cópia do cache: o chamador pode mesclar e alterar)"""
+        path = self._path(mes)
+        try:
+            info = os.stat(path)
+        except FileNotFoundError:
+            return {}
+        with self._lock:
+            versao, dias = self._cache.get(mes, (None, None))
+            if versao != (info.st_mtime_ns, info.st_size):
+                with open(path, "r", encoding="utf-8") as f:
+                    dados = json.load(f)
+                if dados.get("formato") != FORMATO_ROLLUPS:
+                    raise ValueError(f"{path}: formato de rollup não suportado")
+                dias = {dia: StatsAggregate.from_dict(a) for dia, a in dados["days"].items()}
+                self._cache[mes] = ((info.st_mtime_ns, info.st_size), dias)
+            return dict(dias)
+
+    def _save(self, mes: str, dias: Dict[str, StatsAggregate]):
+        path = self._path(mes)
+        if not dias:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"formato": FORMATO_ROLLUPS, "days": {dia: a.to_dict() for dia, a in sorted(dias.items())}},
+                          f, separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def add(self, day: str, aggregate: StatsAggregate):
+        """Acrescenta o agregado ao rollup do dia (somando, se o dia já tinha rollup: eventos atrasados)"""
+        dias = self._load(day[:7])
+        if day in dias:
+            mesclado = StatsAggregate.from_dict(dias[day].to_dict())
+            mesclado.merge(aggregate)
+            aggregate = mesclado
+        dias[day] = aggregate
+        self._save(day[:7], dias)
+
+    def days(self) -> List[str]:
+        return [dia for mes in self.months() for dia in sorted(self._load(mes))]
+
+    def aggregate(self, start_day: Optional[str] = None, end_day: Optional[str] = None) -> StatsAggregate:
+        """Soma dos rollups dos dias [start_day, end_day], lendo só os meses do período"""
+        total = StatsAggregate()
+        for mes in self.months():
+            if (start_day is not None and mes < start_day[:7]) or (end_day is not None and mes > end_day[:7]):
+                continue
+            for dia, agregado in self._load(mes).items():
+                if (start_day is None or dia >= start_day) and (end_day is None or dia <= end_day):
+                    total.merge(agregado)
+        return total
+
+    def remove_days(self, days: Iterable[str]) -> int:
+        """Remove os rollups dos dias informados, retornando quantos existiam"""
+        por_mes: Dict[str, set] = {}
+        for dia in days:
+            por_mes.setdefault(dia[:7], set()).add(dia)
+        removidos = 0
+        for mes, dias_mes in por_mes.items():
+            dias = self._load(mes)
+            antes = len(dias)
+            dias = {dia: a for dia, a in dias.items() if dia not in dias_mes}
+            if len(dias) != antes:
+                removidos += antes - len(dias)
+                self._save(mes, dias)
+        return removidos
+
+    def drop_before(self, day: str) -> int:
+        """Retenção dos rollups: remove os dias anteriores a `day`"""
+        return self.remove_days(dia for mes in self.months() if mes <= day[:7] for dia in self._load(mes) if dia < day)
+
+    def clear(self):
+        for mes in self.months():
+            os.remove(self._path(mes))
+
+    def backup(self, destino: str):
+        """Copia os rollups para `destino`/rollups"""
+        shutil.copytree(self.directory, os.path.join(destino, DIRETORIO_ROLLUPS), dirs_exist_ok=True)
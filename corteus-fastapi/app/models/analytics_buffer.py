@@ -0,0 +1,169 @@
+import asyncio
+import time
+from collections import deque
+from typing import List
+
+from decouple import config
+
+from app.models.analytics import AnalyticsEvent, AnalyticsStorage, analytics_storage
+
+# Fila de ingestão em memória (write-behind) de /track
+ANALYTICS_QUEUE_MAX = config("ANALYTICS_QUEUE_MAX", default=10000, cast=int)
+ANALYTICS_FLUSH_BATCH = config("ANALYTICS_FLUSH_BATCH", default=500, cast=int)
+ANALYTICS_FLUSH_INTERVAL = config("ANALYTICS_FLUSH_INTERVAL", default=1.0, cast=float)  # segundos
+# Fila cheia: "drop_oldest" descarta o evento mais antigo, "drop_newest" descarta o recebido,
+# "reject" recusa o evento para o endpoint responder 503 (o cliente pode tentar depois)
+ANALYTICS_QUEUE_FULL_POLICY = config("ANALYTICS_QUEUE_FULL_POLICY", default="drop_oldest")
+POLITICAS_FILA_CHEIA = ("drop_oldest", "drop_newest", "reject")
+
+
+class AnalyticsIngestBuffer:
+    """
+    Buffer write-behind: os endpoints enfileiram eventos e respondem na hora, e uma
+    tarefa em segundo plano grava os eventos em lote no AnalyticsStorage
+
+    O lote é gravado quando a fila chega a `batch_size` eventos ou a cada `flush_interval`
+    segundos, o que vier primeiro. A fila tem tamanho máximo; quando enche, a política
+    configurada decide se o evento mais antigo ou o recebido é descartado, ou se o
+    evento é recusado. Enfileirar e retirar lotes acontece só no event loop; apenas
+    a gravação roda em outra thread.
+    """
+
+    def __init__(self, storage: AnalyticsStorage, max_size: int = ANALYTICS_QUEUE_MAX,
+                 batch_size: int = ANALYTICS_FLUSH_BATCH, flush_interval: float = ANALYTICS_FLUSH_INTERVAL,
+                 full_policy: str = ANALYTICS_QUEUE_FULL_POLICY):
+        if full_policy not in POLITICAS_FILA_CHEIA:
+            raise ValueError(f"ANALYTICS_QUEUE_FULL_POLICY inválida: {full_policy!r}")
+        self.storage = storage
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.full_policy = full_policy
+        self.queue: deque = deque()
+        self._wake = None
+        self._flushing = None
+
+        # Métricas
+        self.enqueued = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.flush_count = 0
+        self.flush_errors = 0
+        self.max_depth = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    def enqueue(self, event: AnalyticsEvent) -> bool:
+        """Coloca um evento na fila; retorna False se ele foi descartado ou recusado"""
+        if len(self.queue) >= self.max_size:
+            if self.full_policy == "drop_oldest":
+                self.queue.popleft()
+                self.dropped += 1
+            elif self.full_policy == "drop_newest":
+                self.dropped += 1
+                return False
+            else:
+                self.rejected += 1
+                return False
+
+        self.queue.append(event)
+        self.enqueued += 1
+        self.max_depth = max(self.max_depth, len(self.queue))
+        if len(self.queue) >= self.batch_size and self._wake is not None:
+            # Lote completo: não esperar o intervalo
+            self._wake.set()
+        return True
+
+    def enqueue_many(self, events: List[AnalyticsEvent]) -> int:
+        """
+        Enfileira um lote inteiro, que vai para a mesma gravação se couber em um flush
+
+        Com a política "reject" o lote é aceito ou recusado por inteiro. Retorna quantos
+        eventos entraram na fila.
+        """
+        if self.full_policy == "reject" and len(self.queue) + len(events) > self.max_size:
+            self.rejected += len(events)
+            return 0
+        return sum(1 for event in events if self.enqueue(event))
+
+    async def run(self):
+        """Tarefa em segundo plano: grava lotes por tamanho ou intervalo até ser cancelada"""
+        self._wake = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            while self.queue:
+                try:
+                    await self.flush()
+                except Exception:
+                    # Lote devolvido à fila: tentar de novo no próximo intervalo
+                    break
+                if len(self.queue) < self.batch_size:
+                    break
+
+    async def flush(self):
+        """Retira um lote da fila e grava fora do event loop"""
+        if self._flushing is not None and not self._flushing.done():
+            # Gravação anterior ainda na thread (ex.: tarefa cancelada no shutdown): esperar por ela
+            await asyncio.wait([self._flushing])
+        batch: List[AnalyticsEvent] = [self.queue.popleft() for _ in range(min(self.batch_size, len(self.queue)))]
+        if not batch:
+            return
+
+        inicio = time.perf_counter()
+        gravacao = asyncio.ensure_future(asyncio.to_thread(self.storage.save_events, batch))
+        self._flushing = gravacao
+        try:
+            # shield: cancelar a tarefa não interrompe a gravação já iniciada na thread
+            await asyncio.shield(gravacao)
+            self.flushed += len(batch)
+        except Exception as e:
+            self.flush_errors += 1
+            print(f"Erro ao gravar lote de analytics ({len(batch)} eventos): {e}")
+            # Devolver o lote ao início da fila para a próxima tentativa, se couber
+            espaco = self.max_size - len(self.queue)
+            self.queue.extendleft(reversed(batch[:espaco]))
+            self.dropped += max(0, len(batch) - espaco)
+            raise
+        finally:
+            duracao_ms = (time.perf_counter() - inicio) * 1000
+            self.flush_count += 1
+            self.last_flush_ms = duracao_ms
+            self.max_flush_ms = max(self.max_flush_ms, duracao_ms)
+            self._total_flush_ms += duracao_ms
+
+    async def drain(self):
+        """Grava tudo que estiver na fila (usado no shutdown)"""
+        if self._flushing is not None and not self._flushing.done():
+            await asyncio.wait([self._flushing])
+        while self.queue:
+            try:
+                await self.flush()
+            except Exception:
+                break
+
+    def stats(self) -> dict:
+        return {
+            "depth": len(self.queue),
+            "max_depth": self.max_depth,
+            "max_size": self.max_size,
+            "full_policy": self.full_policy,
+            "enqueued": self.enqueued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "flush_count": self.flush_count,
+            "flush_errors": self.flush_errors,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "avg_flush_ms": round(self._total_flush_ms / self.flush_count, 2) if self.flush_count else 0
+        }
+
+
+# Instância global do buffer de ingestão
+analytics_buffer = AnalyticsIngestBuffer(analytics_storage)
@@ -0,0 +1,654 @@
+import gzip
+import io
+import itertools
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: sem flock, as gravações são serializadas só entre as threads do processo
+    fcntl = None
+
+# Segmentos do log: um arquivo JSONL por dia do evento (events-2024-05-31.jsonl); dias
+# antigos são comprimidos no lugar (events-2024-05-31.jsonl.gz)
+PREFIXO_SEGMENTO = "events-"
+EXTENSAO_SEGMENTO = ".jsonl"
+EXTENSAO_COMPRIMIDA = ".jsonl.gz"
+
+# Arquivos de lock (flock) compartilhados pelos workers que usam o mesmo diretório
+ARQUIVO_LOCK_ESCRITA = ".write.lock"
+ARQUIVO_LOCK_MANUTENCAO = ".maintenance.lock"
+
+# Versão dos dados (contador em texto de largura fixa), compartilhada pelos workers
+ARQUIVO_VERSAO = ".version"
+LARGURA_VERSAO = 20
+
+# Quando chamar fsync nos appends: "always" (a cada gravação), "interval" (no máximo a
+# cada `fsync_interval` segundos) ou "never" (fica a cargo do sistema operacional).
+# Arquivos trocados por os.replace recebem fsync antes da troca, exceto com "never".
+POLITICAS_FSYNC = ("always", "interval", "never")
+
+# Leitura de backups e reescritas: caracteres lidos por vez e eventos gravados por lote
+TAMANHO_BLOCO_LEITURA = 1024 * 1024
+# Maior item aceito em uma lista JSON de backup (um evento passa longe disso)
+TAMANHO_MAXIMO_ITEM = 8 * TAMANHO_BLOCO_LEITURA
+TAMANHO_LOTE_GRAVACAO = 10000
+
+# Timestamps normalizados: cada evento guarda em "ts" os milissegundos desde 1970 do seu
+# horário local (o mesmo horário de parede do "timestamp", sem fuso), calculados uma vez
+# na ingestão; filtros, agrupamentos e ordenações comparam inteiros
+MS_POR_MINUTO = 60 * 1000
+MS_POR_HORA = 60 * MS_POR_MINUTO
+MS_POR_DIA = 24 * MS_POR_HORA
+_EPOCA = datetime(1970, 1, 1)
+
+
+def timestamp_ms(valor) -> Optional[int]:
+    """Milissegundos de um datetime ou texto ISO (o fuso, se houver, é descartado); None se inválido"""
+    try:
+        if isinstance(valor, str):
+            valor = datetime.fromisoformat(valor.replace("Z", "+00:00"))
+        if not isinstance(valor, datetime):
+            return None
+        return (valor.replace(tzinfo=None) - _EPOCA) // timedelta(milliseconds=1)
+    except ValueError:
+        return None
+
+
+def datetime_de_ts(ts: int) -> datetime:
+    return _EPOCA + timedelta(milliseconds=ts)
+
+
+@lru_cache(maxsize=4096)
+def _dia_do_numero(numero: int) -> str:
+    return (_EPOCA + timedelta(days=numero)).date().isoformat()
+
+
+def dia_de_ts(ts: int) -> str:
+    """Dia (YYYY-MM-DD) de um timestamp em milissegundos"""
+    return _dia_do_numero(ts // MS_POR_DIA)
+
+
+def hora_de_ts(ts: int) -> int:
+    return (ts // MS_POR_HORA) % 24
+
+
+def ts_do_evento(event: dict) -> Optional[int]:
+    """Timestamp normalizado do evento; eventos gravados antes do campo "ts" são convertidos na hora"""
+    ts = event.get("ts")
+    if isinstance(ts, int):
+        return ts
+    return timestamp_ms(event.get("timestamp"))
+
+
+def normalizar_evento(event: dict) -> dict:
+    """Acrescenta "ts" ao evento, se ainda não tiver"""
+    if not isinstance(event.get("ts"), int):
+        ts = timestamp_ms(event.get("timestamp"))
+        if ts is not None:
+            event["ts"] = ts
+    return event
+
+
+def dia_do_evento(event: dict) -> str:
+    """Dia (YYYY-MM-DD) do evento, pelo "ts" ou pelo prefixo do timestamp ISO"""
+    ts = event.get("ts")
+    if isinstance(ts, int):
+        return dia_de_ts(ts)
+    return str(event.get("timestamp", ""))[:10] or "sem-data"
+
+
+def dia_do_segmento(path: str) -> str:
+    """Dia (YYYY-MM-DD) de um segmento, pelo nome do arquivo"""
+    nome = os.path.basename(path)[len(PREFIXO_SEGMENTO):]
+    return nome[:-len(EXTENSAO_COMPRIMIDA)] if nome.endswith(EXTENSAO_COMPRIMIDA) else nome[:-len(EXTENSAO_SEGMENTO)]
+
+
+def segmento_comprimido(path: str) -> bool:
+    return path.endswith(EXTENSAO_COMPRIMIDA)
+
+
+def abrir_segmento(path: str, binario: bool = False):
+    """Abre um segmento para leitura, descomprimindo os .gz"""
+    if segmento_comprimido(path):
+        return gzip.open(path, "rb") if binario else gzip.open(path, "rt", encoding="utf-8")
+    return open(path, "rb") if binario else open(path, "r", encoding="utf-8")
+
+
+def serializar_evento(event: dict) -> str:
+    return json.dumps(event, ensure_ascii=False, separators=(",", ":")) + "\n"
+
+
+def _comprimir_em_blocos(blocos: Iterable[bytes]) -> Iterator[bytes]:
+    """Um membro gzip com o conteúdo dos blocos, comprimido à medida que chegam"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for bloco in blocos:
+        saida = compressor.compress(bloco)
+        if saida:
+            yield saida
+    yield compressor.flush()
+
+
+def ler_backup(arquivo) -> Iterator:
+    """
+    Itens de um backup de analytics, lidos em blocos do arquivo binário `arquivo`
+
+    Aceita NDJSON (um evento por linha, o formato da exportação) e a lista JSON do
+    formato antigo, com ou sem gzip (detectado pelo conteúdo). Só um bloco fica em
+    memória por vez. Linhas NDJSON inválidas viram None (o chamador as conta como
+    inválidas); uma lista JSON malformada gera ValueError.
+    """
+    comprimido = arquivo.read(2) == b"\x1f\x8b"
+    arquivo.seek(0)
+    texto = io.TextIOWrapper(gzip.GzipFile(fileobj=arquivo, mode="rb") if comprimido else arquivo, encoding="utf-8-sig")
+    inicio = texto.read(TAMANHO_BLOCO_LEITURA)
+    if inicio.lstrip().startswith("["):
+        yield from _itens_lista_json(texto, inicio.lstrip()[1:])
+        return
+    # NDJSON: completar a linha cortada no fim do primeiro bloco e seguir linha a linha
+    for linha in itertools.chain(io.StringIO(inicio + texto.readline()), texto):
+        if not linha.strip():
+            continue
+        try:
+            yield json.loads(linha)
+        except json.JSONDecodeError:
+            yield None
+
+
+_ESPACOS = re.compile(r"\s*")
+
+
+def _itens_lista_json(texto, buffer: str) -> Iterator:
+    """Itens de uma lista JSON (já sem o "["), decodificados um a um enquanto o texto é lido"""
+    decoder = json.JSONDecoder()
+    pos = 0
+    fim = False
+    esperando_item = True
+    while True:
+        pos = _ESPACOS.match(buffer, pos).end()
+        if pos == len(buffer) or not esperando_item and buffer[pos] not in ",]":
+            if pos == len(buffer) and not fim:
+                bloco = texto.read(TAMANHO_BLOCO_LEITURA)
+                fim = not bloco
+                buffer, pos = buffer[pos:] + bloco, 0
+                continue
+            raise ValueError("Arquivo não é um JSON válido: lista incompleta ou malformada")
+        if buffer[pos] == "]":
+            return
+        if buffer[pos] == ",":
+            if esperando_item:
+                raise ValueError("Arquivo não é um JSON válido: vírgula fora de lugar")
+            esperando_item = True
+            pos += 1
+            continue
+        try:
+            item, final = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            if fim or len(buffer) - pos > TAMANHO_MAXIMO_ITEM:
+                raise ValueError(f"Arquivo não é um JSON válido: {e}")
+            final = len(buffer)
+        if final == len(buffer) and not fim and len(buffer) - pos <= TAMANHO_MAXIMO_ITEM:
+            # Item possivelmente cortado no fim do bloco: ler mais e decodificar de novo
+            bloco = texto.read(TAMANHO_BLOCO_LEITURA)
+            fim = not bloco
+            buffer, pos = buffer[pos:] + bloco, 0
+            continue
+        yield item
+        pos = final
+        esperando_item = False
+
+
+def _fsync_diretorio(diretorio: str):
+    """Persiste as entradas do diretório (renomeações e remoções) no POSIX"""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(diretorio, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class AnalyticsLog:
+    """
+    Log de eventos append-only em JSONL, com rotação diária de segmentos
+
+    Gravar um evento é acrescentar uma linha ao segmento do dia, com custo independente
+    do tamanho do histórico. A leitura percorre os segmentos em ordem, linha a linha,
+    sem montar o histórico inteiro em memória, e consultas por período abrem só os
+    segmentos dos dias pedidos. Dias antigos ficam comprimidos em gzip; um evento
+    atrasado para um dia já comprimido vai para um .jsonl novo do mesmo dia, que entra
+    no .gz na próxima compressão.
+
+    Todas as gravações passam por write_lock(), que serializa threads e processos
+    (workers do uvicorn com o mesmo diretório): um único escritor por vez, e
+    substituições feitas com arquivo temporário + fsync + os.replace. Cada gravação
+    concluída incrementa a versão dos dados (version()), usada pelo cache do dashboard.
+    """
+
+    def __init__(self, directory: str, fsync_policy: str = "interval", fsync_interval: float = 1.0):
+        if fsync_policy not in POLITICAS_FSYNC:
+            raise ValueError(f"ANALYTICS_FSYNC inválida: {fsync_policy!r}")
+        self.directory = directory
+        self.fsync_policy = fsync_policy
+        self.fsync_interval = fsync_interval
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread_lock = threading.RLock()
+        self._lock_depth = 0
+        self._last_fsync = 0.0
+
+    @contextmanager
+    def write_lock(self):
+        """Exclusão mútua das gravações entre threads e processos (reentrante na mesma thread)"""
+        with self._thread_lock:
+            if fcntl is None or self._lock_depth:
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                return
+            with open(os.path.join(self.directory, ARQUIVO_LOCK_ESCRITA), "a") as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                self._lock_depth += 1
+                try:
+                    yield
+                finally:
+                    self._lock_depth -= 1
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @contextmanager
+    def maintenance_lock(self):
+        """
+        Lock não bloqueante da manutenção: entre vários processos, só um roda a
+        manutenção por vez; os demais recebem False e pulam a rodada
+        """
+        if fcntl is None:
+            yield True
+            return
+        with open(os.path.join(self.directory, ARQUIVO_LOCK_MANUTENCAO), "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def version(self) -> int:
+        """Versão atual dos dados (0 se nada foi gravado), lida sem lock: um arquivo pequeno por chamada"""
+        try:
+            with open(os.path.join(self.directory, ARQUIVO_VERSAO), "rb") as f:
+                return int(f.read(LARGURA_VERSAO) or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def bump_version(self) -> int:
+        """
+        Incrementa a versão dos dados, depois de uma gravação concluída
+
+        O contador é reescrito no lugar, com largura fixa, sob o write_lock. Nunca fica
+        abaixo do relógio em ms: se o arquivo for apagado, a versão não volta a valores
+        que já estejam em caches ou ETags.
+        """
+        with self.write_lock():
+            fd = os.open(os.path.join(self.directory, ARQUIVO_VERSAO), os.O_RDWR | os.O_CREAT, 0o644)
+            with os.fdopen(fd, "r+b") as f:
+                try:
+                    atual = int(f.read(LARGURA_VERSAO) or 0)
+                except ValueError:
+                    atual = 0
+                nova = max(atual + 1, time.time_ns() // 1_000_000)
+                f.seek(0)
+                f.write(b"%0*d" % (LARGURA_VERSAO, nova))
+        return nova
+
+    def _fsync_append(self, f):
+        if self.fsync_policy == "never":
+            return
+        agora = time.monotonic()
+        if self.fsync_policy == "always" or agora - self._last_fsync >= self.fsync_interval:
+            f.flush()
+            os.fsync(f.fileno())
+            self._last_fsync = agora
+
+    def _write_atomic(self, destino: str, conteudo: bytes):
+        """Grava `destino` por inteiro ou não grava: temporário + fsync + os.replace"""
+        fd, temporario = tempfile.mkstemp(prefix=".tmp-", dir=self.directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(conteudo)
+                if self.fsync_policy != "never":
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(temporario, destino)
+        except BaseException:
+            os.remove(temporario)
+            raise
+
+    def _fsync_directory(self):
+        if self.fsync_policy != "never":
+            _fsync_diretorio(self.directory)
+
+    def _segment_path(self, day: str) -> str:
+        return os.path.join(self.directory, f"{PREFIXO_SEGMENTO}{day}{EXTENSAO_SEGMENTO}")
+
+    def segments(self, start_day: Optional[str] = None, end_day: Optional[str] = None) -> List[str]:
+        """
+        Caminhos dos segmentos, do dia mais antigo para o mais recente
+
+        Com `start_day`/`end_day` (YYYY-MM-DD, inclusivos), só os segmentos desses dias;
+        segmentos sem data válida ficam de fora de consultas por período (mas podem ser
+        pedidos pelo nome, com start_day == end_day).
+        """
+        nomes = sorted(
+            (nome for nome in os.listdir(self.directory)
+             if nome.startswith(PREFIXO_SEGMENTO) and nome.endswith((EXTENSAO_SEGMENTO, EXTENSAO_COMPRIMIDA))),
+            # No mesmo dia, o .gz (eventos mais antigos) antes do .jsonl
+            key=lambda nome: (dia_do_segmento(nome), not segmento_comprimido(nome))
+        )
+        if start_day is not None or end_day is not None:
+            nomes = [
+                nome for nome in nomes
+                if (dia_do_segmento(nome)[:1].isdigit() or start_day == end_day)
+                and (start_day is None or dia_do_segmento(nome) >= start_day)
+                and (end_day is None or dia_do_segmento(nome) <= end_day)
+            ]
+        return [os.path.join(self.directory, nome) for nome in nomes]
+
+    def append(self, events: Iterable[dict]) -> int:
+        """Acrescenta eventos ao final dos segmentos dos seus dias (uma escrita por segmento), com "ts" preenchido"""
+        por_dia: Dict[str, List[str]] = {}
+        total = 0
+        for event in events:
+            normalizar_evento(event)
+            por_dia.setdefault(dia_do_evento(event), []).append(serializar_evento(event))
+            total += 1
+        with self.write_lock():
+            for day, linhas in por_dia.items():
+                with open(self._segment_path(day), "a", encoding="utf-8") as f:
+                    f.write("".join(linhas))
+                    self._fsync_append(f)
+            if por_dia:
+                self.bump_version()
+        return total
+
+    def iter_events(self, start_day: Optional[str] = None, end_day: Optional[str] = None) -> Iterator[dict]:
+        """Percorre os eventos dos dias pedidos (todos, por padrão), ignorando linhas corrompidas"""
+        for path in self.segments(start_day, end_day):
+            try:
+                with abrir_segmento(path) as f:
+                    for linha in f:
+                        if not linha.strip():
+                            continue
+                        try:
+                            yield json.loads(linha)
+                        except json.JSONDecodeError:
+                            # Linha incompleta (ex.: queda durante a escrita): descartar
+                            continue
+            except FileNotFoundError:
+                # Segmento removido por uma compactação durante a leitura
+                continue
+
+    def count_events(self) -> int:
+        """Número de eventos, contando linhas sem decodificar o JSON"""
+        total = 0
+        for path in self.segments():
+            try:
+                with abrir_segmento(path, binario=True) as f:
+                    total += sum(1 for linha in f if linha.strip())
+            except FileNotFoundError:
+                continue
+        return total
+
+    def size_bytes(self) -> int:
+        total = 0
+        for path in self.segments():
+            try:
+                total += os.path.getsize(path)
+            except FileNotFoundError:
+                continue
+        return total
+
+    def rewrite(self, events: Iterable[dict], allow_empty: bool = True,
+                before_swap: Optional[Callable[[], None]] = None,
+                after_swap: Optional[Callable[[], None]] = None) -> int:
+        """
+        Substitui todo o conteúdo do log (compactação, importação)
+
+        Os eventos são gravados em lotes em um diretório temporário (staging), então
+        um fluxo de qualquer tamanho passa com memória limitada; no final os segmentos
+        são movidos com os.replace, cada um trocado de uma vez, e os que deixaram de
+        existir são removidos. Se o fluxo falhar, ou vier vazio com allow_empty=False
+        (ValueError), o log atual fica intacto. Só a troca roda sob o write_lock:
+        `before_swap` logo antes, com o log antigo ainda no lugar (ex.: backup da
+        importação), e `after_swap` logo depois, antes de a versão dos dados mudar.
+        """
+        temporario = tempfile.mkdtemp(prefix=".rewrite-", dir=self.directory)
+        try:
+            novo = AnalyticsLog(temporario, fsync_policy="never")
+            total = 0
+            eventos = iter(events)
+            while True:
+                lote = list(itertools.islice(eventos, TAMANHO_LOTE_GRAVACAO))
+                if not lote:
+                    break
+                total += novo.append(lote)
+            if not total and not allow_empty:
+                raise ValueError("Nenhum evento válido para gravar")
+            novos = {os.path.basename(path) for path in novo.segments()}
+            if self.fsync_policy != "never":
+                for nome in novos:
+                    with open(os.path.join(temporario, nome), "rb") as f:
+                        os.fsync(f.fileno())
+            with self.write_lock():
+                if before_swap is not None:
+                    before_swap()
+                for nome in novos:
+                    os.replace(os.path.join(temporario, nome), os.path.join(self.directory, nome))
+                for path in self.segments():
+                    if os.path.basename(path) not in novos:
+                        os.remove(path)
+                self._fsync_directory()
+                if after_swap is not None:
+                    after_swap()
+                self.bump_version()
+            return total
+        finally:
+            shutil.rmtree(temporario, ignore_errors=True)
+
+    def days(self) -> List[str]:
+        """Dias com segmentos no log, em ordem"""
+        return sorted({dia_do_segmento(path) for path in self.segments()})
+
+    def replace_day(self, day: str, events: Iterable[dict]) -> int:
+        """
+        Substitui os eventos de um dia (compactação)
+
+        O novo segmento é gravado em um temporário e trocado com os.replace; um dia que
+        estava comprimido continua comprimido. Sem eventos, os segmentos do dia são
+        removidos. Retorna quantos eventos foram gravados.
+        """
+        linhas = [serializar_evento(normalizar_evento(event)) for event in events]
+        with self.write_lock():
+            antigos = self.segments(day, day)
+            comprimir = any(segmento_comprimido(path) for path in antigos)
+            destino = self._segment_path(day) + (".gz" if comprimir else "")
+            if linhas:
+                conteudo = "".join(linhas).encode("utf-8")
+                self._write_atomic(destino, gzip.compress(conteudo, mtime=0) if comprimir else conteudo)
+            for path in antigos:
+                if path != destino or not linhas:
+                    os.remove(path)
+            self._fsync_directory()
+            self.bump_version()
+        return len(linhas)
+
+    def compress_before(self, day: str) -> int:
+        """
+        Comprime em gzip os segmentos .jsonl de dias anteriores a `day`
+
+        O .gz é gravado em um temporário e trocado com os.replace antes de remover o
+        .jsonl; se o dia já tinha um .gz, o conteúdo novo é acrescentado como mais um
+        membro gzip. Retorna quantos segmentos foram comprimidos.
+        """
+        comprimidos = 0
+        for path in self.segments(end_day=day):
+            dia = dia_do_segmento(path)
+            if segmento_comprimido(path) or dia >= day:
+                continue
+            destino = self._segment_path(dia) + ".gz"
+            with self.write_lock():
+                with open(path, "rb") as f:
+                    conteudo = gzip.compress(f.read(), mtime=0)
+                if os.path.exists(destino):
+                    with open(destino, "rb") as anterior:
+                        conteudo = anterior.read() + conteudo
+                self._write_atomic(destino, conteudo)
+                os.remove(path)
+                self._fsync_directory()
+                # Os eventos não mudam, mas os segmentos e o tamanho do log sim
+                self.bump_version()
+            comprimidos += 1
+        return comprimidos
+
+    def drop_before(self, day: str) -> int:
+        """Retenção por partição: apaga os segmentos de dias anteriores a `day`, retornando quantos eventos tinham"""
+        removidos = 0
+        with self.write_lock():
+            antigos = [path for path in self.segments(end_day=day) if dia_do_segmento(path) < day]
+            for path in antigos:
+                with abrir_segmento(path, binario=True) as f:
+                    removidos += sum(1 for linha in f if linha.strip())
+                os.remove(path)
+            if antigos:
+                self.bump_version()
+        return removidos
+
+    def export_gzip(self, day: str) -> Iterator[bytes]:
+        """
+        Eventos de um dia em JSONL comprimido com gzip, em blocos
+
+        O .gz do dia é enviado como está; um .jsonl do mesmo dia vira mais um membro
+        gzip no final (leitores de gzip concatenam os membros).
+        """
+        for path in self.segments(day, day):
+            try:
+                with open(path, "rb") as f:
+                    blocos = iter(lambda: f.read(64 * 1024), b"")
+                    yield from blocos if segmento_comprimido(path) else _comprimir_em_blocos(blocos)
+            except FileNotFoundError:
+                continue
+
+    def partitions(self) -> List[dict]:
+        """Dias presentes no log, com tamanho em disco e se estão comprimidos"""
+        dias: Dict[str, dict] = {}
+        for path in self.segments():
+            try:
+                tamanho = os.path.getsize(path)
+            except FileNotFoundError:
+                continue
+            dia = dia_do_segmento(path)
+            info = dias.setdefault(dia, {"day": dia, "size_bytes": 0, "compressed": True})
+            info["size_bytes"] += tamanho
+            info["compressed"] = info["compressed"] and segmento_comprimido(path)
+        return list(dias.values())
+
+    def compaction_profile(self, old_cutoff_ms: int) -> dict:
+        """
+        Contagens da análise de compactação, em uma única passada pelos eventos
+
+        Tipos de evento, período coberto, eventos até `old_cutoff_ms`, grupos por
+        (minuto, sessão, tipo) e duplicatas que a compactação removeria. A compactação
+        deduplica cada dia separadamente, então os conjuntos de padrões também são
+        por dia e descartados ao fim de cada um: a memória fica limitada a um dia do
+        log, não ao histórico inteiro.
+        """
+        total = old_events = temporal_duplicates = session_duplicates = 0
+        time_buckets = high_density_buckets = 0
+        oldest = newest = None
+        event_types: Dict[str, int] = {}
+        for day in self.days():
+            buckets_dia: Dict[tuple, int] = {}
+            temporal_patterns = set()
+            session_patterns = set()
+            for event in self.iter_events(day, day):
+                total += 1
+                event_type = event.get('event', 'unknown')
+                event_types[event_type] = event_types.get(event_type, 0) + 1
+                page = event.get('page', '')
+                session_id = event.get('session_id', '')
+
+                ts = ts_do_evento(event)
+                minute = ts // MS_POR_MINUTO if ts is not None else None
+                if ts is not None:
+                    oldest = ts if oldest is None else min(oldest, ts)
+                    newest = ts if newest is None else max(newest, ts)
+                    old_events += ts <= old_cutoff_ms
+                    bucket = (minute, session_id, event.get('event', ''))
+                    buckets_dia[bucket] = buckets_dia.get(bucket, 0) + 1
+
+                # Sem timestamp válido, padrão sem tempo
+                pattern = (event.get('event', ''), page, session_id, minute)
+                temporal_duplicates += pattern in temporal_patterns
+                temporal_patterns.add(pattern)
+                if event_type == 'performance_metrics':
+                    pattern = (page, session_id)
+                    session_duplicates += pattern in session_patterns
+                    session_patterns.add(pattern)
+            time_buckets += len(buckets_dia)
+            high_density_buckets += sum(1 for count in buckets_dia.values() if count > 3)
+
+        return {
+            "total_events": total,
+            "event_types": event_types,
+            "oldest_ts": oldest,
+            "newest_ts": newest,
+            "old_events": old_events,
+            "time_buckets": time_buckets,
+            "high_density_buckets": high_density_buckets,
+            "temporal_duplicates": temporal_duplicates,
+            "session_duplicates": session_duplicates,
+        }
+
+    def clear(self):
+        with self.write_lock():
+            for path in self.segments():
+                os.remove(path)
+            self.bump_version()
+
+    def backup(self, destino: str) -> str:
+        """Copia os segmentos atuais para o diretório `destino`"""
+        os.makedirs(destino, exist_ok=True)
+        for path in self.segments():
+            shutil.copy2(path, destino)
+        return destino
+
+    def migrate_legacy_file(self, legacy_path: str) -> int:
+        """
+        Importa o antigo analytics_data.json (lista JSON única) para os segmentos
+
+        Roda uma vez: o arquivo antigo é renomeado para .migrated depois da importação.
+        """
+        # Com vários workers iniciando juntos, só o primeiro migra
+        with self.write_lock():
+            if not os.path.exists(legacy_path) or self.segments():
+                return 0
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            total = self.append(e for e in data if isinstance(e, dict)) if isinstance(data, list) else 0
+            os.replace(legacy_path, legacy_path + ".migrated")
+        return total
@@ -0,0 +1,453 @@
+import gzip
+import json
+import os
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.models.analytics_aggregates import (
+    CAPACIDADE_TOP_K, StatsAggregate, UniqueCounter, _navegador, _texto, _tipo_dispositivo
+)
+from app.models.analytics_log import AnalyticsLog, dia_do_evento, normalizar_evento, serializar_evento
+
+# Banco do backend SQLite, no mesmo diretório de dados do log JSONL
+ARQUIVO_BANCO = "analytics.sqlite3"
+
+# Muda quando o esquema do banco muda
+FORMATO_BANCO = 1
+
+# Linhas por executemany nas gravações e por página nas leituras
+TAMANHO_LOTE = 5000
+
+# synchronous do SQLite para cada política de fsync (em WAL, NORMAL só sincroniza nos checkpoints)
+SYNCHRONOUS_POR_FSYNC = {"always": "FULL", "interval": "NORMAL", "never": "OFF"}
+
+_ESQUEMA = """
+CREATE TABLE IF NOT EXISTS eventos (
+    id INTEGER PRIMARY KEY,
+    ts INTEGER,
+    dia TEXT NOT NULL,
+    event TEXT NOT NULL DEFAULT '',
+    page TEXT NOT NULL DEFAULT '',
+    session_id TEXT NOT NULL DEFAULT '',
+    user_id TEXT NOT NULL DEFAULT '',
+    user_agent TEXT NOT NULL DEFAULT '',
+    screen_resolution TEXT NOT NULL DEFAULT '',
+    dispositivo TEXT NOT NULL DEFAULT '',
+    navegador TEXT NOT NULL DEFAULT '',
+    dados TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_eventos_ts ON eventos (ts);
+CREATE INDEX IF NOT EXISTS idx_eventos_dia ON eventos (dia);
+CREATE INDEX IF NOT EXISTS idx_eventos_event_ts ON eventos (event, ts);
+CREATE INDEX IF NOT EXISTS idx_eventos_session_id ON eventos (session_id);
+CREATE INDEX IF NOT EXISTS idx_eventos_user_id ON eventos (user_id);
+"""
+
+_COLUNAS = (
+    "ts, dia, event, page, session_id, user_id, user_agent, screen_resolution, dispositivo, navegador, dados"
+)
+_INSERIR = f"INSERT INTO {{tabela}} ({_COLUNAS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+# Tabela temporária (da conexão, fora do banco principal) onde rewrite prepara o conteúdo novo
+_TABELA_STAGING = "temp.eventos_staging"
+
+
+def _linha_do_evento(event: dict) -> tuple:
+    normalizar_evento(event)
+    ts = event.get("ts")
+    # Dispositivo e navegador classificados uma vez na gravação, para o dashboard só agrupar
+    user_agent = _texto(event.get("user_agent")).lower()
+    return (
+        ts if isinstance(ts, int) else None,
+        dia_do_evento(event),
+        _texto(event.get("event")),
+        # Mesmas regras de StatsAggregate.add, para os dois backends darem as mesmas estatísticas
+        _texto(event.get("page"), "/"),
+        _texto(event.get("session_id")),
+        _texto(event.get("user_id")),
+        _texto(event.get("user_agent")),
+        _texto(event.get("screen_resolution")),
+        _tipo_dispositivo(user_agent) if user_agent else "",
+        _navegador(user_agent) if user_agent else "",
+        serializar_evento(event)[:-1],
+    )
+
+
+def _filtro_dias(start_day: Optional[str], end_day: Optional[str]) -> Tuple[str, list]:
+    """WHERE dos dias [start_day, end_day], com a mesma regra de AnalyticsLog.segments para dias sem data"""
+    condicoes, parametros = [], []
+    if start_day is not None or end_day is not None:
+        if start_day != end_day:
+            condicoes.append("dia GLOB '[0-9]*'")
+        if start_day is not None:
+            condicoes.append("dia >= ?")
+            parametros.append(start_day)
+        if end_day is not None:
+            condicoes.append("dia <= ?")
+            parametros.append(end_day)
+    return " AND ".join(condicoes) or "1", parametros
+
+
+class AnalyticsLogSQLite(AnalyticsLog):
+    """
+    Log de eventos em SQLite (WAL), com a mesma interface de AnalyticsLog
+
+    Cada evento é uma linha da tabela `eventos`, com o JSON completo em `dados` e os
+    campos usados pelo dashboard em colunas indexadas (ts, event, session_id, user_id e
+    o dia). Gravações em lote entram em uma única transação; leituras são paginadas
+    pela chave (dia, id), sem manter um cursor aberto entre chamadas, então um gerador
+    pode ser consumido por threads diferentes (StreamingResponse).
+
+    As gravações continuam passando por write_lock() para que leitura + substituição
+    de um dia (compactação) seja atômica em relação aos outros workers, e a versão dos
+    dados fica no mesmo arquivo do backend JSONL, incrementada depois do COMMIT. Não há
+    compressão por dia: compress_before não faz nada.
+    """
+
+    def __init__(self, directory: str, fsync_policy: str = "interval", fsync_interval: float = 1.0):
+        super().__init__(directory, fsync_policy, fsync_interval)
+        self.path = os.path.join(directory, ARQUIVO_BANCO)
+        # Uma conexão SQLite por thread (event loop, gravação do buffer, manutenção)
+        self._local = threading.local()
+        self._criar_esquema()
+
+    def _conexao(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: transações controladas explicitamente com BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={SYNCHRONOUS_POR_FSYNC[self.fsync_policy]}")
+            self._local.conn = conn
+        return conn
+
+    def _criar_esquema(self):
+        conn = self._conexao()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            versao = conn.execute("PRAGMA user_version").fetchone()[0]
+            if versao not in (0, FORMATO_BANCO):
+                raise RuntimeError(f"{self.path}: formato {versao} do banco de analytics não suportado")
+            for comando in _ESQUEMA.strip().split(";"):
+                if comando.strip():
+                    conn.execute(comando)
+            conn.execute(f"PRAGMA user_version = {FORMATO_BANCO}")
+
+    @staticmethod
+    def _inserir(conn: sqlite3.Connection, events: Iterable[dict], tabela: str = "eventos") -> int:
+        """Insere em lotes de TAMANHO_LOTE (dentro da transação do chamador)"""
+        comando = _INSERIR.format(tabela=tabela)
+        total = 0
+        lote = []
+        for event in events:
+            lote.append(_linha_do_evento(event))
+            if len(lote) >= TAMANHO_LOTE:
+                conn.executemany(comando, lote)
+                total += len(lote)
+                lote = []
+        if lote:
+            conn.executemany(comando, lote)
+            total += len(lote)
+        return total
+
+    def _linhas(self, where: str = "1", parametros: Optional[list] = None) -> Iterator[str]:
+        """JSON dos eventos que atendem `where`, em ordem de (dia, id), página a página"""
+        parametros = parametros or []
+        ultimo = ("", 0)
+        while True:
+            pagina = self._conexao().execute(
+                f"SELECT dia, id, dados FROM eventos WHERE {where} AND (dia, id) > (?, ?) "
+                f"ORDER BY dia, id LIMIT {TAMANHO_LOTE}",
+                [*parametros, *ultimo]
+            ).fetchall()
+            for _, _, dados in pagina:
+                yield dados
+            if len(pagina) < TAMANHO_LOTE:
+                return
+            ultimo = pagina[-1][:2]
+
+    def segments(self, start_day: Optional[str] = None, end_day: Optional[str] = None) -> List[str]:
+        """O arquivo do banco, se houver eventos nos dias pedidos (a interface de AnalyticsLog lista segmentos)"""
+        where, parametros = _filtro_dias(start_day, end_day)
+        existe = self._conexao().execute(f"SELECT EXISTS (SELECT 1 FROM eventos WHERE {where})", parametros).fetchone()[0]
+        return [self.path] if existe else []
+
+    def append(self, events: Iterable[dict]) -> int:
+        """Insere os eventos em uma única transação, com "ts" preenchido"""
+        with self.write_lock():
+            conn = self._conexao()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                total = self._inserir(conn, events)
+            if total:
+                self.bump_version()
+            return total
+
+    def iter_events(self, start_day: Optional[str] = None, end_day: Optional[str] = None) -> Iterator[dict]:
+        """Percorre os eventos dos dias pedidos (todos, por padrão), pelo índice de dia"""
+        for dados in self._linhas(*_filtro_dias(start_day, end_day)):
+            yield json.loads(dados)
+
+    def count_events(self) -> int:
+        return self._conexao().execute("SELECT COUNT(*) FROM eventos").fetchone()[0]
+
+    def size_bytes(self) -> int:
+        total = 0
+        for path in (self.path, self.path + "-wal"):
+            try:
+                total += os.path.getsize(path)
+            except FileNotFoundError:
+                continue
+        return total
+
+    def rewrite(self, events: Iterable[dict], allow_empty: bool = True,
+                before_swap: Optional[Callable[[], None]] = None,
+                after_swap: Optional[Callable[[], None]] = None) -> int:
+        """
+        Substitui todo o conteúdo do log
+
+        Os eventos são inseridos em lotes em uma tabela temporária da conexão, sem
+        bloquear o banco nem os outros workers; se o fluxo falhar, ou vier vazio com
+        allow_empty=False (ValueError), nada muda. Só a troca (DELETE + cópia da tabela
+        temporária, em uma transação) roda sob o write_lock, entre `before_swap` e
+        `after_swap`.
+        """
+        conn = self._conexao()
+        conn.execute(f"DROP TABLE IF EXISTS {_TABELA_STAGING}")
+        conn.execute(f"CREATE TABLE {_TABELA_STAGING} AS SELECT {_COLUNAS} FROM eventos WHERE 0")
+        try:
+            with conn:
+                conn.execute("BEGIN")
+                total = self._inserir(conn, events, _TABELA_STAGING)
+            if not total and not allow_empty:
+                raise ValueError("Nenhum evento válido para gravar")
+            with self.write_lock():
+                if before_swap is not None:
+                    before_swap()
+                with conn:
+                    conn.execute("BEGIN IMMEDIATE")
+                    conn.execute("DELETE FROM eventos")
+                    conn.execute(
+                        f"INSERT INTO eventos ({_COLUNAS}) SELECT {_COLUNAS} FROM {_TABELA_STAGING} ORDER BY rowid"
+                    )
+                if after_swap is not None:
+                    after_swap()
+                self.bump_version()
+            return total
+        finally:
+            conn.execute(f"DROP TABLE IF EXISTS {_TABELA_STAGING}")
+
+    def days(self) -> List[str]:
+        return [dia for (dia,) in self._conexao().execute("SELECT DISTINCT dia FROM eventos ORDER BY dia")]
+
+    def replace_day(self, day: str, events: Iterable[dict]) -> int:
+        """Substitui os eventos de um dia em uma única transação"""
+        with self.write_lock():
+            conn = self._conexao()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DELETE FROM eventos WHERE dia = ?", (day,))
+                total = self._inserir(conn, events)
+            self.bump_version()
+            return total
+
+    def compress_before(self, day: str) -> int:
+        return 0
+
+    def drop_before(self, day: str) -> int:
+        """Retenção: apaga os eventos de dias anteriores a `day`, retornando quantos eram"""
+        with self.write_lock():
+            conn = self._conexao()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                removidos = conn.execute("DELETE FROM eventos WHERE dia GLOB '[0-9]*' AND dia < ?", (day,)).rowcount
+            if removidos:
+                self.bump_version()
+            return removidos
+
+    def export_gzip(self, day: str) -> Iterator[bytes]:
+        """Eventos de um dia em JSONL comprimido com gzip, um membro gzip por página de eventos"""
+        lote = []
+        for dados in self._linhas(*_filtro_dias(day, day)):
+            lote.append(dados + "\n")
+            if len(lote) >= TAMANHO_LOTE:
+                yield gzip.compress("".join(lote).encode("utf-8"), mtime=0)
+                lote = []
+        if lote:
+            yield gzip.compress("".join(lote).encode("utf-8"), mtime=0)
+
+    def partitions(self) -> List[dict]:
+        """Dias presentes no log, com o tamanho do JSON dos eventos (as páginas do banco são compartilhadas)"""
+        return [
+            {"day": dia, "size_bytes": tamanho, "compressed": False}
+            for dia, tamanho in self._conexao().execute(
+                "SELECT dia, SUM(LENGTH(dados)) FROM eventos GROUP BY dia ORDER BY dia"
+            )
+        ]
+
+    def clear(self):
+        with self.write_lock():
+            conn = self._conexao()
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("DELETE FROM eventos")
+            self.bump_version()
+
+    def backup(self, destino: str) -> str:
+        """
+        Copia o banco (API de backup do SQLite, consistente mesmo com gravações em andamento)
+
+        Usa uma conexão própria, que vê só o que já foi confirmado (nunca uma transação
+        em andamento da conexão desta thread).
+        """
+        os.makedirs(destino, exist_ok=True)
+        origem = sqlite3.connect(self.path, timeout=30)
+        copia = sqlite3.connect(os.path.join(destino, ARQUIVO_BANCO))
+        try:
+            origem.backup(copia)
+        finally:
+            copia.close()
+            origem.close()
+        return destino
+
+    def compaction_profile(self, old_cutoff_ms: int) -> dict:
+        """Contagens da análise de compactação, calculadas com agregações SQL (padrões agrupados por dia, como na compactação)"""
+        conn = self._conexao()
+        total, oldest, newest, old_events = conn.execute(
+            "SELECT COUNT(*), MIN(ts), MAX(ts), COALESCE(SUM(ts <= ?), 0) FROM eventos", (old_cutoff_ms,)
+        ).fetchone()
+        time_buckets, high_density = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(n > 3), 0) FROM ("
+            "SELECT COUNT(*) AS n FROM eventos WHERE ts IS NOT NULL GROUP BY dia, ts / 60000, session_id, event)"
+        ).fetchone()
+        temporal_patterns = conn.execute(
+            "SELECT COUNT(*) FROM (SELECT 1 FROM eventos GROUP BY dia, event, page, session_id, ts / 60000)"
+        ).fetchone()[0]
+        performance, session_patterns = conn.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT dia || char(0) || page || char(0) || session_id) FROM eventos "
+            "WHERE event = 'performance_metrics'"
+        ).fetchone()
+        return {
+            "total_events": total,
+            "event_types": dict(conn.execute("SELECT event, COUNT(*) FROM eventos GROUP BY event")),
+            "oldest_ts": oldest,
+            "newest_ts": newest,
+            "old_events": old_events,
+            "time_buckets": time_buckets,
+            "high_density_buckets": high_density,
+            "temporal_duplicates": total - temporal_patterns,
+            "session_duplicates": performance - session_patterns,
+        }
+
+
+class SQLiteAggregates:
+    """
+    Estatísticas do dashboard calculadas por agregações SQL sobre os índices do banco
+
+    Substitui DailyAggregates no backend SQLite: não há estado a sincronizar ou gravar,
+    cada consulta agrupa direto na tabela. Os resultados preenchem um StatsAggregate
+    (mesclável com os rollups), então a resposta tem exatamente o formato de get_stats;
+    usuários e sessões distintos (SELECT DISTINCT) entram nos mesmos contadores de únicos.
+    """
+
+    def __init__(self, log: AnalyticsLogSQLite):
+        self.log = log
+
+    def sync(self, days: Optional[Iterable[str]] = None):
+        pass
+
+    def save(self, force: bool = False):
+        pass
+
+    def clear(self):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def stats(self, start_day: Optional[str] = None, end_day: Optional[str] = None) -> dict:
+        """Estatísticas dos dias [start_day, end_day]"""
+        return self.aggregate(start_day, end_day).to_stats()
+
+    def aggregate(self, start_day: Optional[str] = None, end_day: Optional[str] = None) -> StatsAggregate:
+        condicoes, parametros = [], []
+        if start_day is not None:
+            condicoes.append("dia >= ?")
+            parametros.append(start_day)
+        if end_day is not None:
+            condicoes.append("dia <= ?")
+            parametros.append(end_day)
+        return self._aggregate(" AND ".join(condicoes) or "1", parametros)
+
+    def aggregate_between(self, start_ms: Optional[int] = None, end_ms: Optional[int] = None) -> StatsAggregate:
+        """Agregado de um período avulso, pelos limites em milissegundos"""
+        condicoes, parametros = [], []
+        if start_ms is not None:
+            condicoes.append("ts >= ?")
+            parametros.append(start_ms)
+        if end_ms is not None:
+            condicoes.append("ts <= ?")
+            parametros.append(end_ms)
+        return self._aggregate(" AND ".join(condicoes) or "1", parametros)
+
+    def _aggregate(self, where: str, parametros: list) -> StatsAggregate:
+        conn = self.log._conexao()
+
+        def consulta(sql: str, *extras) -> List[tuple]:
+            return conn.execute(sql.format(where=where), [*parametros, *extras]).fetchall()
+
+        total = StatsAggregate()
+        total.event_types = dict(consulta("SELECT event, COUNT(*) FROM eventos WHERE {where} GROUP BY event"))
+        total.total_events = sum(total.event_types.values())
+        if not total.total_events:
+            return total
+
+        for campo in ("user_id", "session_id"):
+            contador = UniqueCounter()
+            for (valor,) in consulta(f"SELECT DISTINCT {campo} FROM eventos WHERE {{where}} AND TRIM({campo}) != ''"):
+                contador.add(valor)
+            setattr(total, "users" if campo == "user_id" else "sessions", contador)
+        total.hourly = {
+            str(hora): n for hora, n in consulta(
+                "SELECT (ts / 3600000) % 24 AS hora, COUNT(*) FROM eventos "
+                "WHERE {where} AND ts IS NOT NULL GROUP BY hora")
+        }
+        # Só as CAPACIDADE_TOP_K mais frequentes, na ordem de _top (empates em ordem alfabética)
+        total.pages = dict(consulta(
+            "SELECT page, COUNT(*) AS n FROM eventos WHERE {where} AND event = 'page_view' "
+            "GROUP BY page ORDER BY n DESC, page LIMIT ?", CAPACIDADE_TOP_K))
+        total.resolutions = dict(consulta(
+            "SELECT screen_resolution, COUNT(*) AS n FROM eventos WHERE {where} AND screen_resolution != '' "
+            "GROUP BY screen_resolution ORDER BY n DESC, screen_resolution LIMIT ?", CAPACIDADE_TOP_K))
+        total.daily_views = dict(consulta(
+            "SELECT dia, COUNT(*) FROM eventos WHERE {where} AND event = 'page_view' AND ts IS NOT NULL GROUP BY dia"))
+        total.time_on_page_total, total.time_on_page_count = consulta(
+            "SELECT COALESCE(SUM(v / 1000.0), 0), COUNT(*) FROM ("
+            "SELECT json_extract(dados, '$.data.time_on_page') AS v FROM eventos "
+            "WHERE {where} AND event = 'page_exit') "
+            "WHERE typeof(v) IN ('integer', 'real') AND v > 0 AND v <= 3600000")[0]
+        for campo, coluna in (("devices", "dispositivo"), ("browsers", "navegador")):
+            contadores = getattr(total, campo)
+            for nome, user_id in consulta(
+                f"SELECT DISTINCT {coluna}, user_id FROM eventos WHERE {{where}} AND user_id != '' AND {coluna} != ''"
+            ):
+                contadores.setdefault(nome, UniqueCounter()).add(user_id)
+
+        # Botões: o texto decide downloads/relatórios com as mesmas regras de StatsAggregate.add
+        botoes: Dict[str, int] = {}
+        for texto, button_id, n in consulta(
+            "SELECT COALESCE(json_extract(dados, '$.data.buttonText'), json_extract(dados, '$.data.button_text'), "
+            "'Unknown') AS texto, COALESCE(json_extract(dados, '$.data.buttonId'), "
+            "json_extract(dados, '$.data.button_id'), '') AS button_id, COUNT(*) FROM eventos "
+            "WHERE {where} AND event = 'button_click' GROUP BY texto, button_id"
+        ):
+            texto_lower = str(texto).lower()
+            if 'download' in texto_lower or 'baixar' in texto_lower or 'pdf' in texto_lower:
+                total.button_pdf_downloads += n
+            if 'gerar' in texto_lower or 'relatório' in texto_lower or 'relatorio' in texto_lower:
+                total.button_report_generations += n
+            chave = f"{texto} ({button_id})" if button_id else str(texto)
+            botoes[chave] = botoes.get(chave, 0) + n
+        total.buttons = botoes
+        return total
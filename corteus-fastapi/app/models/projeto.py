@@ -70,6 +70,7 @@ class CorteResponse(BaseModel):
     sucesso: bool
     resultado: Optional[str] = None
     nome_arquivo: Optional[str] = None
+    artefato_id: Optional[str] = None
     erro: Optional[str] = None
 
 class MinutaRequest(BaseModel):
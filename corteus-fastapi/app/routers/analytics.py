@@ -1,13 +1,18 @@
-from fastapi import APIRouter, Request, HTTPException, Depends
+from fastapi import APIRouter, Request, Response, HTTPException, Depends, Query
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
 from pydantic import BaseModel
 import os
 import json
+import asyncio
+import hashlib
 
 from app.models.analytics import AnalyticsEvent, analytics_storage, active_users_tracker
+from app.models.analytics_buffer import analytics_buffer
+from app.models.analytics_log import ler_backup, timestamp_ms
+from app.services.http_cache import etag_confere
 from app.auth import auth_manager
 
 router = APIRouter()
@@ -19,6 +24,16 @@ def verify_admin_auth(request: Request) -> bool:
         raise HTTPException(status_code=403, detail="Acesso negado. Autenticação de admin necessária.")
     return True
 
+def _cabecalhos_dashboard(*partes) -> dict:
+    """
+    ETag e Cache-Control das respostas do dashboard
+
+    Dados só de admin: o navegador guarda a resposta, mas revalida sempre com
+    If-None-Match e recebe 304 enquanto o ETag não mudar.
+    """
+    etag = hashlib.sha256("|".join(map(str, partes)).encode("utf-8")).hexdigest()[:32]
+    return {"ETag": f'W/"{etag}"', "Cache-Control": "private, no-cache"}
+
 class TrackRequest(BaseModel):
     event: str
     page: str
@@ -28,6 +43,9 @@ class TrackRequest(BaseModel):
     screen_resolution: str = ""
     data: dict = {}
 
+# Máximo de eventos aceitos em uma chamada de /track-batch
+MAX_EVENTS_PER_BATCH = 100
+
 class HeartbeatRequest(BaseModel):
     user_id: str
     session_id: str = ""
@@ -50,11 +68,19 @@ async def track_event(track_data: TrackRequest, request: Request):
             data=track_data.data
         )
         
-        # Salvar evento
-        analytics_storage.save_event(event)
+        # Rate limiting/deduplicação em memória; a gravação fica para o buffer em segundo plano
+        if analytics_storage.accept_event(event):
+            if not analytics_buffer.enqueue(event) and analytics_buffer.full_policy == "reject":
+                raise HTTPException(
+                    status_code=503,
+                    detail="Fila de analytics cheia, tente novamente",
+                    headers={"Retry-After": "1"}
+                )
         
         return {"success": True}
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Erro ao processar evento de analytics: {e}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
@@ -64,37 +90,48 @@ async def track_batch_events(request: Request):
     """Endpoint para receber múltiplos eventos de analytics em lote"""
     try:
         body = await request.json()
-        events = body.get('events', [])
+        events = body.get('events', []) if isinstance(body, dict) else []
         
         if not events:
             return {"success": True, "processed": 0}
+        if not isinstance(events, list) or len(events) > MAX_EVENTS_PER_BATCH:
+            raise HTTPException(status_code=413, detail=f"Máximo de {MAX_EVENTS_PER_BATCH} eventos por lote")
         
-        processed = 0
+        # Validar o lote inteiro antes de gravar qualquer evento
+        user_agent = request.headers.get("user-agent", "")
+        ip = request.client.host if request.client else ""
+        valid_events: List[AnalyticsEvent] = []
         for event_data in events:
             try:
-                # Criar evento de analytics
-                event = AnalyticsEvent(
-                    event=event_data.get('event', ''),
-                    page=event_data.get('page', ''),
-                    user_agent=request.headers.get("user-agent", ""),
-                    ip=request.client.host if request.client else "",
-                    session_id=event_data.get('session_id', ''),
-                    user_id=event_data.get('user_id', ''),
-                    referrer=event_data.get('referrer', ''),
-                    screen_resolution=event_data.get('screen_resolution', ''),
-                    data=event_data.get('data', {})
-                )
-                
-                # Salvar evento
-                analytics_storage.save_event(event)
-                processed += 1
-                
+                track_data = TrackRequest(**event_data)
             except Exception as e:
                 print(f"Erro ao processar evento individual: {e}")
                 continue
+            valid_events.append(AnalyticsEvent(
+                event=track_data.event,
+                page=track_data.page,
+                user_agent=user_agent,
+                ip=ip,
+                session_id=track_data.session_id,
+                user_id=track_data.user_id,
+                referrer=track_data.referrer,
+                screen_resolution=track_data.screen_resolution,
+                data=track_data.data
+            ))
+        
+        # Rate limiting/deduplicação em memória e uma única entrada na fila para o lote todo
+        accepted = analytics_storage.accept_events(valid_events)
+        if accepted and not analytics_buffer.enqueue_many(accepted) and analytics_buffer.full_policy == "reject":
+            raise HTTPException(
+                status_code=503,
+                detail="Fila de analytics cheia, tente novamente",
+                headers={"Retry-After": "1"}
+            )
+        
+        return {"success": True, "processed": len(valid_events), "accepted": len(accepted)}
         
-        return {"success": True, "processed": processed}
-        
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Erro ao processar lote de eventos de analytics: {e}")
         raise HTTPException(status_code=500, detail="Erro interno do servidor")
@@ -102,13 +139,26 @@ async def track_batch_events(request: Request):
 @router.get("/analytics-data")
 async def get_analytics_data(
     request: Request,
+    response: Response,
     start_date: Optional[str] = None,
     end_date: Optional[str] = None
 ):
-    """Endpoint para obter dados do dashboard - Requer autenticação admin"""
+    """
+    Endpoint para obter dados do dashboard - Requer autenticação admin
+    
+    O ETag vem de (período, versão dos dados), sem calcular nada: enquanto nenhum lote
+    novo for gravado, o polling do dashboard recebe 304, e com dados novos o cálculo
+    é feito uma vez por período e versão (cache em memória).
+    """
     # Verificar autenticação admin
     verify_admin_auth(request)
     
+    version = analytics_storage.data_version()
+    headers = _cabecalhos_dashboard("analytics-data", analytics_storage.backend, version, start_date, end_date)
+    if etag_confere(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    
     try:
         # Converter strings de data para datetime
         start_dt = None
@@ -121,8 +171,8 @@ async def get_analytics_data(
             # Interpretar a data como final do dia no fuso horário local
             end_dt = datetime.fromisoformat(end_date + "T23:59:59")
         
-        # Obter estatísticas
-        stats = analytics_storage.get_stats(start_dt, end_dt)
+        # Obter estatísticas (fora do event loop: um cálculo sem cache pode percorrer o log)
+        stats = await asyncio.to_thread(analytics_storage.get_stats_cached, start_dt, end_dt, version)
         
         return stats
         
@@ -131,21 +181,21 @@ async def get_analytics_data(
         raise HTTPException(status_code=500, detail="Erro ao obter dados")
 
 @router.get("/analytics-stats")
-async def get_analytics_stats(request: Request):
-    """Endpoint para monitorar performance do sistema de analytics - Requer autenticação admin"""
+async def get_analytics_stats(request: Request, response: Response):
+    """
+    Endpoint para monitorar performance do sistema de analytics - Requer autenticação admin
+    
+    As estatísticas do log ficam em cache pela versão dos dados; o resto vem da memória.
+    O ETag é o hash da resposta, então sem eventos novos o polling recebe 304.
+    """
     # Verificar autenticação admin
     verify_admin_auth(request)
     
     try:
-        # Estatísticas do arquivo
-        file_size = 0
-        event_count = 0
-        
-        if os.path.exists("analytics_data.json"):
-            file_size = os.path.getsize("analytics_data.json")
-            with open("analytics_data.json", 'r') as f:
-                data = json.load(f)
-                event_count = len(data)
+        # Estatísticas do log (segmentos JSONL ou banco SQLite)
+        storage = analytics_storage.storage_summary()
+        file_size = storage["file_size_bytes"]
+        event_count = analytics_storage.event_count
         
         # Estatísticas do rate limiting
         session_stats = {
@@ -153,17 +203,27 @@ async def get_analytics_stats(request: Request):
             "events_per_session": dict(analytics_storage.session_event_count)
         }
         
-        return {
+        result = {
             "file_size_bytes": file_size,
             "file_size_mb": round(file_size / (1024 * 1024), 2),
             "total_events": event_count,
+            "backend": analytics_storage.backend,
+            "segments": storage["segments"],
+            "rollup_days": storage["rollup_days"],
             "rate_limiting": session_stats,
+            "ingest_queue": analytics_buffer.stats(),
             "last_cleanup": analytics_storage.last_cleanup.isoformat()
         }
         
     except Exception as e:
         print(f"Erro ao obter estatísticas de analytics: {e}")
         raise HTTPException(status_code=500, detail="Erro ao obter estatísticas")
+    
+    headers = _cabecalhos_dashboard("analytics-stats", json.dumps(result, sort_keys=True, default=str))
+    if etag_confere(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return result
 
 @router.post("/clear-data")
 async def clear_analytics_data(request: Request):
@@ -227,7 +287,8 @@ async def compact_analytics_log(request: Request):
     verify_admin_auth(request)
     
     try:
-        result = analytics_storage.compact_log()
+        # Fora do event loop: a compactação lê e regrava os segmentos
+        result = await asyncio.to_thread(analytics_storage.compact_log)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro durante compactação: {str(e)}")
@@ -239,7 +300,7 @@ async def auto_compact(request: Request):
     verify_admin_auth(request)
     
     try:
-        result = analytics_storage.auto_compact_if_needed()
+        result = await asyncio.to_thread(analytics_storage.auto_compact_if_needed)
         return result
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro durante auto-compactação: {str(e)}")
@@ -251,7 +312,8 @@ async def get_compaction_analysis(request: Request):
     verify_admin_auth(request)
     
     try:
-        info = analytics_storage.get_log_info()
+        # A análise percorre o histórico: fora do event loop
+        info = await asyncio.to_thread(analytics_storage.get_log_info)
         
         # Extrair apenas os dados de análise
         analysis = {
@@ -285,42 +347,105 @@ async def get_log_info(request: Request):
     verify_admin_auth(request)
     
     try:
-        info = analytics_storage.get_log_info()
+        info = await asyncio.to_thread(analytics_storage.get_log_info)
         return info
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro ao obter informações do log: {str(e)}")
 
 @router.get("/export-full-data")
-async def export_full_data(request: Request):
-    """Endpoint para exportar TODOS os dados do analytics_data.json - Requer autenticação admin"""
+async def export_full_data(request: Request, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                           export_format: str = Query("ndjson", alias="format")):
+    """
+    Endpoint para exportar os dados de analytics (todos ou de um período) - Requer autenticação admin
+    
+    Por padrão em NDJSON comprimido com gzip (.jsonl.gz), gerado em streaming;
+    format=json devolve a lista JSON do formato antigo.
+    """
     # Verificar autenticação admin
     verify_admin_auth(request)
     
     try:
-        from fastapi.responses import FileResponse
-        import os
+        from fastapi.responses import StreamingResponse
         from datetime import datetime
         
-        # Verificar se arquivo existe
-        if not os.path.exists("analytics_data.json"):
-            raise HTTPException(status_code=404, detail="Arquivo de dados não encontrado")
+        if export_format not in ("ndjson", "json"):
+            raise HTTPException(status_code=400, detail="Formato inválido, use ndjson ou json")
         
         # Gerar nome do arquivo com timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"corteus_analytics_backup_{timestamp}.json"
+        
+        try:
+            # Período opcional: só os segmentos desses dias são lidos
+            start_dt = datetime.fromisoformat(start_date + "T00:00:00") if start_date else None
+            end_dt = datetime.fromisoformat(end_date + "T23:59:59.999999") if end_date else None
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Data inválida, use YYYY-MM-DD")
+        
+        if export_format == "ndjson":
+            return StreamingResponse(
+                analytics_storage.export_gzip(
+                    start_dt.date().isoformat() if start_dt else None,
+                    end_dt.date().isoformat() if end_dt else None
+                ),
+                media_type="application/gzip",
+                headers={"Content-Disposition": f"attachment; filename=corteus_analytics_backup_{timestamp}.jsonl.gz"}
+            )
+        
+        def gerar_lista_json():
+            # Mesmo formato do backup antigo (lista JSON), montado segmento a segmento
+            yield "["
+            for i, event in enumerate(analytics_storage.iter_events(start_dt, end_dt)):
+                yield ("," if i else "") + "\n" + json.dumps(event, ensure_ascii=False)
+            yield "\n]\n"
         
         # Retornar arquivo para download
-        return FileResponse(
-            path="analytics_data.json",
-            filename=filename,
+        return StreamingResponse(
+            gerar_lista_json(),
             media_type="application/json",
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
+            headers={"Content-Disposition": f"attachment; filename=corteus_analytics_backup_{timestamp}.json"}
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Erro ao exportar dados completos: {e}")
         raise HTTPException(status_code=500, detail="Erro ao exportar dados")
 
+@router.get("/analytics-partitions")
+async def get_analytics_partitions(request: Request):
+    """Endpoint para listar as partições diárias do log (tamanho e compressão) - Requer autenticação admin"""
+    # Verificar autenticação admin
+    verify_admin_auth(request)
+    
+    partitions = analytics_storage.log.partitions()
+    return {
+        "partitions": partitions,
+        "total": len(partitions),
+        "compressed": sum(1 for p in partitions if p["compressed"])
+    }
+
+@router.get("/export-partition/{day}")
+async def export_partition(request: Request, day: str):
+    """Endpoint para exportar os eventos de um dia como JSONL comprimido (gzip) - Requer autenticação admin"""
+    # Verificar autenticação admin
+    verify_admin_auth(request)
+    
+    from fastapi.responses import StreamingResponse
+    
+    try:
+        day = datetime.strptime(day, "%Y-%m-%d").date().isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Dia inválido, use YYYY-MM-DD")
+    
+    if not analytics_storage.log.segments(day, day):
+        raise HTTPException(status_code=404, detail=f"Nenhum evento em {day}")
+    
+    return StreamingResponse(
+        analytics_storage.log.export_gzip(day),
+        media_type="application/gzip",
+        headers={"Content-Disposition": f"attachment; filename=corteus_analytics_{day}.jsonl.gz"}
+    )
+
 @router.post("/import-full-data")
 async def import_full_data(request: Request):
     """Endpoint para importar dados completos com validação e análise automática - Requer autenticação admin"""
@@ -328,8 +453,6 @@ async def import_full_data(request: Request):
     verify_admin_auth(request)
     
     try:
-        import json
-        import shutil
         from datetime import datetime
         
         # Receber arquivo
@@ -339,61 +462,57 @@ async def import_full_data(request: Request):
         if not file:
             raise HTTPException(status_code=400, detail="Nenhum arquivo enviado")
         
-        # Verificar se é JSON válido
-        try:
-            file_content = await file.read()
-            imported_data = json.loads(file_content.decode('utf-8'))
-            
-            # Verificar se é uma lista (formato esperado)
-            if not isinstance(imported_data, list):
-                raise HTTPException(status_code=400, detail="Arquivo deve conter uma lista JSON")
-                
-        except json.JSONDecodeError as e:
-            raise HTTPException(status_code=400, detail=f"Arquivo não é um JSON válido: {str(e)}")
-        
-        # Validação dos dados importados
-        valid_events = []
-        invalid_events = 0
+        # Ler, validar e gravar em streaming: o arquivo (NDJSON ou lista JSON, com ou sem
+        # gzip) é lido em blocos e os eventos válidos vão em lotes para a área temporária
+        # do log, trocada pelo histórico atual só no final
+        upload = file.file
+        upload.seek(0, os.SEEK_END)
+        file_size = upload.tell()
+        upload.seek(0)
+        
+        resumo = {"total_in_file": 0, "valid_events": 0, "invalid_events": 0}
         required_fields = ['event', 'page', 'timestamp']
         
-        for i, event in enumerate(imported_data):
-            if isinstance(event, dict):
-                # Verificar campos obrigatórios
-                if all(field in event for field in required_fields):
-                    # Validar formato de timestamp
-                    try:
-                        if isinstance(event['timestamp'], str):
-                            # Tentar parsear o timestamp para validar
-                            datetime.fromisoformat(event['timestamp'].replace('Z', '+00:00'))
-                            valid_events.append(event)
-                        else:
-                            invalid_events += 1
-                    except ValueError:
-                        invalid_events += 1
-                else:
-                    invalid_events += 1
-            else:
-                invalid_events += 1
-        
-        if not valid_events:
+        def ler_eventos():
+            try:
+                yield from ler_backup(upload)
+            except ValueError as e:
+                # JSON malformado ou texto que não é UTF-8
+                raise HTTPException(status_code=400, detail=str(e))
+            except (OSError, EOFError) as e:
+                raise HTTPException(status_code=400, detail=f"Arquivo gzip inválido: {e}")
+        
+        def eventos_validos():
+            for event in ler_eventos():
+                resumo["total_in_file"] += 1
+                # Verificar campos obrigatórios e o formato do timestamp, guardando o "ts" já calculado
+                if isinstance(event, dict) and all(field in event for field in required_fields):
+                    ts = timestamp_ms(event['timestamp']) if isinstance(event['timestamp'], str) else None
+                    if ts is not None:
+                        event['ts'] = ts
+                        resumo["valid_events"] += 1
+                        yield event
+                        continue
+                resumo["invalid_events"] += 1
+        
+        # Substituir o log atual com os dados validados (nada muda se o arquivo for
+        # inválido ou não tiver eventos válidos); o backup do log atual é feito logo
+        # antes da troca, só se a importação for adiante
+        try:
+            _, backup_name = await asyncio.to_thread(
+                analytics_storage.replace_all_events, eventos_validos(), False, True
+            )
+        except ValueError:
             raise HTTPException(status_code=400, detail="Nenhum evento válido encontrado no arquivo")
         
-        # Fazer backup do arquivo atual
-        backup_created = False
-        if os.path.exists("analytics_data.json"):
-            backup_name = f"analytics_data_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            shutil.copy2("analytics_data.json", backup_name)
-            backup_created = True
+        backup_created = backup_name is not None
+        if backup_created:
             print(f"✅ Backup criado: {backup_name}")
         
-        # Substituir arquivo atual com dados validados
-        with open("analytics_data.json", 'w', encoding='utf-8') as f:
-            json.dump(valid_events, f, indent=2, ensure_ascii=False)
-        
-        print(f"✅ Importados {len(valid_events)} eventos válidos")
+        print(f"✅ Importados {resumo['valid_events']} eventos válidos")
         
         # Executar análise pós-importação
-        analysis = analytics_storage.get_log_info()
+        analysis = await asyncio.to_thread(analytics_storage.get_log_info)
         
         # Sugerir compactação se necessário
         post_import_suggestions = []
@@ -406,7 +525,7 @@ async def import_full_data(request: Request):
         
         # Análise de qualidade dos dados importados
         event_types = analysis.get("event_types", {})
-        total_events = len(valid_events)
+        total_events = resumo["valid_events"]
         
         if event_types:
             most_common = max(event_types, key=event_types.get)
@@ -416,11 +535,9 @@ async def import_full_data(request: Request):
             "success": True,
             "message": f"Dados importados com sucesso!",
             "import_summary": {
-                "total_in_file": len(imported_data),
-                "valid_events": len(valid_events),
-                "invalid_events": invalid_events,
+                **resumo,
                 "backup_created": backup_created,
-                "file_size_kb": round(len(file_content) / 1024, 2)
+                "file_size_kb": round(file_size / 1024, 2)
             },
             "post_import_analysis": {
                 "compaction_score": analysis.get("compaction_score", 0),
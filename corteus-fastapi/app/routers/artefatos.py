@@ -0,0 +1,47 @@
+import asyncio
+
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from app.services.artifact_response import content_disposition
+from app.services.artifact_store import artifact_store, ESTADO_COMPLETO
+from app.services.pacote_service import gerar_pacote_zip, nome_pacote
+
+router = APIRouter()
+
+@router.get("/artefatos/status")
+async def status_artefatos():
+    """Métricas do armazenamento de PDFs gerados (bytes mantidos, despejos, expirações)"""
+    return artifact_store.estatisticas()
+
+@router.get("/artefatos/pacote")
+async def download_pacote(
+    ss: str = Query(..., min_length=1, description="SS dos relatórios"),
+    sk: str = Query(..., min_length=1, description="SK dos relatórios")
+):
+    """Download em ZIP (streaming) de todos os relatórios gerados para uma SS/SK, com manifesto dos planos"""
+    artefatos = artifact_store.listar_por_ss_sk(ss, sk)
+    if not artefatos:
+        raise HTTPException(status_code=404, detail="Nenhum relatório encontrado para esta SS/SK")
+    
+    # Relatórios grandes ainda renderizando: esperar todos juntos pelo documento completo
+    # (a prévia da 1ª página nunca entra no pacote)
+    async def versao_final(artefato):
+        return await artifact_store.aguardar_completo(artefato.artefato_id) if artefato.parcial else artefato
+    
+    artefatos = await asyncio.gather(*(versao_final(a) for a in artefatos))
+    artefatos = [a for a in artefatos if a is not None]
+    if any(a.parcial for a in artefatos):
+        raise HTTPException(status_code=503, detail="Relatórios ainda em processamento", headers={"Retry-After": "5"})
+    
+    # Renderizações que falharam ficam fora do ZIP e são listadas no manifesto
+    completos = [a for a in artefatos if a.estado == ESTADO_COMPLETO]
+    falhas = [a for a in artefatos if a.estado != ESTADO_COMPLETO]
+    if not completos:
+        raise HTTPException(status_code=500, detail="Erro ao gerar os relatórios completos")
+    
+    filename = nome_pacote(ss, sk)
+    return StreamingResponse(
+        gerar_pacote_zip(completos, ss, sk, falhas),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition("attachment", filename)}
+    )
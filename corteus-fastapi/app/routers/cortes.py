@@ -1,16 +1,12 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Request
 from app.models.projeto import ProjetoRequest, CorteResponse
 from app.services.corte_service import CorteService
-import os
-import tempfile
+from app.services.artifact_store import artifact_store, ESTADO_FALHOU
+from app.services.artifact_response import responder_artefato
 
 router = APIRouter()
 corte_service = CorteService()
 
-# Dicionário para armazenar caminhos temporários dos PDFs
-temp_files = {}
-
 @router.post("/cortes/gerar", response_model=CorteResponse)
 async def gerar_corte(request: ProjetoRequest):
     """Gera relatório de corte (automático ou manual)"""
@@ -21,7 +17,7 @@ async def gerar_corte(request: ProjetoRequest):
             if not request.comprimento_barra:
                 raise HTTPException(status_code=400, detail="Comprimento da barra é obrigatório no modo automático")
             
-            caminho_pdf, nome_arquivo = corte_service.processar_corte_automatico(
+            caminho_pdf, nome_arquivo, plano, renderizacao = corte_service.processar_corte_automatico(
                 request.cortes_desejados,
                 request.comprimento_barra,
                 request.ss,
@@ -33,7 +29,7 @@ async def gerar_corte(request: ProjetoRequest):
             if not request.barras_disponiveis:
                 raise HTTPException(status_code=400, detail="Barras disponíveis são obrigatórias no modo manual")
             
-            caminho_pdf, nome_arquivo = corte_service.processar_corte_manual(
+            caminho_pdf, nome_arquivo, plano, renderizacao = corte_service.processar_corte_manual(
                 request.cortes_desejados,
                 request.barras_disponiveis,
                 request.sugestao_emenda,
@@ -45,48 +41,52 @@ async def gerar_corte(request: ProjetoRequest):
         
         print(f"Resultado: caminho={caminho_pdf}, nome={nome_arquivo}")
         
-        # Armazenar o caminho temporário
-        temp_files[nome_arquivo] = caminho_pdf
+        # Registrar o PDF no armazenamento de artefatos (id único por geração).
+        # Relatórios grandes chegam como prévia da 1ª página; o completo substitui o conteúdo ao ficar pronto
+        artefato = artifact_store.publicar(
+            caminho_pdf, nome_arquivo, tipo="RELCRT", ss=request.ss, sk=request.sk,
+            metadados={
+                "projeto": request.projeto,
+                "cod_material": request.cod_material,
+                "modo": request.modo,
+                "plano": plano
+            },
+            renderizacao=renderizacao
+        )
         
         return CorteResponse(
             sucesso=True,
             resultado="Relatório gerado com sucesso",
-            nome_arquivo=nome_arquivo
+            nome_arquivo=nome_arquivo,
+            artefato_id=artefato.artefato_id
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/cortes/download/{nome_arquivo}")
-async def download_corte(nome_arquivo: str):
-    """Download do PDF gerado"""
-    if nome_arquivo not in temp_files:
+@router.get("/cortes/download/{artefato_id}")
+@router.head("/cortes/download/{artefato_id}")
+async def download_corte(artefato_id: str, request: Request):
+    """Download do PDF gerado (suporta Range e requisições condicionais)"""
+    # O download entrega sempre o documento completo, mesmo se ainda estiver renderizando
+    artefato = await artifact_store.aguardar_completo(artefato_id, tipo="RELCRT")
+    if not artefato:
         raise HTTPException(status_code=404, detail="Arquivo não encontrado")
     
-    caminho_pdf = temp_files[nome_arquivo]
+    if artefato.parcial:
+        raise HTTPException(status_code=503, detail="Relatório ainda em processamento", headers={"Retry-After": "5"})
     
-    if not os.path.exists(caminho_pdf):
-        raise HTTPException(status_code=404, detail="Arquivo não encontrado no sistema")
+    if artefato.estado == ESTADO_FALHOU:
+        raise HTTPException(status_code=500, detail="Erro ao gerar o relatório completo")
     
-    return FileResponse(
-        path=caminho_pdf,
-        filename=nome_arquivo,
-        media_type='application/pdf'
-    )
+    return responder_artefato(request, artefato)
 
-@router.get("/cortes/preview/{nome_arquivo}")
-async def preview_corte(nome_arquivo: str):
-    """Preview do PDF gerado no navegador"""
-    if nome_arquivo not in temp_files:
+@router.get("/cortes/preview/{artefato_id}")
+@router.head("/cortes/preview/{artefato_id}")
+async def preview_corte(artefato_id: str, request: Request):
+    """Preview do PDF gerado no navegador (suporta Range e requisições condicionais)"""
+    artefato = artifact_store.obter(artefato_id, tipo="RELCRT")
+    if not artefato:
         raise HTTPException(status_code=404, detail="Arquivo não encontrado")
     
-    caminho_pdf = temp_files[nome_arquivo]
-    
-    if not os.path.exists(caminho_pdf):
-        raise HTTPException(status_code=404, detail="Arquivo não encontrado no sistema")
-    
-    return FileResponse(
-        path=caminho_pdf,
-        media_type='application/pdf',
-        headers={"Content-Disposition": "inline"}
-    )
+    return responder_artefato(request, artefato, inline=True)
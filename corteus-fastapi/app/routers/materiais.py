@@ -1,19 +1,122 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import Dict, Optional
-from app.services.material_service import material_service
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from pydantic import BaseModel, validator
+from typing import Dict, List, Optional
+from app.services.material_service import material_service, CatalogoMateriais, MATERIAIS_CACHE_MAX_AGE
+from app.services.http_cache import etag_confere
+from app.auth import auth_manager
+import asyncio
+import hashlib
 import os
 
 router = APIRouter()
 
+# Máximo de códigos por chamada de validação em lote
+MAX_CODIGOS_LOTE = 500
+
+class ValidarLoteRequest(BaseModel):
+    codigos: List[str]
+
+    @validator('codigos')
+    def validar_codigos(cls, v):
+        if not v:
+            raise ValueError('Informe ao menos um código')
+        if len(v) > MAX_CODIGOS_LOTE:
+            raise ValueError(f'Máximo de {MAX_CODIGOS_LOTE} códigos por lote')
+        return [codigo.strip() for codigo in v]
+
+def _cabecalhos_busca(catalogo: CatalogoMateriais, rota: str, *parametros) -> Dict[str, str]:
+    """
+    ETag e Cache-Control das buscas, calculados sem executar a busca
+
+    O resultado só depende dos parâmetros e da versão do catálogo, então o navegador
+    revalida com If-None-Match e recebe 304 até o CSV mudar. O chamador busca no mesmo
+    `catalogo`: uma recarga no meio da requisição não junta resultado e ETag de versões diferentes.
+    """
+    chave = "|".join([rota, catalogo.versao, *map(str, parametros)])
+    etag = hashlib.sha256(chave.encode("utf-8")).hexdigest()[:32]
+    return {
+        "ETag": f'W/"{etag}"',
+        "Cache-Control": f"public, max-age={MATERIAIS_CACHE_MAX_AGE}"
+    }
+
 @router.get("/materiais/status")
 async def status_materiais():
     """Status da base de dados de materiais (para debug)"""
+    catalogo = material_service.catalogo
     return {
-        "total_materiais": len(material_service.materiais_db),
-        "status": "carregado" if material_service.materiais_db else "vazio",
-        "primeiros_5": dict(list(material_service.materiais_db.items())[:5]) if material_service.materiais_db else {}
+        "total_materiais": material_service.total_materiais(),
+        "status": "carregado" if material_service.carregado else "vazio",
+        "backend": material_service.backend,
+        "versao": catalogo.versao,
+        "origem": catalogo.origem,
+        "carregado_em": catalogo.carregado_em,
+        "primeiros_5": material_service.amostra_materiais(5),
+        "cache": material_service.cache.estatisticas()
     }
 
+@router.get("/materiais/snapshot")
+async def versao_snapshot_materiais(response: Response):
+    """
+    Versão atual do catálogo e URL do snapshot para o autocomplete local
+
+    Consultado pelo navegador para saber se o snapshot que ele tem ainda é o atual;
+    não pode ficar em cache.
+    """
+    response.headers["Cache-Control"] = "no-cache"
+    catalogo = material_service.catalogo
+    disponivel = material_service.snapshot_cliente_disponivel()
+    return {
+        "versao": catalogo.versao,
+        "total_materiais": material_service.total_materiais(),
+        "disponivel": disponivel,
+        "url": f"/api/materiais/snapshot/{catalogo.versao}" if disponivel else None
+    }
+
+@router.get("/materiais/snapshot/{versao}")
+async def baixar_snapshot_materiais(versao: str, request: Request):
+    """
+    Catálogo completo comprimido (brotli ou gzip) de uma versão
+
+    A URL inclui a versão, então a resposta nunca muda e pode ficar no cache do
+    navegador indefinidamente; uma versão que não é mais a atual retorna 404.
+    """
+    if versao != material_service.catalogo.versao:
+        raise HTTPException(status_code=404, detail="Versão do catálogo desatualizada")
+    # Comprimir o catálogo pode levar alguns segundos: fora do event loop
+    snapshot = await asyncio.to_thread(material_service.snapshot_cliente)
+    if snapshot is None or snapshot.versao != versao:
+        raise HTTPException(status_code=404, detail="Snapshot do catálogo indisponível")
+
+    codificacao = snapshot.escolher_codificacao(request.headers.get("accept-encoding", ""))
+    headers = {
+        "ETag": f'"{versao[:32]}-{codificacao}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Vary": "Accept-Encoding"
+    }
+    if etag_confere(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    if codificacao != "identity":
+        headers["Content-Encoding"] = codificacao
+    return Response(content=snapshot.conteudo(codificacao), media_type="application/json", headers=headers)
+
+@router.post("/materiais/recarregar")
+async def recarregar_materiais(request: Request, forcar: bool = False):
+    """Recarrega o catálogo de materiais a partir do CSV (apenas admin)"""
+    if not auth_manager.is_admin_authenticated(request):
+        raise HTTPException(status_code=403, detail="Acesso negado. Autenticação de admin necessária.")
+    try:
+        # Monta o catálogo novo fora do event loop; as buscas seguem na versão atual até a troca
+        atualizado = await asyncio.to_thread(material_service.recarregar, forcar)
+        catalogo = material_service.catalogo
+        return {
+            "atualizado": atualizado,
+            "versao": catalogo.versao,
+            "origem": catalogo.origem,
+            "total_materiais": material_service.total_materiais()
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/materiais/validar/{codigo}")
 async def validar_material(codigo: str):
     """Valida se um código de material existe na base de dados"""
@@ -29,16 +132,38 @@ async def validar_material(codigo: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/materiais/validar-lote")
+async def validar_materiais_lote(dados: ValidarLoteRequest):
+    """Valida vários códigos de material e retorna as descrições em uma única resposta"""
+    try:
+        materiais = material_service.validar_lote(dados.codigos)
+        return {
+            "total": len(materiais),
+            "validos": sum(1 for m in materiais if m["valido"]),
+            "materiais": materiais
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/materiais/buscar")
 async def buscar_materiais(
+    request: Request,
+    response: Response,
     termo: str = Query(..., min_length=1, description="Termo de busca"),
-    limite: int = Query(10, ge=1, le=50, description="Limite de resultados")
+    limite: int = Query(10, ge=1, le=50, description="Limite de resultados"),
+    fuzzy: bool = Query(False, description="Tolerar erros de digitação")
 ):
-    """Busca materiais por código ou descrição"""
+    """Busca materiais por código ou descrição (sem diferenciar acentos)"""
+    catalogo = material_service.catalogo
+    headers = _cabecalhos_busca(catalogo, "buscar", termo, limite, fuzzy)
+    if etag_confere(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     try:
-        resultados = material_service.buscar_materiais(termo, limite)
+        resultados = material_service.buscar_materiais(termo, limite, fuzzy, catalogo)
         return {
             "termo": termo,
+            "fuzzy": fuzzy,
             "total": len(resultados),
             "materiais": resultados
         }
@@ -65,12 +190,20 @@ async def obter_descricao(codigo: str):
 
 @router.get("/materiais/autocomplete")
 async def autocomplete_materiais(
+    request: Request,
+    response: Response,
     q: str = Query(..., min_length=2, description="Query de busca"),
-    limit: int = Query(5, ge=1, le=20, description="Limite de sugestões")
+    limit: int = Query(5, ge=1, le=20, description="Limite de sugestões"),
+    fuzzy: bool = Query(False, description="Tolerar erros de digitação")
 ):
     """Endpoint para autocomplete de materiais"""
+    catalogo = material_service.catalogo
+    headers = _cabecalhos_busca(catalogo, "autocomplete", q, limit, fuzzy)
+    if etag_confere(request, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
     try:
-        resultados = material_service.buscar_materiais(q, limit)
+        resultados = material_service.buscar_materiais(q, limit, fuzzy, catalogo)
         
         # Formato otimizado para autocomplete
         sugestoes = [
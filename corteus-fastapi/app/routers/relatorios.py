@@ -1,20 +1,17 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Request
 from app.models.projeto import MinutaRequest, CorteResponse
 from app.services.corte_service import CorteService
-import os
+from app.services.artifact_store import artifact_store, ESTADO_FALHOU
+from app.services.artifact_response import responder_artefato
 
 router = APIRouter()
 corte_service = CorteService()
 
-# Dicionário para armazenar caminhos temporários dos PDFs
-temp_files = {}
-
 @router.post("/minuta/gerar", response_model=CorteResponse)
 async def gerar_minuta(request: MinutaRequest):
     """Gera relatório de minuta"""
     try:
-        caminho_pdf, nome_arquivo = corte_service.gerar_minuta(
+        caminho_pdf, nome_arquivo, plano, renderizacao = corte_service.gerar_minuta(
             request.cortes_desejados,
             request.ss,
             request.sk,
@@ -22,48 +19,51 @@ async def gerar_minuta(request: MinutaRequest):
             request.projeto
         )
         
-        # Armazenar o caminho temporário
-        temp_files[nome_arquivo] = caminho_pdf
+        # Registrar o PDF no armazenamento de artefatos (id único por geração).
+        # Relatórios grandes chegam como prévia da 1ª página; o completo substitui o conteúdo ao ficar pronto
+        artefato = artifact_store.publicar(
+            caminho_pdf, nome_arquivo, tipo="RELMIN", ss=request.ss, sk=request.sk,
+            metadados={
+                "projeto": request.projeto,
+                "cod_material": request.cod_material,
+                "plano": plano
+            },
+            renderizacao=renderizacao
+        )
         
         return CorteResponse(
             sucesso=True,
             resultado="Relatório de minuta gerado com sucesso",
-            nome_arquivo=nome_arquivo
+            nome_arquivo=nome_arquivo,
+            artefato_id=artefato.artefato_id
         )
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.get("/minuta/download/{nome_arquivo}")
-async def download_minuta(nome_arquivo: str):
-    """Download do PDF de minuta"""
-    if nome_arquivo not in temp_files:
+@router.get("/minuta/download/{artefato_id}")
+@router.head("/minuta/download/{artefato_id}")
+async def download_minuta(artefato_id: str, request: Request):
+    """Download do PDF de minuta (suporta Range e requisições condicionais)"""
+    # O download entrega sempre o documento completo, mesmo se ainda estiver renderizando
+    artefato = await artifact_store.aguardar_completo(artefato_id, tipo="RELMIN")
+    if not artefato:
         raise HTTPException(status_code=404, detail="Arquivo não encontrado")
     
-    caminho_pdf = temp_files[nome_arquivo]
+    if artefato.parcial:
+        raise HTTPException(status_code=503, detail="Relatório ainda em processamento", headers={"Retry-After": "5"})
     
-    if not os.path.exists(caminho_pdf):
-        raise HTTPException(status_code=404, detail="Arquivo não encontrado no sistema")
+    if artefato.estado == ESTADO_FALHOU:
+        raise HTTPException(status_code=500, detail="Erro ao gerar o relatório completo")
     
-    return FileResponse(
-        path=caminho_pdf,
-        filename=nome_arquivo,
-        media_type='application/pdf'
-    )
+    return responder_artefato(request, artefato)
 
-@router.get("/minuta/preview/{nome_arquivo}")
-async def preview_minuta(nome_arquivo: str):
-    """Preview do PDF de minuta no navegador"""
-    if nome_arquivo not in temp_files:
+@router.get("/minuta/preview/{artefato_id}")
+@router.head("/minuta/preview/{artefato_id}")
+async def preview_minuta(artefato_id: str, request: Request):
+    """Preview do PDF de minuta no navegador (suporta Range e requisições condicionais)"""
+    artefato = artifact_store.obter(artefato_id, tipo="RELMIN")
+    if not artefato:
         raise HTTPException(status_code=404, detail="Arquivo não encontrado")
     
-    caminho_pdf = temp_files[nome_arquivo]
-    
-    if not os.path.exists(caminho_pdf):
-        raise HTTPException(status_code=404, detail="Arquivo não encontrado no sistema")
-    
-    return FileResponse(
-        path=caminho_pdf,
-        media_type='application/pdf',
-        headers={"Content-Disposition": "inline"}
-    )
+    return responder_artefato(request, artefato, inline=True)
@@ -0,0 +1,179 @@
+import os
+import re
+import time
+import unicodedata
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Iterator
+from urllib.parse import quote
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+from app.services.artifact_store import Artefato, ESTADO_COMPLETO
+from app.services.http_cache import etag_confere
+
+# Tamanho dos blocos enviados ao cliente
+TAMANHO_BLOCO = 64 * 1024
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+# Caracteres que não podem ir no filename="..." (aspas, barra invertida, controle)
+_FILENAME_INSEGURO_RE = re.compile(r'["\\\x00-\x1f\x7f]')
+
+
+def responder_artefato(request: Request, artefato: Artefato, inline: bool = False) -> Response:
+    """
+    Serve um artefato com suporte a Range (206), ETag/Last-Modified (304) e Cache-Control
+
+    O artefato é imutável, então o sha256 do conteúdo é usado como ETag forte e o
+    navegador pode reutilizar o PDF até o artefato expirar. Visualizadores de PDF
+    que pedem o arquivo em pedaços recebem só os bytes solicitados.
+    """
+    headers = _cabecalhos_cache(artefato)
+    if inline:
+        headers["Content-Disposition"] = "inline"
+        if artefato.parcial:
+            # Prévia da 1ª página: o navegador recarrega até receber o documento completo
+            headers["Refresh"] = "2"
+    else:
+        headers["Content-Disposition"] = content_disposition("attachment", artefato.nome_arquivo)
+
+    if _nao_modificado(request, artefato, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        # Abrir já aqui: se o artefato for despejado durante o envio, o descritor continua válido
+        arquivo = open(artefato.caminho, "rb")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Arquivo não encontrado no sistema")
+
+    tamanho = os.fstat(arquivo.fileno()).st_size
+    intervalo = _intervalo_solicitado(request, headers["ETag"], artefato, tamanho)
+
+    if intervalo == "invalido":
+        arquivo.close()
+        headers["Content-Range"] = f"bytes */{tamanho}"
+        return Response(status_code=416, headers=headers)
+
+    if intervalo:
+        inicio, fim = intervalo
+        status_code = 206
+        headers["Content-Range"] = f"bytes {inicio}-{fim}/{tamanho}"
+    else:
+        inicio, fim = 0, tamanho - 1
+        status_code = 200
+    headers["Content-Length"] = str(fim - inicio + 1)
+
+    if request.method == "HEAD":
+        arquivo.close()
+        return Response(status_code=status_code, headers=headers, media_type="application/pdf")
+
+    return StreamingResponse(
+        _ler_intervalo(arquivo, inicio, fim),
+        status_code=status_code,
+        headers=headers,
+        media_type="application/pdf"
+    )
+
+
+def content_disposition(disposicao: str, nome_arquivo: str) -> str:
+    """
+    Content-Disposition com nome de arquivo livre (o nome inclui o projeto digitado)
+
+    Os cabeçalhos são codificados em latin-1: filename="..." recebe uma versão ASCII
+    do nome e, se ela for diferente, filename* (RFC 5987) leva o nome original em UTF-8.
+    """
+    ascii_ = unicodedata.normalize("NFKD", nome_arquivo).encode("ascii", "ignore").decode("ascii")
+    ascii_ = _FILENAME_INSEGURO_RE.sub("_", ascii_)
+    cabecalho = f'{disposicao}; filename="{ascii_}"'
+    if ascii_ != nome_arquivo:
+        cabecalho += f"; filename*=utf-8''{quote(nome_arquivo, safe='')}"
+    return cabecalho
+
+
+def _cabecalhos_cache(artefato: Artefato) -> dict:
+    restante = max(0, int(artefato.expira_em - time.time()))
+    if artefato.estado != ESTADO_COMPLETO:
+        # A prévia será substituída pelo documento completo no mesmo id (ou ficou só a
+        # prévia de uma renderização que falhou): sempre revalidar
+        cache_control = "no-cache"
+    else:
+        # Conteúdo completo de um id nunca muda: o navegador não precisa revalidar enquanto o artefato existir
+        cache_control = f"private, max-age={restante}, immutable"
+    return {
+        "ETag": f'"{artefato.sha256 or artefato.artefato_id}"',
+        "Last-Modified": formatdate(artefato.modificado_em, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+        "X-Artefato-Estado": artefato.estado
+    }
+
+
+def _nao_modificado(request: Request, artefato: Artefato, etag: str) -> bool:
+    """Avalia If-None-Match (prioritário) e If-Modified-Since"""
+    if request.headers.get("if-none-match") is not None:
+        return etag_confere(request, etag)
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            desde = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(artefato.modificado_em) <= desde
+    return False
+
+
+def _intervalo_solicitado(request: Request, etag: str, artefato: Artefato, tamanho: int):
+    """Retorna (inicio, fim) para um Range válido, None para resposta completa ou "invalido" (416)"""
+    cabecalho = request.headers.get("range")
+    if not cabecalho:
+        return None
+
+    # If-Range: só atende o Range se o cliente ainda tiver a mesma versão
+    if_range = request.headers.get("if-range")
+    if if_range and not _if_range_confere(if_range.strip(), etag, artefato):
+        return None
+
+    match = _RANGE_RE.match(cabecalho.strip())
+    if not match:
+        # Múltiplos intervalos ou unidade desconhecida: a RFC permite responder o arquivo inteiro
+        return None
+
+    inicio_str, fim_str = match.groups()
+    if not inicio_str and not fim_str:
+        return None
+
+    if not inicio_str:
+        # Sufixo: últimos N bytes
+        sufixo = int(fim_str)
+        if sufixo == 0 or tamanho == 0:
+            return "invalido"
+        return max(0, tamanho - sufixo), tamanho - 1
+
+    inicio = int(inicio_str)
+    fim = int(fim_str) if fim_str else tamanho - 1
+    if inicio >= tamanho or fim < inicio:
+        return "invalido"
+    return inicio, min(fim, tamanho - 1)
+
+
+def _if_range_confere(if_range: str, etag: str, artefato: Artefato) -> bool:
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        # If-Range exige comparação forte
+        return if_range == etag
+    try:
+        return int(artefato.modificado_em) <= parsedate_to_datetime(if_range).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+def _ler_intervalo(arquivo, inicio: int, fim: int) -> Iterator[bytes]:
+    with arquivo:
+        arquivo.seek(inicio)
+        restante = fim - inicio + 1
+        while restante > 0:
+            bloco = arquivo.read(min(TAMANHO_BLOCO, restante))
+            if not bloco:
+                break
+            restante -= len(bloco)
+            yield bloco
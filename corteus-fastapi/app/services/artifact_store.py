@@ -0,0 +1,470 @@
+import asyncio
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+from decouple import config
+
+# Configurações do armazenamento de artefatos (PDFs gerados)
+ARTIFACT_DIR = config("ARTIFACT_DIR", default=os.path.join(tempfile.gettempdir(), "corteus_artefatos"))
+ARTIFACT_TTL_SECONDS = config("ARTIFACT_TTL_SECONDS", default=3600, cast=int)  # 1 hora
+ARTIFACT_MAX_BYTES = config("ARTIFACT_MAX_BYTES", default=200 * 1024 * 1024, cast=int)  # 200 MB
+ARTIFACT_SWEEP_INTERVAL = config("ARTIFACT_SWEEP_INTERVAL", default=60, cast=int)  # segundos
+# Prazo da renderização completa: uma prévia "parcial" mais antiga que isso é dada como
+# falha (o worker que renderizava pode ter reiniciado sem concluir)
+ARTIFACT_RENDER_TIMEOUT = config("ARTIFACT_RENDER_TIMEOUT", default=300, cast=int)  # segundos
+
+# Versão do esquema do índice; artefatos são temporários, então um esquema antigo é simplesmente recriado
+SCHEMA_VERSION = 5
+
+# Estados de um artefato: pré-visualização publicada enquanto o documento completo é renderizado
+ESTADO_COMPLETO = "completo"
+ESTADO_PARCIAL = "parcial"
+ESTADO_FALHOU = "falhou"
+
+# Arquivos órfãos (sem registro no índice) só são apagados após esta idade, para não
+# remover um arquivo que outro worker acabou de mover e ainda vai registrar
+ORPHAN_GRACE_SECONDS = 300
+
+# Leituras só regravam ultimo_acesso (ordem do LRU) se o registro tiver mais que esta idade:
+# os pedaços de um PDF pedidos com Range não viram uma transação de escrita cada um
+TOQUE_LRU_SEGUNDOS = 30
+
+
+class Artefato:
+    """Metadados de um arquivo gerado e mantido pelo ArtifactStore"""
+
+    def __init__(self, artefato_id: str, caminho: str, nome_arquivo: str, tipo: str,
+                 tamanho: int, criado_em: float, expira_em: float,
+                 ss: str = "", sk: str = "", metadados: Optional[Dict[str, object]] = None,
+                 sha256: str = "", estado: str = ESTADO_COMPLETO, modificado_em: Optional[float] = None):
+        self.artefato_id = artefato_id
+        self.caminho = caminho
+        self.nome_arquivo = nome_arquivo
+        self.tipo = tipo
+        self.tamanho = tamanho
+        self.criado_em = criado_em
+        # Última troca de conteúdo (prévia → completo): base do Last-Modified
+        self.modificado_em = modificado_em if modificado_em is not None else criado_em
+        self.expira_em = expira_em
+        self.ss = ss
+        self.sk = sk
+        # Dados do relatório (projeto, material, texto do plano de corte...)
+        self.metadados = metadados or {}
+        # Hash do conteúdo: o artefato é imutável, então serve de ETag forte
+        self.sha256 = sha256
+        self.estado = estado
+
+    @property
+    def parcial(self) -> bool:
+        return self.estado == ESTADO_PARCIAL
+
+    def expirado(self, agora: Optional[float] = None) -> bool:
+        return (agora or time.time()) >= self.expira_em
+
+
+class ArtifactStore:
+    """
+    Armazenamento de PDFs temporários compartilhado entre workers
+
+    Os arquivos ficam em um diretório de conteúdo e os metadados em um índice SQLite
+    no mesmo diretório, então qualquer processo (uvicorn/gunicorn com vários workers)
+    consegue servir um artefato gerado por outro. A publicação é atômica: o arquivo é
+    gravado em tmp/, sincronizado em disco, renomeado para objetos/ e só então
+    registrado no índice dentro de uma transação.
+    """
+
+    def __init__(
+        self,
+        diretorio: str = ARTIFACT_DIR,
+        ttl_segundos: int = ARTIFACT_TTL_SECONDS,
+        max_bytes: int = ARTIFACT_MAX_BYTES,
+        intervalo_limpeza: int = ARTIFACT_SWEEP_INTERVAL,
+        timeout_renderizacao: int = ARTIFACT_RENDER_TIMEOUT
+    ):
+        self.diretorio = diretorio
+        self.diretorio_objetos = os.path.join(diretorio, "objetos")
+        self.diretorio_tmp = os.path.join(diretorio, "tmp")
+        self.caminho_indice = os.path.join(diretorio, "indice.sqlite3")
+        os.makedirs(self.diretorio_objetos, exist_ok=True)
+        os.makedirs(self.diretorio_tmp, exist_ok=True)
+
+        self.ttl_segundos = ttl_segundos
+        self.max_bytes = max_bytes
+        self.intervalo_limpeza = intervalo_limpeza
+        self.timeout_renderizacao = timeout_renderizacao
+
+        # Uma conexão SQLite por thread (handlers async + threads de limpeza)
+        self._local = threading.local()
+        self._criar_esquema()
+
+    def publicar(self, caminho_origem: str, nome_arquivo: str, tipo: str,
+                 ttl_segundos: Optional[int] = None, ss: str = "", sk: str = "",
+                 metadados: Optional[Dict[str, object]] = None,
+                 renderizacao: Optional[Future] = None) -> Artefato:
+        """
+        Move o arquivo para o store e registra um artefato com id único
+
+        Se `renderizacao` for informada, o arquivo é uma pré-visualização: o artefato fica
+        "parcial" até o Future entregar o PDF completo, que substitui o conteúdo no mesmo id.
+        """
+        artefato_id = uuid.uuid4().hex
+        ss, sk = self._normalizar_ss_sk(ss, sk)
+        destino = self._caminho_objeto(artefato_id)
+        sha256 = self._gravar_atomicamente(caminho_origem, destino)
+
+        agora = time.time()
+        artefato = Artefato(
+            artefato_id=artefato_id,
+            caminho=destino,
+            nome_arquivo=nome_arquivo,
+            tipo=tipo,
+            tamanho=os.path.getsize(destino),
+            criado_em=agora,
+            modificado_em=agora,
+            expira_em=agora + (ttl_segundos if ttl_segundos is not None else self.ttl_segundos),
+            ss=ss,
+            sk=sk,
+            metadados=metadados,
+            sha256=sha256,
+            estado=ESTADO_PARCIAL if renderizacao is not None else ESTADO_COMPLETO
+        )
+
+        conn = self._conexao()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "INSERT INTO artefatos (artefato_id, nome_arquivo, tipo, tamanho, criado_em, modificado_em, expira_em, "
+                "ultimo_acesso, ss, sk, metadados, sha256, estado) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (artefato_id, nome_arquivo, tipo, artefato.tamanho, agora, agora, artefato.expira_em, agora,
+                 ss, sk, json.dumps(artefato.metadados, ensure_ascii=False), sha256, artefato.estado)
+            )
+            self._incrementar_metrica(conn, "publicados")
+            removidos = self._despejar_excedente(conn, manter=artefato_id)
+
+        self._apagar_arquivos(removidos)
+
+        if renderizacao is not None:
+            # Executa imediatamente se a renderização já terminou
+            renderizacao.add_done_callback(lambda futuro: self._concluir_renderizacao(artefato_id, futuro))
+        return artefato
+
+    def substituir_conteudo(self, artefato_id: str, caminho_origem: str) -> bool:
+        """Troca atomicamente o conteúdo de um artefato (pré-visualização → documento completo)"""
+        conn = self._conexao()
+        row = conn.execute("SELECT modificado_em FROM artefatos WHERE artefato_id = ?", (artefato_id,)).fetchone()
+        if row is None:
+            # Artefato expirou ou foi despejado antes de a renderização terminar
+            os.remove(caminho_origem)
+            return False
+        # Last-Modified tem resolução de segundos: o conteúdo novo precisa cair em um segundo
+        # posterior ao da prévia, senão If-Modified-Since/If-Range com a data da prévia confeririam
+        modificado_em = max(time.time(), int(row[0]) + 1)
+
+        destino = self._caminho_objeto(artefato_id)
+        # Primeiro o arquivo, depois o índice: quem ler o conteúdo novo com o ETag antigo
+        # apenas revalida depois; o contrário deixaria a prévia em cache com o ETag final
+        sha256 = self._gravar_atomicamente(caminho_origem, destino)
+        tamanho = os.path.getsize(destino)
+
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            atualizado = conn.execute(
+                "UPDATE artefatos SET tamanho = ?, sha256 = ?, estado = ?, modificado_em = ? WHERE artefato_id = ?",
+                (tamanho, sha256, ESTADO_COMPLETO, modificado_em, artefato_id)
+            ).rowcount > 0
+            removidos = self._despejar_excedente(conn, manter=artefato_id) if atualizado else []
+
+        if not atualizado:
+            removidos.append(artefato_id)
+        self._apagar_arquivos(removidos)
+        return atualizado
+
+    async def aguardar_completo(self, artefato_id: str, tipo: Optional[str] = None,
+                                timeout: float = 60.0) -> Optional[Artefato]:
+        """Espera um artefato parcial ficar completo (a renderização pode estar em outro worker)"""
+        limite = time.monotonic() + timeout
+        artefato = self.obter(artefato_id, tipo)
+        while artefato is not None and artefato.parcial and time.monotonic() < limite:
+            await asyncio.sleep(0.25)
+            # Polling só de leitura: o acesso já foi registrado na primeira consulta
+            artefato = self.obter(artefato_id, tipo, registrar_acesso=False)
+        return artefato
+
+    def _concluir_renderizacao(self, artefato_id: str, futuro: Future):
+        try:
+            self.substituir_conteudo(artefato_id, futuro.result())
+        except Exception as e:
+            print(f"Erro na renderização completa do artefato {artefato_id}: {e}")
+            conn = self._conexao()
+            with conn:
+                conn.execute("UPDATE artefatos SET estado = ? WHERE artefato_id = ?", (ESTADO_FALHOU, artefato_id))
+
+    def obter(self, artefato_id: str, tipo: Optional[str] = None,
+              registrar_acesso: bool = True) -> Optional[Artefato]:
+        """
+        Retorna o artefato se existir e não estiver expirado
+
+        Com `registrar_acesso`, marca o artefato como usado recentemente (no máximo uma
+        escrita a cada TOQUE_LRU_SEGUNDOS por artefato).
+        """
+        conn = self._conexao()
+        row = conn.execute(
+            f"SELECT {self._COLUNAS}, ultimo_acesso FROM artefatos WHERE artefato_id = ?",
+            (artefato_id,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        *colunas, ultimo_acesso = row
+        artefato = self._artefato_da_linha(colunas)
+        agora = time.time()
+        if artefato.expirado(agora):
+            with conn:
+                conn.execute("BEGIN IMMEDIATE")
+                if conn.execute("DELETE FROM artefatos WHERE artefato_id = ?", (artefato_id,)).rowcount:
+                    self._incrementar_metrica(conn, "expirados")
+            self._apagar_arquivos([artefato_id])
+            return None
+
+        if registrar_acesso and agora - ultimo_acesso >= TOQUE_LRU_SEGUNDOS:
+            with conn:
+                conn.execute("UPDATE artefatos SET ultimo_acesso = ? WHERE artefato_id = ?", (agora, artefato_id))
+
+        if tipo and artefato.tipo != tipo:
+            return None
+        return artefato
+
+    def listar_por_ss_sk(self, ss: str, sk: str) -> List[Artefato]:
+        """Artefatos válidos de uma SS/SK, mantendo só a geração mais recente de cada nome de arquivo"""
+        ss, sk = self._normalizar_ss_sk(ss, sk)
+        conn = self._conexao()
+        rows = conn.execute(
+            f"SELECT {self._COLUNAS} FROM artefatos WHERE ss = ? AND sk = ? AND expira_em > ? ORDER BY criado_em",
+            (ss, sk, time.time())
+        ).fetchall()
+
+        por_nome = {}
+        for row in rows:
+            artefato = self._artefato_da_linha(row)
+            por_nome[artefato.nome_arquivo] = artefato
+        return sorted(por_nome.values(), key=lambda a: (a.tipo, a.nome_arquivo))
+
+    def remover(self, artefato_id: str) -> bool:
+        """Remove um artefato e apaga seu arquivo"""
+        conn = self._conexao()
+        with conn:
+            removido = conn.execute("DELETE FROM artefatos WHERE artefato_id = ?", (artefato_id,)).rowcount > 0
+        if removido:
+            self._apagar_arquivos([artefato_id])
+        return removido
+
+    def limpar_expirados(self) -> int:
+        """
+        Remove todos os artefatos expirados e retorna quantos foram apagados
+
+        Também grava como falha as prévias cuja renderização completa passou do prazo.
+        """
+        conn = self._conexao()
+        agora = time.time()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE artefatos SET estado = ? WHERE estado = ? AND criado_em <= ?",
+                (ESTADO_FALHOU, ESTADO_PARCIAL, agora - self.timeout_renderizacao)
+            )
+            expirados = [row[0] for row in conn.execute(
+                "SELECT artefato_id FROM artefatos WHERE expira_em <= ?", (agora,)
+            )]
+            conn.executemany("DELETE FROM artefatos WHERE artefato_id = ?", [(aid,) for aid in expirados])
+            if expirados:
+                self._incrementar_metrica(conn, "expirados", len(expirados))
+
+        self._apagar_arquivos(expirados)
+        self._limpar_orfaos()
+        return len(expirados)
+
+    async def executar_limpeza_periodica(self):
+        """Loop de limpeza em segundo plano (iniciado no startup da aplicação)"""
+        while True:
+            await asyncio.sleep(self.intervalo_limpeza)
+            try:
+                removidos = await asyncio.to_thread(self.limpar_expirados)
+                if removidos:
+                    print(f"Limpeza de artefatos: {removidos} arquivos expirados removidos")
+            except Exception as e:
+                print(f"Erro na limpeza de artefatos: {e}")
+
+    def estatisticas(self) -> Dict[str, object]:
+        """Métricas do armazenamento de artefatos (compartilhadas entre workers)"""
+        conn = self._conexao()
+        total, bytes_armazenados = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(tamanho), 0) FROM artefatos"
+        ).fetchone()
+        metricas = dict(conn.execute("SELECT chave, valor FROM metricas").fetchall())
+        return {
+            "artefatos": total,
+            "bytes_armazenados": bytes_armazenados,
+            "max_bytes": self.max_bytes,
+            "ttl_segundos": self.ttl_segundos,
+            "total_publicados": metricas.get("publicados", 0),
+            "total_despejados": metricas.get("despejados", 0),
+            "total_expirados": metricas.get("expirados", 0)
+        }
+
+    def _despejar_excedente(self, conn: sqlite3.Connection, manter: str) -> list:
+        """Despeja os artefatos menos usados até caber no limite (dentro da transação)"""
+        bytes_armazenados = conn.execute("SELECT COALESCE(SUM(tamanho), 0) FROM artefatos").fetchone()[0]
+        if bytes_armazenados <= self.max_bytes:
+            return []
+
+        removidos = []
+        for artefato_id, tamanho in conn.execute(
+            "SELECT artefato_id, tamanho FROM artefatos WHERE artefato_id != ? ORDER BY ultimo_acesso",
+            (manter,)
+        ).fetchall():
+            if bytes_armazenados <= self.max_bytes:
+                break
+            removidos.append(artefato_id)
+            bytes_armazenados -= tamanho
+
+        conn.executemany("DELETE FROM artefatos WHERE artefato_id = ?", [(aid,) for aid in removidos])
+        if removidos:
+            self._incrementar_metrica(conn, "despejados", len(removidos))
+        return removidos
+
+    def _gravar_atomicamente(self, caminho_origem: str, destino: str) -> str:
+        """Copia para tmp/, faz fsync e renomeia: leitores nunca veem um arquivo parcial. Retorna o sha256"""
+        parcial = os.path.join(self.diretorio_tmp, f"{os.path.basename(destino)}.{os.getpid()}.part")
+        try:
+            shutil.move(caminho_origem, parcial)
+            digest = hashlib.sha256()
+            with open(parcial, "rb") as f:
+                for bloco in iter(lambda: f.read(64 * 1024), b""):
+                    digest.update(bloco)
+                os.fsync(f.fileno())
+            os.replace(parcial, destino)
+            return digest.hexdigest()
+        except Exception:
+            if os.path.exists(parcial):
+                os.remove(parcial)
+            raise
+
+    def _limpar_orfaos(self):
+        """Remove arquivos sem registro no índice (ex.: worker encerrado no meio da publicação)"""
+        limite = time.time() - max(ORPHAN_GRACE_SECONDS, self.ttl_segundos)
+        conn = self._conexao()
+        for diretorio in (self.diretorio_objetos, self.diretorio_tmp):
+            for nome in os.listdir(diretorio):
+                caminho = os.path.join(diretorio, nome)
+                try:
+                    if os.path.getmtime(caminho) >= limite:
+                        continue
+                    artefato_id = nome.split(".", 1)[0]
+                    if diretorio == self.diretorio_objetos and conn.execute(
+                        "SELECT 1 FROM artefatos WHERE artefato_id = ?", (artefato_id,)
+                    ).fetchone():
+                        continue
+                    os.remove(caminho)
+                except FileNotFoundError:
+                    continue
+
+    def _apagar_arquivos(self, artefato_ids: list):
+        for artefato_id in artefato_ids:
+            try:
+                os.remove(self._caminho_objeto(artefato_id))
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Erro ao apagar artefato {artefato_id}: {e}")
+
+    @staticmethod
+    def _normalizar_ss_sk(ss: str, sk: str):
+        # A minuta não passa pelo validador que converte a SK para maiúsculas
+        return (ss or "").strip(), (sk or "").strip().upper()
+
+    def _caminho_objeto(self, artefato_id: str) -> str:
+        return os.path.join(self.diretorio_objetos, f"{artefato_id}.pdf")
+
+    _COLUNAS = ("artefato_id, nome_arquivo, tipo, tamanho, criado_em, modificado_em, expira_em, "
+                "ss, sk, metadados, sha256, estado")
+
+    def _artefato_da_linha(self, row) -> Artefato:
+        (artefato_id, nome_arquivo, tipo, tamanho, criado_em, modificado_em, expira_em,
+         ss, sk, metadados, sha256, estado) = row
+        if estado == ESTADO_PARCIAL and time.time() - criado_em >= self.timeout_renderizacao:
+            # Renderização abandonada, mesmo que a limpeza ainda não a tenha gravado como falha
+            estado = ESTADO_FALHOU
+        return Artefato(
+            artefato_id=artefato_id,
+            caminho=self._caminho_objeto(artefato_id),
+            nome_arquivo=nome_arquivo,
+            tipo=tipo,
+            tamanho=tamanho,
+            criado_em=criado_em,
+            modificado_em=modificado_em,
+            expira_em=expira_em,
+            ss=ss,
+            sk=sk,
+            metadados=json.loads(metadados) if metadados else {},
+            sha256=sha256,
+            estado=estado
+        )
+
+    def _incrementar_metrica(self, conn: sqlite3.Connection, chave: str, quantidade: int = 1):
+        conn.execute(
+            "INSERT INTO metricas (chave, valor) VALUES (?, ?) "
+            "ON CONFLICT(chave) DO UPDATE SET valor = valor + excluded.valor",
+            (chave, quantidade)
+        )
+
+    def _conexao(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: transações controladas explicitamente com BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.caminho_indice, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _criar_esquema(self):
+        conn = self._conexao()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+                conn.execute("DROP TABLE IF EXISTS artefatos")
+                conn.execute("DROP TABLE IF EXISTS metricas")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS artefatos (
+                    artefato_id TEXT PRIMARY KEY,
+                    nome_arquivo TEXT NOT NULL,
+                    tipo TEXT NOT NULL,
+                    tamanho INTEGER NOT NULL,
+                    criado_em REAL NOT NULL,
+                    modificado_em REAL NOT NULL,
+                    expira_em REAL NOT NULL,
+                    ultimo_acesso REAL NOT NULL,
+                    ss TEXT NOT NULL DEFAULT '',
+                    sk TEXT NOT NULL DEFAULT '',
+                    metadados TEXT NOT NULL DEFAULT '{}',
+                    sha256 TEXT NOT NULL DEFAULT '',
+                    estado TEXT NOT NULL DEFAULT 'completo'
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_artefatos_expira_em ON artefatos (expira_em)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_artefatos_ultimo_acesso ON artefatos (ultimo_acesso)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_artefatos_ss_sk ON artefatos (ss, sk)")
+            conn.execute("CREATE TABLE IF NOT EXISTS metricas (chave TEXT PRIMARY KEY, valor INTEGER NOT NULL)")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+# Instância global do armazenamento de artefatos
+artifact_store = ArtifactStore()
@@ -1,6 +1,7 @@
 import tempfile
 import os
-from typing import List, Tuple
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Tuple
 
 # Importar suas funções existentes da pasta Modulação
 from Modulação.cortes import (
@@ -18,6 +19,12 @@ from Modulação.pdf_utils import gerar_pdf as gerar_pdf_func
 from Modulação.utils import parse_entrada
 from app.services.material_service import material_service
 
+# Relatórios com mais linhas que isso (~3 páginas) saem primeiro como pré-visualização da 1ª página
+LINHAS_RENDERIZACAO_INCREMENTAL = 120
+
+# Renderização completa dos relatórios grandes, fora da requisição
+_executor_renderizacao = ThreadPoolExecutor(max_workers=2, thread_name_prefix="corteus-pdf")
+
 class FakeVar:
     def __init__(self, value):
         self.value = value
@@ -36,8 +43,8 @@ class CorteService:
         sk: str, 
         cod_material: str,
         projeto: str
-    ) -> Tuple[str, str]:
-        """Processa corte no modo automático"""
+    ) -> Tuple[str, str, str, Optional[Future]]:
+        """Processa corte no modo automático (retorna PDF, nome do arquivo, texto do plano e renderização pendente)"""
         
         agrupados = agrupar_cortes(cortes)
         resultado = resolver_com_barras_livres(
@@ -51,9 +58,9 @@ class CorteService:
         
         # Gerar PDF
         nome_arquivo = self._gerar_nome_arquivo("RELCRT", cod_material, projeto, ss, sk)
-        caminho_pdf = self._gerar_pdf_temporario(resultado, ss, sk, cod_material, projeto, "RELATÓRIO DE CORTES")
+        caminho_pdf, renderizacao = self._gerar_pdf_temporario(resultado, ss, sk, cod_material, projeto, "RELATÓRIO DE CORTES")
         
-        return caminho_pdf, nome_arquivo
+        return caminho_pdf, nome_arquivo, resultado, renderizacao
 
     def processar_corte_manual(
         self,
@@ -64,8 +71,8 @@ class CorteService:
         sk: str,
         cod_material: str,
         projeto: str
-    ) -> Tuple[str, str]:
-        """Processa corte no modo manual"""
+    ) -> Tuple[str, str, str, Optional[Future]]:
+        """Processa corte no modo manual (retorna PDF, nome do arquivo, texto do plano e renderização pendente)"""
         
         agrupados = agrupar_cortes(cortes)
         if sugestao_emenda:
@@ -90,9 +97,9 @@ class CorteService:
             )
         
         nome_arquivo = self._gerar_nome_arquivo("RELCRT", cod_material, projeto, ss, sk)
-        caminho_pdf = self._gerar_pdf_temporario(resultado, ss, sk, cod_material, projeto, "RELATÓRIO DE CORTES")
+        caminho_pdf, renderizacao = self._gerar_pdf_temporario(resultado, ss, sk, cod_material, projeto, "RELATÓRIO DE CORTES")
         
-        return caminho_pdf, nome_arquivo
+        return caminho_pdf, nome_arquivo, resultado, renderizacao
 
     def gerar_minuta(
         self,
@@ -101,15 +108,15 @@ class CorteService:
         sk: str,
         cod_material: str,
         projeto: str
-    ) -> Tuple[str, str]:
-        """Gera relatório de minuta"""
+    ) -> Tuple[str, str, str, Optional[Future]]:
+        """Gera relatório de minuta (retorna PDF, nome do arquivo, texto da minuta e renderização pendente)"""
         
         texto = gerar_texto_minuta_para_pdf(cortes, ss, sk, cod_material)
         
         nome_arquivo = self._gerar_nome_arquivo("RELMIN", cod_material, projeto, ss, sk)
-        caminho_pdf = self._gerar_pdf_temporario(texto, ss, sk, cod_material, projeto, "RELATÓRIO DE MINUTA")
+        caminho_pdf, renderizacao = self._gerar_pdf_temporario(texto, ss, sk, cod_material, projeto, "RELATÓRIO DE MINUTA")
         
-        return caminho_pdf, nome_arquivo
+        return caminho_pdf, nome_arquivo, texto, renderizacao
 
     def _gerar_nome_arquivo(self, prefixo: str, cod_material: str, projeto: str, ss: str, sk: str) -> str:
         """Gera nome do arquivo PDF"""
@@ -119,11 +126,16 @@ class CorteService:
         sk_nome = sk.replace("-", "_")
         return f"{prefixo}{ultimos4}_{projeto_nome}_SS{ss_nome}_{sk_nome}.pdf"
 
-    def _gerar_pdf_temporario(self, conteudo: str, ss: str, sk: str, cod_material: str, projeto: str, titulo: str) -> str:
-        """Gera PDF temporário e retorna o caminho"""
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
-            tmp_path = tmp.name
+    def _gerar_pdf_temporario(
+        self, conteudo: str, ss: str, sk: str, cod_material: str, projeto: str, titulo: str
+    ) -> Tuple[str, Optional[Future]]:
+        """
+        Gera PDF temporário e retorna o caminho
 
+        Para relatórios grandes, o caminho retornado é uma pré-visualização só com a
+        primeira página, e o Future resolve para o caminho do PDF completo, renderizado
+        em segundo plano a partir do mesmo texto (sem resolver os cortes de novo).
+        """
         campos = [
             ("Projeto:", projeto),
             ("SS:", ss),
@@ -134,6 +146,22 @@ class CorteService:
         # Obter descrição do material
         descricao_material = material_service.obter_descricao_material(cod_material)
         
-        gerar_pdf_func(tmp_path, conteudo, campos, titulo=titulo, descricao_material=descricao_material)
+        if len(conteudo.splitlines()) <= LINHAS_RENDERIZACAO_INCREMENTAL:
+            return self._renderizar(conteudo, campos, titulo, descricao_material), None
+        
+        caminho_preview = self._renderizar(conteudo, campos, titulo, descricao_material, max_paginas=1)
+        renderizacao = _executor_renderizacao.submit(
+            self._renderizar, conteudo, campos, titulo, descricao_material
+        )
+        return caminho_preview, renderizacao
+
+    def _renderizar(self, conteudo: str, campos: list, titulo: str, descricao_material: Optional[str],
+                    max_paginas: Optional[int] = None) -> str:
+        """Renderiza o PDF em um arquivo temporário e retorna o caminho"""
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+            tmp_path = tmp.name
+        
+        gerar_pdf_func(tmp_path, conteudo, campos, titulo=titulo, descricao_material=descricao_material,
+                       max_paginas=max_paginas)
         
         return tmp_path
@@ -0,0 +1,13 @@
+from fastapi import Request
+
+
+def etag_confere(request: Request, etag: str) -> bool:
+    """Verifica se o If-None-Match da requisição já contém o ETag atual (resposta 304)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is None:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Comparação fraca (RFC 9110): W/"x" e "x" representam a mesma versão
+    candidatos = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return etag.removeprefix("W/") in candidatos
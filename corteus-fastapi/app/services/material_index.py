@@ -0,0 +1,293 @@
+import re
+import unicodedata
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Ordem do ranking dos resultados
+RANK_CODIGO_EXATO = 0
+RANK_PREFIXO_CODIGO = 1
+RANK_INICIO_PALAVRA = 2
+RANK_SUBSTRING = 3
+
+SEPARADORES_PALAVRAS = re.compile(r"[\W_]+")
+
+# Busca aproximada (fuzzy): similaridade mínima de trigramas entre palavras, quantas
+# variantes parecidas cada palavra da consulta pode ter e quantos materiais cada
+# variante contribui. Os dois limites mantêm a latência previsível em catálogos grandes.
+SIMILARIDADE_MINIMA = 0.3
+MAX_PALAVRAS_PARECIDAS = 20
+MAX_MATERIAIS_POR_PALAVRA = 5000
+
+# Atributos que definem o índice, gravados no snapshot do catálogo
+_CAMPOS_ESTADO = (
+    "codigos", "descricoes", "_codigos_norm", "_descricoes_norm",
+    "_posicao_codigo", "_vocabulario", "_palavras", "_trigramas",
+    "_trigramas_vocabulario", "_tamanho_palavras"
+)
+
+
+def normalizar(texto: str) -> str:
+    """Forma normalizada usada no índice e nas consultas: minúsculas e sem acentos (AÇO -> aco)"""
+    texto = texto.strip().lower()
+    if texto.isascii():
+        return texto
+    decomposto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in decomposto if not unicodedata.combining(c))
+
+
+def trigramas(texto: str) -> set:
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+
+def trigramas_palavra(palavra: str) -> set:
+    """Trigramas de uma palavra com bordas marcadas, como no pg_trgm ("  ca", " cab", ...)"""
+    return trigramas(f"  {palavra} ")
+
+
+def similaridade(comuns: int, tamanho_a: int, tamanho_b: int) -> float:
+    """Similaridade de Jaccard entre dois conjuntos de trigramas"""
+    return comuns / (tamanho_a + tamanho_b - comuns) if comuns else 0.0
+
+
+def inicio_de_palavra(texto: str, consulta: str) -> bool:
+    """Verifica se a consulta aparece no texto começando em uma palavra"""
+    posicao = texto.find(consulta)
+    while posicao != -1:
+        if posicao == 0 or not texto[posicao - 1].isalnum():
+            return True
+        posicao = texto.find(consulta, posicao + 1)
+    return False
+
+
+def buscar_aproximados(indice, consulta: str, limite: int, excluidos: Iterable[int]) -> List[int]:
+    """
+    Ids dos materiais mais parecidos com a consulta, tolerando acentos e erros de digitação
+
+    Cada palavra da consulta com 3+ caracteres é trocada pelas palavras mais parecidas do
+    vocabulário ("cantonera" -> "cantoneira"); o material precisa conter uma variante de
+    cada palavra e é pontuado pela soma das similaridades. Palavras curtas ("3", "x")
+    precisam aparecer como início de palavra. Funciona com qualquer backend que ofereça
+    palavras_parecidas, ids_com_palavra e descricao_normalizada.
+    """
+    palavras = [p for p in SEPARADORES_PALAVRAS.split(consulta) if p]
+    longas = [p for p in palavras if len(p) >= 3]
+    curtas = [p for p in palavras if len(p) < 3]
+    if not longas or limite <= 0:
+        return []
+
+    pontuacao: Optional[Dict[int, float]] = None
+    for palavra in longas:
+        melhores: Dict[int, float] = {}
+        for variante, nota in indice.palavras_parecidas(palavra):
+            for i in indice.ids_com_palavra(variante, MAX_MATERIAIS_POR_PALAVRA):
+                if pontuacao is not None and i not in pontuacao:
+                    continue
+                if nota > melhores.get(i, 0.0):
+                    melhores[i] = nota
+        pontuacao = melhores if pontuacao is None else {i: pontuacao[i] + n for i, n in melhores.items()}
+        if not pontuacao:
+            return []
+
+    excluidos = set(excluidos)
+    resultado = []
+    for i in sorted(pontuacao, key=lambda i: (-pontuacao[i], i)):
+        if i in excluidos:
+            continue
+        if curtas:
+            descricao = indice.descricao_normalizada(i)
+            if not all(inicio_de_palavra(descricao, p) for p in curtas):
+                continue
+        resultado.append(i)
+        if len(resultado) >= limite:
+            break
+    return resultado
+
+
+class MaterialIndex:
+    """
+    Catálogo de materiais em memória com índice de busca, construído uma vez no carregamento
+
+    - códigos ordenados para busca de prefixo por bisseção
+    - vocabulário ordenado de palavras das descrições (prefixo de palavra)
+    - índice invertido de trigramas sobre código e descrição (substring)
+    - índice de trigramas do vocabulário (palavras parecidas, busca aproximada)
+
+    Tudo é indexado na forma normalizada (minúsculas, sem acentos).
+
+    Cada material é identificado por um inteiro: sua posição na lista ordenada de
+    códigos, então as listas de postings já saem ordenadas por código.
+    """
+
+    def __init__(self, materiais: Dict[str, str]):
+        self.codigos: List[str] = sorted(materiais)
+        self.descricoes: List[str] = [materiais[c] for c in self.codigos]
+        self._codigos_norm: List[str] = [normalizar(c) for c in self.codigos]
+        self._descricoes_norm: List[str] = [normalizar(d) for d in self.descricoes]
+        self._posicao_codigo: Dict[str, int] = {c: i for i, c in enumerate(self._codigos_norm)}
+
+        palavras: Dict[str, List[int]] = {}
+        postings: Dict[str, List[int]] = {}
+        for i, (codigo, descricao) in enumerate(zip(self._codigos_norm, self._descricoes_norm)):
+            for palavra in set(p for p in SEPARADORES_PALAVRAS.split(descricao) if p):
+                palavras.setdefault(palavra, []).append(i)
+            for tri in trigramas(codigo) | trigramas(descricao):
+                postings.setdefault(tri, []).append(i)
+
+        self._vocabulario: List[str] = sorted(palavras)
+        self._palavras = palavras
+        self._trigramas = postings
+
+        # Trigramas com bordas de cada palavra do vocabulário -> posições no vocabulário
+        trigramas_vocabulario: Dict[str, List[int]] = {}
+        self._tamanho_palavras: List[int] = []
+        for posicao, palavra in enumerate(self._vocabulario):
+            tris = trigramas_palavra(palavra)
+            self._tamanho_palavras.append(len(tris))
+            for tri in tris:
+                trigramas_vocabulario.setdefault(tri, []).append(posicao)
+        self._trigramas_vocabulario = trigramas_vocabulario
+
+    def __len__(self) -> int:
+        return len(self.codigos)
+
+    def obter_descricao(self, codigo: str) -> Optional[str]:
+        posicao = bisect_left(self.codigos, codigo)
+        if posicao < len(self.codigos) and self.codigos[posicao] == codigo:
+            return self.descricoes[posicao]
+        return None
+
+    def contem(self, codigo: str) -> bool:
+        return self.obter_descricao(codigo) is not None
+
+    def obter_descricoes(self, codigos: Iterable[str]) -> Dict[str, str]:
+        """
+        Descrições dos códigos existentes, em uma passada pela lista ordenada
+
+        Os códigos pedidos são ordenados e procurados em sequência: cada busca binária
+        começa onde a anterior parou, então o catálogo é percorrido uma vez, só para frente.
+        """
+        descricoes = {}
+        posicao = 0
+        for codigo in sorted(set(codigos)):
+            posicao = bisect_left(self.codigos, codigo, posicao)
+            if posicao == len(self.codigos):
+                break
+            if self.codigos[posicao] == codigo:
+                descricoes[codigo] = self.descricoes[posicao]
+        return descricoes
+
+    def amostra(self, quantidade: int) -> List[Tuple[str, str]]:
+        return list(zip(self.codigos[:quantidade], self.descricoes[:quantidade]))
+
+    def listar_codigos(self) -> List[str]:
+        return list(self.codigos)
+
+    def exportar(self) -> dict:
+        """Estado do índice em tipos simples (str, int, list, dict), serializável com marshal"""
+        return {campo: getattr(self, campo) for campo in _CAMPOS_ESTADO}
+
+    @classmethod
+    def restaurar(cls, estado: dict) -> "MaterialIndex":
+        """Recria o índice a partir de exportar() sem reprocessar o catálogo"""
+        indice = cls.__new__(cls)
+        for campo in _CAMPOS_ESTADO:
+            setattr(indice, campo, estado[campo])
+        return indice
+
+    def buscar(self, termo: str, limite: int = 10, fuzzy: bool = False) -> List[Tuple[str, str]]:
+        """
+        Busca ranqueada: código exato, prefixo de código, início de palavra na descrição
+        e, por fim, substring em qualquer posição (termos com 3+ caracteres)
+
+        Com fuzzy=True, vagas que sobrarem são preenchidas pela busca aproximada.
+        """
+        consulta = normalizar(termo)
+        if not consulta or limite <= 0:
+            return []
+
+        encontrados: Dict[int, int] = {}
+
+        exato = self._posicao_codigo.get(consulta)
+        if exato is not None:
+            encontrados[exato] = RANK_CODIGO_EXATO
+
+        # Prefixos curtos ("1") casam com milhares de códigos: só os primeiros interessam
+        prefixo = self._prefixo_codigo(consulta)
+        for i in prefixo[:limite + 1]:
+            encontrados.setdefault(i, RANK_PREFIXO_CODIGO)
+
+        # Códigos já bastam para preencher o limite: não precisa olhar descrições
+        if len(encontrados) < limite:
+            # Candidatos em ordem de código: com `limite` inícios de palavra o resto não entra
+            melhores = len(encontrados)
+            substrings = 0
+            for i in self._candidatos_descricao(consulta):
+                if i in encontrados:
+                    continue
+                descricao = self._descricoes_norm[i]
+                if inicio_de_palavra(descricao, consulta):
+                    encontrados[i] = RANK_INICIO_PALAVRA
+                    melhores += 1
+                    if melhores >= limite:
+                        break
+                elif substrings < limite and len(consulta) >= 3 and (
+                        consulta in descricao or consulta in self._codigos_norm[i]):
+                    encontrados[i] = RANK_SUBSTRING
+                    substrings += 1
+
+        ordenados = sorted(encontrados, key=lambda i: (encontrados[i], i))[:limite]
+        if fuzzy and len(ordenados) < limite:
+            ordenados += buscar_aproximados(self, consulta, limite - len(ordenados), encontrados)
+        return [(self.codigos[i], self.descricoes[i]) for i in ordenados]
+
+    def palavras_parecidas(self, palavra: str) -> List[Tuple[str, float]]:
+        """Palavras do vocabulário mais parecidas com `palavra`, com a similaridade"""
+        alvo = trigramas_palavra(palavra)
+        comuns: Dict[int, int] = {}
+        for tri in alvo:
+            for posicao in self._trigramas_vocabulario.get(tri, ()):
+                comuns[posicao] = comuns.get(posicao, 0) + 1
+
+        parecidas = []
+        for posicao, quantidade in comuns.items():
+            nota = similaridade(quantidade, len(alvo), self._tamanho_palavras[posicao])
+            if nota >= SIMILARIDADE_MINIMA:
+                parecidas.append((nota, self._vocabulario[posicao]))
+        parecidas.sort(key=lambda par: (-par[0], par[1]))
+        return [(p, nota) for nota, p in parecidas[:MAX_PALAVRAS_PARECIDAS]]
+
+    def ids_com_palavra(self, palavra: str, limite: int) -> List[int]:
+        return self._palavras.get(palavra, [])[:limite]
+
+    def descricao_normalizada(self, i: int) -> str:
+        return self._descricoes_norm[i]
+
+    def _prefixo_codigo(self, consulta: str) -> range:
+        inicio = bisect_left(self._codigos_norm, consulta)
+        fim = bisect_left(self._codigos_norm, consulta + "\uffff", lo=inicio)
+        return range(inicio, fim)
+
+    def _candidatos_descricao(self, consulta: str) -> List[int]:
+        """Materiais que podem conter a consulta (verificados depois pelo chamador)"""
+        if len(consulta) >= 3:
+            listas = [self._trigramas.get(t) for t in trigramas(consulta)]
+            if not all(listas):
+                return []
+            listas.sort(key=len)
+            candidatos = set(listas[0])
+            for lista in listas[1:]:
+                candidatos.intersection_update(lista)
+                if not candidatos:
+                    break
+            return sorted(candidatos)
+
+        # Consultas curtas: apenas descrições com uma palavra que começa com o termo
+        palavras = [p for p in SEPARADORES_PALAVRAS.split(consulta) if p]
+        if not palavras:
+            return []
+        candidatos = set()
+        posicao = bisect_left(self._vocabulario, palavras[0])
+        while posicao < len(self._vocabulario) and self._vocabulario[posicao].startswith(palavras[0]):
+            candidatos.update(self._palavras[self._vocabulario[posicao]])
+            posicao += 1
+        return sorted(candidatos)
@@ -0,0 +1,340 @@
+import os
+import sqlite3
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.services.material_index import (
+    RANK_CODIGO_EXATO, RANK_PREFIXO_CODIGO, RANK_INICIO_PALAVRA, RANK_SUBSTRING,
+    SEPARADORES_PALAVRAS, SIMILARIDADE_MINIMA, MAX_PALAVRAS_PARECIDAS,
+    buscar_aproximados, inicio_de_palavra, normalizar, similaridade, trigramas, trigramas_palavra
+)
+
+# Muda quando o esquema do banco muda; bancos antigos são reconstruídos a partir do CSV
+FORMATO_BANCO = 2
+
+# Linhas inseridas por executemany durante a construção
+TAMANHO_LOTE = 10000
+
+# Códigos por consulta IN na validação em lote (abaixo do limite de parâmetros do SQLite)
+TAMANHO_BLOCO_IN = 500
+
+# Candidatos do índice de trigramas examinados antes de recorrer ao índice de palavras
+EXAMINAR_TRIGRAMAS = 1000
+
+_ESQUEMA = """
+CREATE TABLE meta (chave TEXT PRIMARY KEY, valor TEXT NOT NULL);
+CREATE TABLE materiais (
+    id INTEGER PRIMARY KEY,
+    codigo TEXT NOT NULL UNIQUE,
+    codigo_norm TEXT NOT NULL,
+    descricao TEXT NOT NULL,
+    descricao_norm TEXT NOT NULL
+);
+CREATE INDEX idx_materiais_codigo_norm ON materiais(codigo_norm);
+CREATE VIRTUAL TABLE materiais_palavras USING fts5(
+    descricao_norm, content='materiais', content_rowid='id', tokenize='unicode61 remove_diacritics 0',
+    prefix='1 2'
+);
+CREATE VIRTUAL TABLE materiais_trigramas USING fts5(
+    codigo_norm, descricao_norm, content='materiais', content_rowid='id', tokenize='trigram', detail='none'
+);
+CREATE TABLE vocabulario (id INTEGER PRIMARY KEY, palavra TEXT NOT NULL UNIQUE, n_trigramas INTEGER NOT NULL);
+CREATE TABLE vocabulario_trigramas (
+    trigrama TEXT NOT NULL,
+    palavra_id INTEGER NOT NULL,
+    PRIMARY KEY (trigrama, palavra_id)
+) WITHOUT ROWID;
+"""
+
+
+class MaterialIndexSQLite:
+    """
+    Catálogo de materiais em um arquivo SQLite somente leitura, com índices FTS5
+
+    Para catálogos grandes (item master completo do ERP): os materiais ficam em disco e
+    só as páginas consultadas entram em memória, compartilhadas entre workers pelo cache
+    do sistema operacional. Tem a mesma interface e o mesmo ranking de MaterialIndex:
+
+    - códigos normalizados com índice B-tree (exato e prefixo)
+    - FTS5 trigram sobre código e descrição (início de palavra e substring, 3+ caracteres)
+    - FTS5 unicode61 com índice de prefixos sobre a descrição (consultas de 1-2 caracteres)
+    - vocabulário com trigramas por palavra (palavras parecidas, busca aproximada)
+
+    Os índices usam as formas normalizadas (minúsculas, sem acentos) de código e descrição.
+
+    Os ids seguem a ordem dos códigos, então os resultados do FTS já saem ordenados
+    e a busca pode parar assim que tiver resultados suficientes.
+    """
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        # Uma conexão por thread (handlers async + threads do watcher)
+        self._local = threading.local()
+        meta = dict(self._conexao().execute("SELECT chave, valor FROM meta"))
+        self.versao = meta.get("versao", "")
+        self.formato = int(meta.get("formato", 0))
+        self._total = int(meta.get("total", 0))
+
+    @classmethod
+    def abrir(cls, caminho: str, versao: str) -> Optional["MaterialIndexSQLite"]:
+        """Abre um banco já construído, se existir e corresponder à versão do CSV"""
+        if not os.path.exists(caminho):
+            return None
+        indice = cls(caminho)
+        if indice.formato != FORMATO_BANCO or indice.versao != versao:
+            return None
+        return indice
+
+    @classmethod
+    def construir(cls, linhas: Iterable[Tuple[str, str]], destino: str, versao: str) -> "MaterialIndexSQLite":
+        """
+        Constrói o banco a partir de pares (código, descrição) sem carregá-los em memória
+
+        O arquivo é montado em um temporário no mesmo diretório e renomeado ao final,
+        então outro worker nunca abre um banco pela metade.
+        """
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(destino), suffix=".tmp")
+        os.close(fd)
+        try:
+            con = sqlite3.connect(tmp)
+            try:
+                con.executescript("PRAGMA journal_mode=OFF; PRAGMA synchronous=OFF;" + _ESQUEMA)
+                # Códigos repetidos: vale a última linha, como no catálogo em memória
+                con.execute(
+                    "CREATE TEMP TABLE carga (codigo TEXT PRIMARY KEY, codigo_norm TEXT, descricao TEXT, descricao_norm TEXT)"
+                )
+                lote = []
+                for codigo, descricao in linhas:
+                    lote.append((codigo, normalizar(codigo), descricao, normalizar(descricao)))
+                    if len(lote) >= TAMANHO_LOTE:
+                        con.executemany("INSERT OR REPLACE INTO carga VALUES (?, ?, ?, ?)", lote)
+                        lote.clear()
+                con.executemany("INSERT OR REPLACE INTO carga VALUES (?, ?, ?, ?)", lote)
+
+                con.execute("""
+                    INSERT INTO materiais (codigo, codigo_norm, descricao, descricao_norm)
+                    SELECT codigo, codigo_norm, descricao, descricao_norm FROM carga ORDER BY codigo
+                """)
+                con.execute("DROP TABLE carga")
+                cls._construir_vocabulario(con)
+                con.execute("INSERT INTO materiais_palavras(materiais_palavras) VALUES ('rebuild')")
+                con.execute("INSERT INTO materiais_trigramas(materiais_trigramas) VALUES ('rebuild')")
+                con.execute("INSERT INTO materiais_palavras(materiais_palavras) VALUES ('optimize')")
+                con.execute("INSERT INTO materiais_trigramas(materiais_trigramas) VALUES ('optimize')")
+                total = con.execute("SELECT COUNT(*) FROM materiais").fetchone()[0]
+                con.executemany("INSERT INTO meta VALUES (?, ?)", [
+                    ("formato", str(FORMATO_BANCO)), ("versao", versao), ("total", str(total))
+                ])
+                con.commit()
+            finally:
+                con.close()
+            os.replace(tmp, destino)
+        except BaseException:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+        return cls(destino)
+
+    @staticmethod
+    def _construir_vocabulario(con: sqlite3.Connection):
+        # Só o vocabulário (palavras distintas) passa pela memória, não o catálogo
+        vocabulario = set()
+        for (descricao_norm,) in con.execute("SELECT descricao_norm FROM materiais"):
+            vocabulario.update(p for p in SEPARADORES_PALAVRAS.split(descricao_norm) if p)
+
+        linhas = []
+        for palavra_id, palavra in enumerate(sorted(vocabulario), start=1):
+            linhas.append((palavra_id, palavra, trigramas_palavra(palavra)))
+        con.executemany(
+            "INSERT INTO vocabulario VALUES (?, ?, ?)",
+            ((palavra_id, palavra, len(tris)) for palavra_id, palavra, tris in linhas)
+        )
+        con.executemany(
+            "INSERT INTO vocabulario_trigramas VALUES (?, ?)",
+            ((tri, palavra_id) for palavra_id, _, tris in linhas for tri in tris)
+        )
+
+    def _conexao(self) -> sqlite3.Connection:
+        con = getattr(self._local, "con", None)
+        if con is None:
+            # O arquivo nunca muda depois de publicado: immutable dispensa locks e checagens
+            uri = Path(self.caminho).resolve().as_uri() + "?mode=ro&immutable=1"
+            con = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._local.con = con
+        return con
+
+    def __len__(self) -> int:
+        return self._total
+
+    def obter_descricao(self, codigo: str) -> Optional[str]:
+        linha = self._conexao().execute(
+            "SELECT descricao FROM materiais WHERE codigo = ?", (codigo,)
+        ).fetchone()
+        return linha[0] if linha else None
+
+    def contem(self, codigo: str) -> bool:
+        return self.obter_descricao(codigo) is not None
+
+    def obter_descricoes(self, codigos: Iterable[str]) -> Dict[str, str]:
+        """Descrições dos códigos existentes, com uma consulta IN por bloco de códigos"""
+        codigos = list(dict.fromkeys(codigos))
+        con = self._conexao()
+        descricoes = {}
+        for inicio in range(0, len(codigos), TAMANHO_BLOCO_IN):
+            bloco = codigos[inicio:inicio + TAMANHO_BLOCO_IN]
+            marcadores = ", ".join("?" * len(bloco))
+            descricoes.update(con.execute(
+                f"SELECT codigo, descricao FROM materiais WHERE codigo IN ({marcadores})", bloco
+            ))
+        return descricoes
+
+    def amostra(self, quantidade: int) -> List[Tuple[str, str]]:
+        return self._conexao().execute(
+            "SELECT codigo, descricao FROM materiais ORDER BY id LIMIT ?", (quantidade,)
+        ).fetchall()
+
+    def listar_codigos(self) -> List[str]:
+        return [linha[0] for linha in self._conexao().execute("SELECT codigo FROM materiais ORDER BY id")]
+
+    def buscar(self, termo: str, limite: int = 10, fuzzy: bool = False) -> List[Tuple[str, str]]:
+        """Mesma busca ranqueada de MaterialIndex.buscar, resolvida por consultas indexadas"""
+        consulta = normalizar(termo)
+        if not consulta or limite <= 0:
+            return []
+
+        con = self._conexao()
+        # id -> (rank, código, descrição)
+        encontrados: Dict[int, Tuple[int, str, str]] = {}
+
+        linha = con.execute(
+            "SELECT id, codigo, descricao FROM materiais WHERE codigo_norm = ? ORDER BY id DESC LIMIT 1",
+            (consulta,)
+        ).fetchone()
+        if linha:
+            encontrados[linha[0]] = (RANK_CODIGO_EXATO, linha[1], linha[2])
+
+        for id_, codigo, descricao in con.execute(
+            "SELECT id, codigo, descricao FROM materiais WHERE codigo_norm >= ? AND codigo_norm < ? "
+            "ORDER BY codigo_norm LIMIT ?",
+            (consulta, consulta + "\uffff", limite + 1)
+        ):
+            encontrados.setdefault(id_, (RANK_PREFIXO_CODIGO, codigo, descricao))
+
+        if len(encontrados) < limite:
+            if len(consulta) >= 3:
+                self._buscar_descricoes(con, consulta, limite, encontrados)
+            else:
+                self._buscar_palavras_curtas(con, consulta, limite, encontrados)
+
+        ordenados = sorted(encontrados, key=lambda i: (encontrados[i][0], i))[:limite]
+        resultado = [encontrados[i][1:] for i in ordenados]
+        if fuzzy and len(resultado) < limite:
+            for id_ in buscar_aproximados(self, consulta, limite - len(resultado), encontrados):
+                resultado.append(con.execute("SELECT codigo, descricao FROM materiais WHERE id = ?", (id_,)).fetchone())
+        return resultado
+
+    def palavras_parecidas(self, palavra: str) -> List[Tuple[str, float]]:
+        """Palavras do vocabulário mais parecidas com `palavra`, com a similaridade"""
+        alvo = trigramas_palavra(palavra)
+        marcadores = ", ".join("?" * len(alvo))
+        parecidas = []
+        for candidata, comuns, tamanho in self._conexao().execute(
+            f"SELECT v.palavra, COUNT(*), v.n_trigramas FROM vocabulario_trigramas t "
+            f"JOIN vocabulario v ON v.id = t.palavra_id WHERE t.trigrama IN ({marcadores}) "
+            f"GROUP BY t.palavra_id",
+            tuple(alvo)
+        ):
+            nota = similaridade(comuns, len(alvo), tamanho)
+            if nota >= SIMILARIDADE_MINIMA:
+                parecidas.append((nota, candidata))
+        parecidas.sort(key=lambda par: (-par[0], par[1]))
+        return [(p, nota) for nota, p in parecidas[:MAX_PALAVRAS_PARECIDAS]]
+
+    def ids_com_palavra(self, palavra: str, limite: int) -> List[int]:
+        try:
+            return [linha[0] for linha in self._conexao().execute(
+                "SELECT rowid FROM materiais_palavras WHERE materiais_palavras MATCH ? ORDER BY rowid LIMIT ?",
+                ('"' + palavra.replace('"', '""') + '"', limite)
+            )]
+        except sqlite3.OperationalError:
+            return []
+
+    def descricao_normalizada(self, id_: int) -> str:
+        linha = self._conexao().execute("SELECT descricao_norm FROM materiais WHERE id = ?", (id_,)).fetchone()
+        return linha[0] if linha else ""
+
+    def _buscar_descricoes(self, con: sqlite3.Connection, consulta: str, limite: int,
+                           encontrados: Dict[int, Tuple[int, str, str]]):
+        """
+        Início de palavra e substring em uma passada pelo índice de trigramas
+
+        Os candidatos saem em ordem de código: a passada termina assim que houver inícios
+        de palavra suficientes, e só os primeiros `limite` de substring são guardados.
+        Se a consulta casa com muitas substrings e poucos inícios de palavra ("ubo" em
+        "tubo"), depois de EXAMINAR_TRIGRAMAS candidatos os inícios de palavra restantes
+        são buscados direto no índice de palavras.
+        """
+        # Cada trigrama é um termo isolado (detail=none não guarda posições); a substring é confirmada aqui
+        consulta_fts = " AND ".join('"' + t.replace('"', '""') + '"' for t in sorted(trigramas(consulta)))
+        palavras = [p for p in SEPARADORES_PALAVRAS.split(consulta) if p]
+        # Só dá para achar o início de palavra pelos tokens se a consulta começar com letra/dígito
+        usar_palavras = bool(palavras) and consulta[0].isalnum()
+
+        melhores = len(encontrados)
+        substrings = 0
+        examinados = 0
+        for id_, codigo, descricao, codigo_norm, descricao_norm in self._candidatos(
+                con, "materiais_trigramas", consulta_fts):
+            examinados += 1
+            if id_ in encontrados:
+                continue
+            if inicio_de_palavra(descricao_norm, consulta):
+                encontrados[id_] = (RANK_INICIO_PALAVRA, codigo, descricao)
+                melhores += 1
+                if melhores >= limite:
+                    return
+            elif substrings < limite and (consulta in descricao_norm or consulta in codigo_norm):
+                encontrados[id_] = (RANK_SUBSTRING, codigo, descricao)
+                substrings += 1
+            if usar_palavras and substrings >= limite and examinados >= EXAMINAR_TRIGRAMAS:
+                break
+        else:
+            return
+
+        # Substrings já completas; faltam inícios de palavra em qualquer ponto do catálogo
+        consulta_palavras = '"' + " ".join(palavras) + '"*'
+        for id_, codigo, descricao, _, descricao_norm in self._candidatos(con, "materiais_palavras", consulta_palavras):
+            if id_ in encontrados or not inicio_de_palavra(descricao_norm, consulta):
+                continue
+            encontrados[id_] = (RANK_INICIO_PALAVRA, codigo, descricao)
+            melhores += 1
+            if melhores >= limite:
+                return
+
+    def _buscar_palavras_curtas(self, con: sqlite3.Connection, consulta: str, limite: int,
+                                encontrados: Dict[int, Tuple[int, str, str]]):
+        """Consultas de 1-2 caracteres: só início de palavra, pelo índice de prefixos"""
+        palavras = [p for p in SEPARADORES_PALAVRAS.split(consulta) if p]
+        if not palavras:
+            return
+        # Em até 2 caracteres cabe uma única palavra, coberta pelo prefix='1 2' da tabela
+        for id_, codigo, descricao, _, descricao_norm in self._candidatos(con, "materiais_palavras", f'"{palavras[0]}"*'):
+            if id_ in encontrados or not inicio_de_palavra(descricao_norm, consulta):
+                continue
+            encontrados[id_] = (RANK_INICIO_PALAVRA, codigo, descricao)
+            if len(encontrados) >= limite:
+                return
+
+    def _candidatos(self, con: sqlite3.Connection, tabela: str, consulta_fts: str) -> Iterator[tuple]:
+        try:
+            yield from con.execute(
+                f"SELECT m.id, m.codigo, m.descricao, m.codigo_norm, m.descricao_norm FROM {tabela} f "
+                f"JOIN materiais m ON m.id = f.rowid WHERE {tabela} MATCH ? ORDER BY f.rowid",
+                (consulta_fts,)
+            )
+        except sqlite3.OperationalError:
+            return
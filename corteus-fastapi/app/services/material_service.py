@@ -1,79 +1,353 @@
+import asyncio
 import csv
+import hashlib
+import marshal
 import os
-from typing import Dict, Optional
+import tempfile
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from decouple import config
+from app.services.material_index import MaterialIndex, normalizar
+from app.services.material_index_sqlite import MaterialIndexSQLite
+from app.services.material_snapshot import SnapshotCliente, gerar_snapshot_cliente
+from app.services.result_cache import CacheLRU
+
+# Catálogo de materiais e snapshot compilado (gerado a partir do CSV)
+NOME_CSV_MATERIAIS = "materiais_unidade_M_descresumida.csv"
+MATERIAIS_CSV = config("MATERIAIS_CSV", default="")  # caminho explícito; vazio = procurar NOME_CSV_MATERIAIS
+MATERIAIS_SNAPSHOT_DIR = config("MATERIAIS_SNAPSHOT_DIR", default=os.path.join(tempfile.gettempdir(), "corteus_materiais"))
+MATERIAIS_RELOAD_INTERVAL = config("MATERIAIS_RELOAD_INTERVAL", default=30, cast=int)  # segundos; 0 desativa
+# "memoria": índice em dicts Python (catálogos pequenos); "sqlite": arquivo SQLite + FTS5 (item master completo)
+MATERIAIS_BACKEND = config("MATERIAIS_BACKEND", default="memoria")
+BACKENDS_MATERIAIS = ("memoria", "sqlite")
+# Resultados de busca/autocomplete mantidos em memória por versão do catálogo; 0 desativa
+MATERIAIS_CACHE_ITENS = config("MATERIAIS_CACHE_ITENS", default=2048, cast=int)
+MATERIAIS_CACHE_MAX_AGE = config("MATERIAIS_CACHE_MAX_AGE", default=300, cast=int)  # segundos de cache no navegador
+# Catálogos até este tamanho são enviados inteiros ao navegador para autocomplete local; 0 desativa
+MATERIAIS_SNAPSHOT_CLIENTE_MAX = config("MATERIAIS_SNAPSHOT_CLIENTE_MAX", default=200000, cast=int)
+
+# Muda quando o formato do snapshot ou do índice muda; snapshots antigos são ignorados
+FORMATO_SNAPSHOT = 2
+
+
+class CatalogoMateriais:
+    """
+    Versão imutável do catálogo: índice (backend em memória ou SQLite), versão e origem
+
+    O conteúdo nunca é alterado depois de criado; a recarga monta um catálogo novo e troca a
+    referência em MaterialService de uma vez, então cada requisição vê uma versão inteira.
+    """
+
+    def __init__(self, indice: "IndiceMateriais", versao: str = "", caminho_csv: Optional[str] = None,
+                 assinatura: Optional[tuple] = None, origem: str = "vazio"):
+        self.indice = indice
+        # sha256 do CSV: identifica a versão do catálogo e o snapshot correspondente
+        self.versao = versao
+        self.caminho_csv = caminho_csv
+        # (tamanho, mtime_ns) do CSV, para detectar alterações sem reler o arquivo
+        self.assinatura = assinatura
+        self.origem = origem
+        self.carregado_em = time.time()
+
+
+IndiceMateriais = Union[MaterialIndex, MaterialIndexSQLite]
+
 
 class MaterialService:
-    def __init__(self):
-        self.materiais_db = {}
-        self._carregar_materiais()
-    
-    def _carregar_materiais(self):
-        """Carrega a base de dados de materiais do CSV"""
+    def __init__(self, diretorio_snapshot: str = MATERIAIS_SNAPSHOT_DIR,
+                 intervalo_recarga: int = MATERIAIS_RELOAD_INTERVAL,
+                 backend: str = MATERIAIS_BACKEND, cache_itens: int = MATERIAIS_CACHE_ITENS):
+        if backend not in BACKENDS_MATERIAIS:
+            raise ValueError(f"MATERIAIS_BACKEND inválido: {backend!r} (use {' ou '.join(BACKENDS_MATERIAIS)})")
+        self.backend = backend
+        self.diretorio_snapshot = diretorio_snapshot
+        self.intervalo_recarga = intervalo_recarga
+        # Serializa recargas (watcher e endpoint de admin); leituras não usam lock
+        self._lock_recarga = threading.Lock()
+        self._aviso_base_vazia = False
+        self.cache = CacheLRU(cache_itens)
+        self._snapshot_cliente: Optional[SnapshotCliente] = None
+        self._lock_snapshot_cliente = threading.Lock()
+        self.catalogo = self._carregar_catalogo(self._localizar_csv())
+
+    @property
+    def indice(self) -> IndiceMateriais:
+        return self.catalogo.indice
+
+    @property
+    def carregado(self) -> bool:
+        return len(self.catalogo.indice) > 0
+
+    def _localizar_csv(self) -> Optional[str]:
+        """Procura o CSV de materiais nos caminhos conhecidos"""
+        if MATERIAIS_CSV:
+            return os.path.abspath(MATERIAIS_CSV) if os.path.exists(MATERIAIS_CSV) else None
+
         # Usar caminho relativo ao arquivo atual
         current_dir = os.path.dirname(os.path.abspath(__file__))
-        
+
         # Tentar diferentes caminhos possíveis
         possible_paths = [
-            os.path.join(current_dir, '..', '..', 'materiais_unidade_M_descresumida.csv'),  # Pasta raiz do projeto
-            os.path.join(current_dir, '..', '..', '..', 'materiais_unidade_M_descresumida.csv'),  # Raiz do workspace
-            "./materiais_unidade_M_descresumida.csv",  # Diretório atual da aplicação
-            "../materiais_unidade_M_descresumida.csv",  # Um nível acima
-            "materiais_unidade_M_descresumida.csv",  # Diretório de execução
+            os.path.join(current_dir, '..', '..', NOME_CSV_MATERIAIS),  # Pasta raiz do projeto
+            os.path.join(current_dir, '..', '..', '..', NOME_CSV_MATERIAIS),  # Raiz do workspace
+            f"./{NOME_CSV_MATERIAIS}",  # Diretório atual da aplicação
+            f"../{NOME_CSV_MATERIAIS}",  # Um nível acima
+            NOME_CSV_MATERIAIS,  # Diretório de execução
         ]
-        
-        csv_path = None
+
         for path in possible_paths:
             abs_path = os.path.abspath(path)
             if os.path.exists(abs_path):
-                csv_path = abs_path
-                break
-        
+                return abs_path
+
+        print(f"Arquivo CSV não encontrado em nenhum dos caminhos: {[os.path.abspath(p) for p in possible_paths]}")
+        return None
+
+    def _carregar_catalogo(self, csv_path: Optional[str]) -> CatalogoMateriais:
+        """Carrega o catálogo do snapshot compilado ou, se estiver desatualizado, do CSV"""
         if not csv_path:
-            print(f"Arquivo CSV não encontrado em nenhum dos caminhos: {[os.path.abspath(p) for p in possible_paths]}")
-            return
-        
+            return CatalogoMateriais(MaterialIndex({}))
+
+        try:
+            assinatura = _assinatura_arquivo(csv_path)
+            versao = _hash_arquivo(csv_path)
+        except OSError as e:
+            print(f"Erro ao carregar materiais: {e}")
+            print("Continuando sem base de materiais (validação básica)")
+            return CatalogoMateriais(MaterialIndex({}))
+
+        indice = self._ler_snapshot(versao)
+        if indice is not None:
+            print(f"Carregados {len(indice)} materiais do snapshot {versao[:12]}")
+            return CatalogoMateriais(indice, versao, csv_path, assinatura, origem="snapshot")
+
         print(f"Carregando materiais de: {csv_path}")
-        
         try:
-            with open(csv_path, 'r', encoding='utf-8') as file:
-                reader = csv.DictReader(file, delimiter=';')
-                for row in reader:
-                    codigo = row['Código'].strip('"')
-                    descricao = row['Descrição Resumida'].strip('"')
-                    self.materiais_db[codigo] = descricao
-            
-            print(f"Carregados {len(self.materiais_db)} materiais da base de dados")
-            
+            indice = self._construir_indice(csv_path, versao)
         except Exception as e:
             print(f"Erro ao carregar materiais: {e}")
             print("Continuando sem base de materiais (validação básica)")
-    
+            return CatalogoMateriais(MaterialIndex({}))
+
+        print(f"Carregados {len(indice)} materiais da base de dados")
+        return CatalogoMateriais(indice, versao, csv_path, assinatura, origem="csv")
+
+    def recarregar(self, forcar: bool = False) -> bool:
+        """
+        Reconstrói o catálogo se o CSV mudou e troca a versão em uso atomicamente
+
+        Roda fora do caminho das requisições (thread do watcher ou endpoint de admin);
+        enquanto o catálogo novo é montado, as buscas continuam usando o anterior.
+        Retorna True se uma nova versão entrou em uso.
+        """
+        with self._lock_recarga:
+            atual = self.catalogo
+            csv_path = self._localizar_csv()
+            if not csv_path:
+                return False
+
+            assinatura = _assinatura_arquivo(csv_path)
+            if not forcar and csv_path == atual.caminho_csv and assinatura == atual.assinatura:
+                return False
+
+            if not forcar and _hash_arquivo(csv_path) == atual.versao:
+                # Arquivo tocado ou movido sem mudar o conteúdo: só atualiza a origem
+                atual.caminho_csv = csv_path
+                atual.assinatura = assinatura
+                return False
+
+            novo = self._carregar_catalogo(csv_path)
+            if not len(novo.indice) and len(atual.indice):
+                # CSV ilegível ou vazio (ex.: ainda sendo copiado): mantém a versão anterior
+                print("Recarga de materiais ignorada: novo catálogo vazio")
+                return False
+
+            self.catalogo = novo
+            # As chaves já incluem a versão; limpar só libera a memória da versão anterior
+            self.cache.limpar()
+            self._snapshot_cliente = None
+            print(f"Catálogo de materiais atualizado para a versão {novo.versao[:12]}")
+            return True
+
+    async def monitorar_alteracoes(self):
+        """Verifica periodicamente o CSV e recarrega o catálogo quando ele muda"""
+        if self.intervalo_recarga <= 0:
+            return
+        while True:
+            await asyncio.sleep(self.intervalo_recarga)
+            try:
+                await asyncio.to_thread(self.recarregar)
+            except Exception as e:
+                print(f"Erro ao recarregar materiais: {e}")
+
+    def _caminho_snapshot(self, versao: str) -> str:
+        extensao = "sqlite3" if self.backend == "sqlite" else "snap"
+        return os.path.join(self.diretorio_snapshot, f"materiais-{versao}.{extensao}")
+
+    def _construir_indice(self, csv_path: str, versao: str) -> IndiceMateriais:
+        """Monta o índice a partir do CSV e grava o snapshot do backend configurado"""
+        if self.backend == "sqlite":
+            os.makedirs(self.diretorio_snapshot, exist_ok=True)
+            destino = self._caminho_snapshot(versao)
+            # As linhas vão do CSV direto para o banco, sem montar o catálogo em memória
+            indice = MaterialIndexSQLite.construir(_linhas_csv(csv_path), destino, versao)
+            self._remover_snapshots_antigos(destino)
+            return indice
+
+        indice = MaterialIndex(dict(_linhas_csv(csv_path)))
+        self._gravar_snapshot(versao, indice)
+        return indice
+
+    def _ler_snapshot(self, versao: str) -> Optional[IndiceMateriais]:
+        try:
+            if self.backend == "sqlite":
+                return MaterialIndexSQLite.abrir(self._caminho_snapshot(versao), versao)
+            with open(self._caminho_snapshot(versao), "rb") as arquivo:
+                # marshal.load lê o arquivo em pedaços pequenos; ler tudo e usar loads é bem mais rápido
+                dados = marshal.loads(arquivo.read())
+            if dados.get("formato") != FORMATO_SNAPSHOT or dados.get("versao") != versao:
+                return None
+            return MaterialIndex.restaurar(dados["indice"])
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # Snapshot corrompido ou de outra versão do Python: reconstruir a partir do CSV
+            print(f"Snapshot de materiais inválido, reconstruindo: {e}")
+            return None
+
+    def _gravar_snapshot(self, versao: str, indice: MaterialIndex):
+        """Grava o snapshot (tmp + rename, seguro com vários workers) e remove versões antigas"""
+        destino = self._caminho_snapshot(versao)
+        try:
+            os.makedirs(self.diretorio_snapshot, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.diretorio_snapshot, suffix=".tmp")
+            with os.fdopen(fd, "wb") as arquivo:
+                arquivo.write(marshal.dumps({"formato": FORMATO_SNAPSHOT, "versao": versao, "indice": indice.exportar()}))
+            os.replace(tmp, destino)
+        except OSError as e:
+            print(f"Não foi possível gravar o snapshot de materiais: {e}")
+            return
+        self._remover_snapshots_antigos(destino)
+
+    def _remover_snapshots_antigos(self, atual: str):
+        # Um worker que ainda use um banco SQLite removido continua lendo pelo descritor aberto
+        for nome in os.listdir(self.diretorio_snapshot):
+            caminho = os.path.join(self.diretorio_snapshot, nome)
+            if nome.startswith("materiais-") and nome.endswith((".snap", ".sqlite3")) and caminho != atual:
+                try:
+                    os.remove(caminho)
+                except OSError:
+                    pass
+
     def validar_codigo_material(self, codigo: str) -> bool:
         """Valida se o código do material existe na base de dados"""
-        if not self.materiais_db:
-            print("Base de materiais não carregada, retornando True")
+        indice = self.catalogo.indice
+        if not len(indice):
+            self._avisar_base_vazia()
             return True
-        return codigo in self.materiais_db
-    
+        return indice.contem(codigo)
+
+    def validar_lote(self, codigos: List[str]) -> List[dict]:
+        """
+        Valida vários códigos de uma vez, retornando codigo/valido/descricao para cada um
+
+        Os códigos são resolvidos em uma única passada pelo índice, na ordem recebida e
+        sem repetições. Sem base carregada, todos são aceitos sem descrição, como em
+        validar_codigo_material.
+        """
+        codigos = list(dict.fromkeys(codigos))
+        indice = self.catalogo.indice
+        if not len(indice):
+            self._avisar_base_vazia()
+            return [{"codigo": codigo, "valido": True, "descricao": None} for codigo in codigos]
+        descricoes = indice.obter_descricoes(codigos)
+        return [
+            {"codigo": codigo, "valido": codigo in descricoes, "descricao": descricoes.get(codigo)}
+            for codigo in codigos
+        ]
+
+    def _avisar_base_vazia(self):
+        # Uma vez por processo: a validação roda a cada requisição
+        if not self._aviso_base_vazia:
+            self._aviso_base_vazia = True
+            print("Base de materiais não carregada, aceitando códigos com formato válido")
+
     def obter_descricao_material(self, codigo: str) -> Optional[str]:
         """Obtém a descrição do material pelo código"""
-        return self.materiais_db.get(codigo)
-    
-    def buscar_materiais(self, termo: str, limite: int = 10) -> Dict[str, str]:
-        """Busca materiais por termo (código ou descrição)"""
-        termo = termo.lower()
-        resultados = {}
-        
-        for codigo, descricao in self.materiais_db.items():
-            if (termo in codigo.lower() or 
-                termo in descricao.lower()) and len(resultados) < limite:
-                resultados[codigo] = descricao
-        
-        return resultados
-    
+        return self.catalogo.indice.obter_descricao(codigo)
+
+    def total_materiais(self) -> int:
+        return len(self.catalogo.indice)
+
+    def amostra_materiais(self, quantidade: int = 5) -> Dict[str, str]:
+        """Primeiros materiais do catálogo, em ordem de código"""
+        return dict(self.catalogo.indice.amostra(quantidade))
+
+    def buscar_materiais(self, termo: str, limite: int = 10, fuzzy: bool = False,
+                         catalogo: Optional[CatalogoMateriais] = None) -> Dict[str, str]:
+        """
+        Busca materiais por termo (código ou descrição), ordenados por relevância
+
+        A busca ignora acentos; com fuzzy=True também tolera erros de digitação,
+        completando o resultado com os materiais mais parecidos.
+
+        Os resultados ficam em cache por (consulta normalizada, limite, fuzzy, versão do
+        catálogo): "Tubo", "tubo " e "túbo" reaproveitam a mesma entrada. Quem já leu
+        `catalogo` (ex.: para o ETag) passa a mesma versão, que não muda com uma recarga.
+        """
+        catalogo = catalogo or self.catalogo
+        chave = (normalizar(termo), limite, fuzzy, catalogo.versao)
+        resultado = self.cache.obter_ou_calcular(chave, lambda: tuple(catalogo.indice.buscar(termo, limite, fuzzy)))
+        return dict(resultado)
+
+    def snapshot_cliente_disponivel(self) -> bool:
+        total = self.total_materiais()
+        return 0 < total <= MATERIAIS_SNAPSHOT_CLIENTE_MAX
+
+    def snapshot_cliente(self) -> Optional[SnapshotCliente]:
+        """
+        Snapshot comprimido da versão atual para o autocomplete no navegador
+
+        Gerado na primeira chamada de cada versão e reaproveitado até a próxima recarga.
+        Retorna None se o catálogo estiver vazio ou for grande demais para o navegador.
+        """
+        catalogo = self.catalogo
+        if not self.snapshot_cliente_disponivel():
+            return None
+        with self._lock_snapshot_cliente:
+            snapshot = self._snapshot_cliente
+            if snapshot is None or snapshot.versao != catalogo.versao:
+                snapshot = gerar_snapshot_cliente(catalogo.indice, catalogo.versao)
+                self._snapshot_cliente = snapshot
+            return snapshot
+
     def obter_todos_codigos(self) -> list:
         """Retorna todos os códigos de materiais disponíveis"""
-        return list(self.materiais_db.keys())
+        return self.catalogo.indice.listar_codigos()
+
+
+def _linhas_csv(csv_path: str) -> Iterator[Tuple[str, str]]:
+    """Lê o CSV de materiais linha a linha, gerando pares (código, descrição)"""
+    with open(csv_path, 'r', encoding='utf-8') as file:
+        reader = csv.DictReader(file, delimiter=';')
+        for row in reader:
+            codigo = row['Código'].strip('"')
+            descricao = row['Descrição Resumida'].strip('"')
+            yield codigo, descricao
+
+
+def _assinatura_arquivo(caminho: str) -> tuple:
+    info = os.stat(caminho)
+    return info.st_size, info.st_mtime_ns
+
+
+def _hash_arquivo(caminho: str) -> str:
+    sha256 = hashlib.sha256()
+    with open(caminho, "rb") as arquivo:
+        for bloco in iter(lambda: arquivo.read(1024 * 1024), b""):
+            sha256.update(bloco)
+    return sha256.hexdigest()
 
 # Instância global do serviço
 material_service = MaterialService()
@@ -0,0 +1,121 @@
+import json
+import time
+import zipfile
+from datetime import datetime
+from typing import Iterator, List, Sequence
+
+from app.services.artifact_store import Artefato
+
+# Tamanho dos blocos lidos de cada PDF e enviados ao cliente
+TAMANHO_BLOCO = 64 * 1024
+
+
+class _SaidaStreaming:
+    """
+    Destino de escrita do ZipFile que só acumula os bytes até o próximo envio
+
+    Não implementa tell/seek de propósito: o zipfile passa a gravar no modo
+    "não pesquisável" (data descriptors após cada arquivo), então nada precisa
+    ser reescrito e os bytes podem ser enviados assim que produzidos.
+    """
+
+    def __init__(self):
+        self._partes = []
+
+    def write(self, dados) -> int:
+        self._partes.append(bytes(dados))
+        return len(dados)
+
+    def flush(self):
+        pass
+
+    def retirar(self) -> bytes:
+        dados = b"".join(self._partes)
+        self._partes.clear()
+        return dados
+
+
+def nome_pacote(ss: str, sk: str) -> str:
+    """Nome do arquivo ZIP de uma SS/SK, no mesmo padrão dos PDFs"""
+    ss_nome = ss.strip().replace("/", "_")
+    sk_nome = sk.strip().upper().replace("-", "_")
+    return f"PACOTE_SS{ss_nome}_{sk_nome}.zip"
+
+
+def gerar_pacote_zip(artefatos: List[Artefato], ss: str, sk: str,
+                     falhas: Sequence[Artefato] = ()) -> Iterator[bytes]:
+    """
+    Gera o ZIP com os PDFs da SS/SK e um manifesto dos planos, bloco a bloco
+
+    Nada é montado inteiro em memória ou em disco: cada PDF é lido em blocos de
+    TAMANHO_BLOCO e os bytes comprimidos são entregues à medida que saem. Relatórios
+    em `falhas` (renderização completa que falhou) só aparecem no manifesto.
+    """
+    saida = _SaidaStreaming()
+    incluidos = []
+
+    with zipfile.ZipFile(saida, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for artefato in artefatos:
+            try:
+                # Abrir antes de escrever o cabeçalho: se o artefato foi despejado, apenas pula
+                origem = open(artefato.caminho, "rb")
+            except FileNotFoundError:
+                continue
+
+            with origem:
+                info = zipfile.ZipInfo(
+                    f"{artefato.tipo}/{artefato.nome_arquivo}",
+                    date_time=time.localtime(artefato.criado_em)[:6]
+                )
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.file_size = artefato.tamanho
+                with zf.open(info, mode="w") as destino:
+                    while True:
+                        bloco = origem.read(TAMANHO_BLOCO)
+                        if not bloco:
+                            break
+                        destino.write(bloco)
+                        dados = saida.retirar()
+                        if dados:
+                            yield dados
+
+            incluidos.append(artefato)
+            dados = saida.retirar()
+            if dados:
+                yield dados
+
+        manifesto = {
+            "ss": ss,
+            "sk": sk.upper(),
+            "gerado_em": datetime.now().isoformat(),
+            "total_arquivos": len(incluidos),
+            "arquivos": [
+                {
+                    "arquivo": f"{a.tipo}/{a.nome_arquivo}",
+                    "tipo": a.tipo,
+                    "tamanho_bytes": a.tamanho,
+                    "gerado_em": datetime.fromtimestamp(a.criado_em).isoformat(),
+                    "projeto": a.metadados.get("projeto"),
+                    "cod_material": a.metadados.get("cod_material"),
+                    "modo": a.metadados.get("modo"),
+                    "estado": a.estado,
+                    "plano": a.metadados.get("plano")
+                }
+                for a in incluidos
+            ],
+            "falhas": [
+                {
+                    "arquivo": f"{a.tipo}/{a.nome_arquivo}",
+                    "tipo": a.tipo,
+                    "projeto": a.metadados.get("projeto"),
+                    "estado": a.estado
+                }
+                for a in falhas
+            ]
+        }
+        zf.writestr("manifesto.json", json.dumps(manifesto, ensure_ascii=False, indent=2))
+
+    # Diretório central do ZIP, escrito ao fechar o arquivo
+    dados = saida.retirar()
+    if dados:
+        yield dados
@@ -0,0 +1,60 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, TypeVar
+
+V = TypeVar("V")
+
+
+class CacheLRU:
+    """
+    Cache LRU em memória com contadores de acertos, falhas e despejos
+
+    A chave deve incluir a versão dos dados de origem; assim uma entrada antiga nunca
+    é servida depois de uma recarga, mesmo antes de limpar() ser chamado.
+    """
+
+    def __init__(self, max_itens: int):
+        self.max_itens = max_itens
+        self._itens: "OrderedDict[Hashable, object]" = OrderedDict()
+        # Recargas rodam em outra thread e chamam limpar()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+        self.despejos = 0
+
+    def obter_ou_calcular(self, chave: Hashable, calcular: Callable[[], V]) -> V:
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave]
+            self.falhas += 1
+
+        # Calcula fora do lock: uma busca lenta não bloqueia as demais
+        valor = calcular()
+        if self.max_itens <= 0:
+            return valor
+
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+                self.despejos += 1
+        return valor
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+
+    def estatisticas(self) -> dict:
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                "itens": len(self._itens),
+                "max_itens": self.max_itens,
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "despejos": self.despejos,
+                "taxa_acerto": round(self.acertos / consultas, 4) if consultas else 0.0
+            }
@@ -84,15 +84,24 @@ class CorteuAnalyticsLite {
         
         const events = [...this.eventBuffer];
         this.eventBuffer = [];
+        if (this.bufferTimeout) {
+            clearTimeout(this.bufferTimeout);
+            this.bufferTimeout = null;
+        }
         
-        try {
-            await fetch(`${this.serverUrl}/track-batch`, {
-                method: 'POST',
-                headers: { 'Content-Type': 'application/json' },
-                body: JSON.stringify({ events })
-            });
-        } catch (error) {
-            console.warn('Analytics batch failed:', error);
+        // Lotes de até 100 eventos (limite do /track-batch); keepalive conclui o envio
+        // mesmo se a aba for fechada logo depois
+        for (let i = 0; i < events.length; i += 100) {
+            try {
+                await fetch(`${this.serverUrl}/track-batch`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({ events: events.slice(i, i + 100) }),
+                    keepalive: true
+                });
+            } catch (error) {
+                console.warn('Analytics batch failed:', error);
+            }
         }
     }
 
@@ -298,20 +298,63 @@ function validarCodMaterial() {
     return true;
 }
 
-async function validarMaterialNaBase(codigo) {
-    const errorElement = document.getElementById('cod-error');
-    const descricaoElement = document.getElementById('material-descricao');
+// Validações já feitas nesta página (código -> Promise com {codigo, valido, descricao})
+const validacoesMateriais = new Map();
+// Códigos aguardando o envio do próximo lote (código -> {resolve, reject})
+let codigosValidacaoPendentes = null;
+
+function validarMaterialEmLote(codigo) {
+    // input, blur e submit validam o mesmo código: reaproveita o resultado
+    if (validacoesMateriais.has(codigo)) {
+        return validacoesMateriais.get(codigo);
+    }
+    
+    // Códigos pedidos no mesmo ciclo vão juntos em uma única chamada
+    if (!codigosValidacaoPendentes) {
+        codigosValidacaoPendentes = new Map();
+        setTimeout(enviarLoteValidacao, 0);
+    }
+    const promessa = new Promise((resolve, reject) => {
+        codigosValidacaoPendentes.set(codigo, { resolve, reject });
+    });
+    validacoesMateriais.set(codigo, promessa);
+    return promessa;
+}
+
+async function enviarLoteValidacao() {
+    const pendentes = codigosValidacaoPendentes;
+    codigosValidacaoPendentes = null;
     
     try {
-        const response = await fetch(`/api/materiais/validar/${codigo}`);
-        
+        const response = await fetch('/api/materiais/validar-lote', {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ codigos: Array.from(pendentes.keys()) })
+        });
         if (!response.ok) {
-            console.warn('API de validação não disponível, usando validação básica');
-            limparDescricaoMaterial();
-            return;
+            throw new Error(`HTTP ${response.status}`);
         }
         
         const data = await response.json();
+        const porCodigo = new Map(data.materiais.map(material => [material.codigo, material]));
+        pendentes.forEach(({ resolve }, codigo) => {
+            resolve(porCodigo.get(codigo) || { codigo, valido: false, descricao: null });
+        });
+    } catch (error) {
+        // Falhas não ficam no cache: a próxima validação tenta de novo
+        pendentes.forEach(({ reject }, codigo) => {
+            validacoesMateriais.delete(codigo);
+            reject(error);
+        });
+    }
+}
+
+async function validarMaterialNaBase(codigo) {
+    const errorElement = document.getElementById('cod-error');
+    const descricaoElement = document.getElementById('material-descricao');
+    
+    try {
+        const data = await validarMaterialEmLote(codigo);
         
         if (data.valido) {
             hideError(errorElement);
@@ -763,7 +806,7 @@ async function gerarCorte() {
         hideLoading();
         
         if (response.ok && resultado.sucesso) {
-            showResult(resultadoEl, 'success', resultado.resultado, resultado.nome_arquivo, 'corte');
+            showResult(resultadoEl, 'success', resultado.resultado, resultado.nome_arquivo, 'corte', resultado.artefato_id);
             
             // Google Analytics
             if (typeof gtag !== 'undefined') {
@@ -823,7 +866,7 @@ async function gerarMinuta() {
         hideLoading();
         
         if (response.ok && resultado.sucesso) {
-            showResult(resultadoEl, 'success', resultado.resultado, resultado.nome_arquivo, 'minuta');
+            showResult(resultadoEl, 'success', resultado.resultado, resultado.nome_arquivo, 'minuta', resultado.artefato_id);
             
             // Google Analytics
             if (typeof gtag !== 'undefined') {
@@ -845,8 +888,8 @@ async function gerarMinuta() {
 }
 
 // Mostrar resultado
-function showResult(element, type, message, fileName = null, fileType = null) {
-    console.log('Mostrando resultado:', {type, message, fileName, fileType});
+function showResult(element, type, message, fileName = null, fileType = null, artefatoId = null) {
+    console.log('Mostrando resultado:', {type, message, fileName, fileType, artefatoId});
     
     if (!element) {
         console.error('Elemento de resultado não encontrado');
@@ -882,7 +925,7 @@ function showResult(element, type, message, fileName = null, fileType = null) {
                 event.preventDefault(); // Previne comportamento padrão
                 event.stopPropagation(); // Para a propagação do evento
                 console.log('Preview clicado:', fileName, fileType);
-                previewPDF(fileName, fileType);
+                previewPDF(artefatoId, fileType);
             };
             
             // Botão de Download
@@ -894,11 +937,26 @@ function showResult(element, type, message, fileName = null, fileType = null) {
                 event.preventDefault(); // Previne comportamento padrão
                 event.stopPropagation(); // Para a propagação do evento
                 console.log('Download clicado:', fileName, fileType);
-                downloadPDF(fileName, fileType);
+                downloadPDF(artefatoId, fileName, fileType);
+            };
+            
+            // Botão de Pacote (todos os relatórios da SS/SK em um ZIP)
+            // SS/SK capturadas agora, para não mudar se o formulário for editado depois
+            const { ss, sk } = coletarDados();
+            const pacoteBtn = document.createElement('button');
+            pacoteBtn.type = 'button'; // Evita submit do formulário
+            pacoteBtn.className = 'flex-1 bg-gray-600 hover:bg-gray-700 text-white font-semibold py-2 px-4 rounded transition-all';
+            pacoteBtn.innerHTML = '<i class="fas fa-file-archive mr-2"></i>Baixar Todos (ZIP)';
+            pacoteBtn.onclick = (event) => {
+                event.preventDefault(); // Previne comportamento padrão
+                event.stopPropagation(); // Para a propagação do evento
+                console.log('Pacote clicado:', ss, sk);
+                downloadPacote(ss, sk);
             };
             
             buttonsDiv.appendChild(previewBtn);
             buttonsDiv.appendChild(downloadBtn);
+            buttonsDiv.appendChild(pacoteBtn);
             element.appendChild(buttonsDiv);
         }
     } else {
@@ -980,14 +1038,14 @@ function hideTutorial() {
 }
 
 // Preview PDF
-function previewPDF(nomeArquivo, tipo) {
-    console.log('Iniciando preview:', nomeArquivo, tipo);
+function previewPDF(artefatoId, tipo) {
+    console.log('Iniciando preview:', artefatoId, tipo);
     
     let previewUrl;
     if (tipo === 'corte') {
-        previewUrl = `/api/cortes/preview/${nomeArquivo}`;
+        previewUrl = `/api/cortes/preview/${artefatoId}`;
     } else {
-        previewUrl = `/api/minuta/preview/${nomeArquivo}`;
+        previewUrl = `/api/minuta/preview/${artefatoId}`;
     }
     
     // Abrir em nova aba/janela
@@ -1003,14 +1061,14 @@ function previewPDF(nomeArquivo, tipo) {
 }
 
 // Download PDF
-function downloadPDF(nomeArquivo, tipo) {
-    console.log('Iniciando download:', nomeArquivo, tipo);
+function downloadPDF(artefatoId, nomeArquivo, tipo) {
+    console.log('Iniciando download:', artefatoId, nomeArquivo, tipo);
     
     const link = document.createElement('a');
     if (tipo === 'corte') {
-        link.href = `/api/cortes/download/${nomeArquivo}`;
+        link.href = `/api/cortes/download/${artefatoId}`;
     } else {
-        link.href = `/api/minuta/download/${nomeArquivo}`;
+        link.href = `/api/minuta/download/${artefatoId}`;
     }
     link.download = nomeArquivo;
     link.click();
@@ -1024,6 +1082,23 @@ function downloadPDF(nomeArquivo, tipo) {
     }
 }
 
+// Download do pacote ZIP com todos os relatórios da SS/SK
+function downloadPacote(ss, sk) {
+    console.log('Iniciando download do pacote:', ss, sk);
+    
+    const link = document.createElement('a');
+    link.href = `/api/artefatos/pacote?ss=${encodeURIComponent(ss)}&sk=${encodeURIComponent(sk)}`;
+    link.click();
+    
+    // Analytics
+    if (typeof gtag !== 'undefined') {
+        gtag('event', 'download', {
+            'event_category': 'pacote',
+            'event_label': sk
+        });
+    }
+}
+
 console.log('=== ARQUIVO APP.JS CARREGADO ===');
 
 // ============== FUNCIONALIDADES DE AUTOCOMPLETE ==============
@@ -1044,10 +1119,21 @@ async function handleAutocomplete(value) {
         return;
     }
     
+    // Catálogo local atualizado: busca no navegador, sem esperar o servidor
+    const sugestoesLocais = window.catalogoMateriais && window.catalogoMateriais.autocomplete(value, 5, true);
+    if (sugestoesLocais) {
+        if (sugestoesLocais.length > 0) {
+            showAutocomplete(sugestoesLocais);
+        } else {
+            hideAutocomplete();
+        }
+        return;
+    }
+    
     // Debounce para evitar muitas requisições
     autocompleteTimeout = setTimeout(async () => {
         try {
-            const response = await fetch(`/api/materiais/autocomplete?q=${encodeURIComponent(value)}&limit=5`);
+            const response = await fetch(`/api/materiais/autocomplete?q=${encodeURIComponent(value)}&limit=5&fuzzy=true`);
             
             if (!response.ok) {
                 console.warn('API de autocomplete não disponível');
@@ -0,0 +1,276 @@
+// Autocomplete de materiais no navegador, a partir do snapshot versionado do catálogo
+// (/api/materiais/snapshot). Segue o mesmo ranking de MaterialIndex.buscar no servidor:
+// código exato, prefixo de código, início de palavra, substring e, por fim, aproximados.
+
+const RANK_CODIGO_EXATO = 0;
+const RANK_PREFIXO_CODIGO = 1;
+const RANK_INICIO_PALAVRA = 2;
+const RANK_SUBSTRING = 3;
+
+const SIMILARIDADE_MINIMA = 0.3;
+const MAX_PALAVRAS_PARECIDAS = 20;
+const MAX_MATERIAIS_POR_PALAVRA = 5000;
+
+const SEPARADORES_PALAVRAS = /[^\p{L}\p{N}]+/u;
+const ALFANUMERICO = /[\p{L}\p{N}]/u;
+
+function normalizarMaterial(texto) {
+    // Minúsculas e sem acentos (AÇO -> aco), como normalizar() no servidor
+    return texto.trim().toLowerCase().normalize('NFKD').replace(/\p{M}/gu, '');
+}
+
+function palavrasMaterial(texto) {
+    return texto.split(SEPARADORES_PALAVRAS).filter(Boolean);
+}
+
+function trigramasPalavra(palavra) {
+    const texto = `  ${palavra} `;
+    const trigramas = new Set();
+    for (let i = 0; i < texto.length - 2; i++) {
+        trigramas.add(texto.slice(i, i + 3));
+    }
+    return trigramas;
+}
+
+function inicioDePalavra(texto, consulta) {
+    let posicao = texto.indexOf(consulta);
+    while (posicao !== -1) {
+        if (posicao === 0 || !ALFANUMERICO.test(texto[posicao - 1])) {
+            return true;
+        }
+        posicao = texto.indexOf(consulta, posicao + 1);
+    }
+    return false;
+}
+
+class CatalogoMateriaisLocal {
+    constructor() {
+        this.versao = null;
+        this.codigos = [];
+        this.descricoes = [];
+        this.codigosNorm = [];
+        this.descricoesNorm = [];
+        this.posicaoCodigo = new Map();
+        // Índices da busca aproximada, montados só no primeiro uso
+        this.vocabulario = null;
+
+        // Versão atual no servidor; diferente de this.versao = snapshot desatualizado
+        this.versaoServidor = null;
+        this.ultimaVerificacao = 0;
+        this.intervaloVerificacao = 60000; // 60 segundos
+        this.carregando = null;
+
+        this.verificarVersao();
+    }
+
+    get pronto() {
+        return this.versao !== null && this.versao === this.versaoServidor;
+    }
+
+    async verificarVersao() {
+        this.ultimaVerificacao = Date.now();
+        try {
+            const response = await fetch('/api/materiais/snapshot', { cache: 'no-cache' });
+            if (!response.ok) return;
+
+            const info = await response.json();
+            this.versaoServidor = info.versao;
+            if (info.disponivel && info.versao !== this.versao && !this.carregando) {
+                this.carregando = this.carregarSnapshot(info.url).finally(() => {
+                    this.carregando = null;
+                });
+            }
+        } catch (error) {
+            console.warn('Não foi possível verificar a versão do catálogo de materiais:', error);
+        }
+    }
+
+    async carregarSnapshot(url) {
+        try {
+            // URL versionada e imutável: depois do primeiro download vem do cache do navegador
+            const response = await fetch(url);
+            if (!response.ok) return;
+
+            const dados = await response.json();
+            this.codigos = dados.codigos;
+            this.descricoes = dados.descricoes;
+            this.codigosNorm = dados.codigos.map(normalizarMaterial);
+            this.descricoesNorm = dados.descricoes.map(normalizarMaterial);
+            this.posicaoCodigo = new Map(this.codigosNorm.map((codigo, i) => [codigo, i]));
+            this.vocabulario = null;
+            this.versao = dados.versao;
+            console.log(`📦 Catálogo de materiais local: ${this.codigos.length} materiais (versão ${this.versao.slice(0, 12)})`);
+        } catch (error) {
+            console.warn('Erro ao carregar o catálogo de materiais local:', error);
+        }
+    }
+
+    // Sugestões no formato de /api/materiais/autocomplete, ou null se o snapshot
+    // ainda não chegou ou está desatualizado (o chamador usa o servidor)
+    autocomplete(termo, limite = 5, fuzzy = true) {
+        if (Date.now() - this.ultimaVerificacao > this.intervaloVerificacao) {
+            this.verificarVersao();
+        }
+        if (!this.pronto) {
+            return null;
+        }
+
+        return this.buscar(termo, limite, fuzzy).map(i => {
+            const descricao = this.descricoes[i];
+            return {
+                codigo: this.codigos[i],
+                descricao,
+                label: `${this.codigos[i]} - ${descricao.slice(0, 50)}${descricao.length > 50 ? '...' : ''}`
+            };
+        });
+    }
+
+    buscar(termo, limite, fuzzy) {
+        const consulta = normalizarMaterial(termo);
+        if (!consulta || limite <= 0) {
+            return [];
+        }
+
+        const encontrados = new Map();
+
+        const exato = this.posicaoCodigo.get(consulta);
+        if (exato !== undefined) {
+            encontrados.set(exato, RANK_CODIGO_EXATO);
+        }
+
+        const inicio = this.primeiroCodigoComPrefixo(consulta);
+        for (let i = inicio; i < this.codigosNorm.length && i <= inicio + limite; i++) {
+            if (!this.codigosNorm[i].startsWith(consulta)) break;
+            if (!encontrados.has(i)) encontrados.set(i, RANK_PREFIXO_CODIGO);
+        }
+
+        // Consultas curtas só casam com início de palavra: sem letras ou números, nada a procurar
+        const procurarDescricoes = consulta.length >= 3 || palavrasMaterial(consulta).length > 0;
+        if (encontrados.size < limite && procurarDescricoes) {
+            let melhores = encontrados.size;
+            let substrings = 0;
+            for (let i = 0; i < this.descricoesNorm.length; i++) {
+                if (encontrados.has(i)) continue;
+                const descricao = this.descricoesNorm[i];
+                if (inicioDePalavra(descricao, consulta)) {
+                    encontrados.set(i, RANK_INICIO_PALAVRA);
+                    melhores++;
+                    if (melhores >= limite) break;
+                } else if (substrings < limite && consulta.length >= 3 &&
+                           (descricao.includes(consulta) || this.codigosNorm[i].includes(consulta))) {
+                    encontrados.set(i, RANK_SUBSTRING);
+                    substrings++;
+                }
+            }
+        }
+
+        const ordenados = Array.from(encontrados.keys())
+            .sort((a, b) => (encontrados.get(a) - encontrados.get(b)) || (a - b))
+            .slice(0, limite);
+        if (fuzzy && ordenados.length < limite) {
+            ordenados.push(...this.buscarAproximados(consulta, limite - ordenados.length, encontrados));
+        }
+        return ordenados;
+    }
+
+    primeiroCodigoComPrefixo(consulta) {
+        let inicio = 0;
+        let fim = this.codigosNorm.length;
+        while (inicio < fim) {
+            const meio = (inicio + fim) >> 1;
+            if (this.codigosNorm[meio] < consulta) inicio = meio + 1;
+            else fim = meio;
+        }
+        return inicio;
+    }
+
+    buscarAproximados(consulta, limite, excluidos) {
+        const palavras = palavrasMaterial(consulta);
+        const longas = palavras.filter(p => p.length >= 3);
+        const curtas = palavras.filter(p => p.length < 3);
+        if (!longas.length || limite <= 0) {
+            return [];
+        }
+
+        let pontuacao = null;
+        for (const palavra of longas) {
+            const melhores = new Map();
+            for (const [variante, nota] of this.palavrasParecidas(palavra)) {
+                for (const i of this.vocabulario.ids.get(variante).slice(0, MAX_MATERIAIS_POR_PALAVRA)) {
+                    if (pontuacao !== null && !pontuacao.has(i)) continue;
+                    if (nota > (melhores.get(i) || 0)) melhores.set(i, nota);
+                }
+            }
+            if (pontuacao !== null) {
+                melhores.forEach((nota, i) => melhores.set(i, pontuacao.get(i) + nota));
+            }
+            pontuacao = melhores;
+            if (!pontuacao.size) {
+                return [];
+            }
+        }
+
+        const resultado = [];
+        const candidatos = Array.from(pontuacao.keys())
+            .sort((a, b) => (pontuacao.get(b) - pontuacao.get(a)) || (a - b));
+        for (const i of candidatos) {
+            if (excluidos.has(i)) continue;
+            if (curtas.length && !curtas.every(p => inicioDePalavra(this.descricoesNorm[i], p))) continue;
+            resultado.push(i);
+            if (resultado.length >= limite) break;
+        }
+        return resultado;
+    }
+
+    palavrasParecidas(palavra) {
+        const vocabulario = this.montarVocabulario();
+        const alvo = trigramasPalavra(palavra);
+        const comuns = new Map();
+        alvo.forEach(tri => {
+            for (const posicao of vocabulario.trigramas.get(tri) || []) {
+                comuns.set(posicao, (comuns.get(posicao) || 0) + 1);
+            }
+        });
+
+        const parecidas = [];
+        comuns.forEach((quantidade, posicao) => {
+            const nota = quantidade / (alvo.size + vocabulario.tamanhos[posicao] - quantidade);
+            if (nota >= SIMILARIDADE_MINIMA) {
+                parecidas.push([vocabulario.palavras[posicao], nota]);
+            }
+        });
+        parecidas.sort((a, b) => (b[1] - a[1]) || (a[0] < b[0] ? -1 : a[0] > b[0] ? 1 : 0));
+        return parecidas.slice(0, MAX_PALAVRAS_PARECIDAS);
+    }
+
+    montarVocabulario() {
+        if (this.vocabulario) {
+            return this.vocabulario;
+        }
+
+        // Palavra -> materiais (em ordem de código) e trigramas de cada palavra -> palavras
+        const ids = new Map();
+        this.descricoesNorm.forEach((descricao, i) => {
+            for (const palavra of new Set(palavrasMaterial(descricao))) {
+                if (!ids.has(palavra)) ids.set(palavra, []);
+                ids.get(palavra).push(i);
+            }
+        });
+
+        const palavras = Array.from(ids.keys());
+        const trigramas = new Map();
+        const tamanhos = palavras.map((palavra, posicao) => {
+            const tris = trigramasPalavra(palavra);
+            tris.forEach(tri => {
+                if (!trigramas.has(tri)) trigramas.set(tri, []);
+                trigramas.get(tri).push(posicao);
+            });
+            return tris.size;
+        });
+
+        this.vocabulario = { ids, palavras, trigramas, tamanhos };
+        return this.vocabulario;
+    }
+}
+
+window.catalogoMateriais = new CatalogoMateriaisLocal();
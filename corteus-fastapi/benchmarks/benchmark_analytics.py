@@ -0,0 +1,224 @@
+"""
+Benchmark de gravação do log de analytics com vários processos escrevendo juntos
+
+Simula workers do uvicorn gravando no mesmo diretório: cada processo filho grava
+seus eventos em lotes (como o buffer de /track) pelo AnalyticsStorage. Ao final,
+confere se nenhum evento foi perdido, duplicado ou truncado e mede a vazão de cada
+política de fsync.
+
+Com --comparar, compara os backends de armazenamento (JSONL e SQLite) em históricos de
+vários tamanhos: vazão de gravação em lotes e latência do dashboard (período em dias
+inteiros e período avulso), da análise de log-info e espaço em disco.
+
+Uso (na pasta corteus-fastapi):
+    python -m benchmarks.benchmark_analytics
+    python -m benchmarks.benchmark_analytics --processos 1 8 --eventos 5000 --lotes 1 100 --fsync never interval
+    python -m benchmarks.benchmark_analytics --comparar --tamanhos 10000 1000000 10000000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def executar_escritor(processo: int, eventos: int, lote: int) -> dict:
+    """Roda em um processo filho: grava `eventos` eventos em lotes de `lote`"""
+    sys.path.insert(0, RAIZ)
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app.models.analytics import AnalyticsEvent, analytics_storage
+
+    inicio = time.perf_counter()
+    latencias = []
+    for primeiro in range(0, eventos, lote):
+        batch = [
+            AnalyticsEvent(event="page_view", page="/bench", session_id=f"{processo}-{i}", user_id=f"p{processo}")
+            for i in range(primeiro, min(primeiro + lote, eventos))
+        ]
+        t = time.perf_counter()
+        analytics_storage.save_events(batch)
+        latencias.append(time.perf_counter() - t)
+    analytics_storage.aggregates.save(force=True)
+
+    latencias.sort()
+    return {
+        "segundos": time.perf_counter() - inicio,
+        "lote_p50_ms": latencias[len(latencias) // 2] * 1000,
+        "lote_p99_ms": latencias[int(len(latencias) * 0.99)] * 1000,
+    }
+
+
+def verificar(diretorio: str, processos: int, eventos: int) -> dict:
+    """Confere o log gravado: eventos esperados, duplicados e linhas inválidas"""
+    sys.path.insert(0, RAIZ)
+    from app.models.analytics_log import AnalyticsLog, abrir_segmento
+
+    log = AnalyticsLog(diretorio)
+    vistos = set()
+    duplicados = invalidas = 0
+    for path in log.segments():
+        with abrir_segmento(path) as f:
+            for linha in f:
+                try:
+                    chave = json.loads(linha)["session_id"]
+                except (json.JSONDecodeError, KeyError):
+                    invalidas += 1
+                    continue
+                duplicados += chave in vistos
+                vistos.add(chave)
+    esperados = {f"{p}-{i}" for p in range(processos) for i in range(eventos)}
+    return {"perdidos": len(esperados - vistos), "duplicados": duplicados, "invalidas": invalidas}
+
+
+def _rodar(processos: int, eventos: int, lote: int, fsync: str, diretorio: str) -> dict:
+    env = dict(os.environ, ANALYTICS_DATA_DIR=diretorio, ANALYTICS_FSYNC=fsync)
+    filhos = [
+        subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.benchmark_analytics", "--escritor", str(p),
+             "--eventos", str(eventos), "--lotes", str(lote)],
+            cwd=RAIZ, env=env, stdout=subprocess.PIPE, text=True
+        )
+        for p in range(processos)
+    ]
+    resultados = []
+    for filho in filhos:
+        saida, _ = filho.communicate()
+        if filho.returncode != 0:
+            raise RuntimeError(f"Escritor terminou com código {filho.returncode}")
+        resultados.append(json.loads(saida.strip().splitlines()[-1]))
+    return {
+        # Vazão pelo tempo de gravação do escritor mais lento (sem a partida dos processos)
+        "eventos_s": processos * eventos / max(r["segundos"] for r in resultados),
+        "lote_p50_ms": max(r["lote_p50_ms"] for r in resultados),
+        "lote_p99_ms": max(r["lote_p99_ms"] for r in resultados),
+        **verificar(diretorio, processos, eventos),
+    }
+
+
+def gerar_eventos(total: int, dias: int = 60):
+    """Eventos sintéticos espalhados pelos últimos `dias` dias, em ordem cronológica"""
+    aleatorio = random.Random(total)
+    inicio = datetime.now() - timedelta(days=dias)
+    passo = dias * 86400 / total
+    tipos = ["page_view"] * 5 + ["button_click", "page_exit", "performance_metrics", "scroll", "form_submission"]
+    for i in range(total):
+        evento = aleatorio.choice(tipos)
+        data = {}
+        if evento == "button_click":
+            data = {"buttonText": aleatorio.choice(["Gerar Relatório", "Baixar PDF", "Salvar"]), "buttonId": "b1"}
+        elif evento == "page_exit":
+            data = {"time_on_page": aleatorio.randint(500, 120000)}
+        yield {
+            "event": evento,
+            "page": f"/pagina{aleatorio.randint(0, 30)}",
+            "timestamp": (inicio + timedelta(seconds=i * passo)).isoformat(),
+            "user_agent": aleatorio.choice(["Mozilla/5.0 Chrome/120", "Mozilla/5.0 (iPhone) Safari", "Firefox/121"]),
+            "ip": "",
+            "session_id": f"s{aleatorio.randint(0, total // 20)}",
+            "user_id": f"u{aleatorio.randint(0, total // 100)}",
+            "referrer": "",
+            "screen_resolution": aleatorio.choice(["1920x1080", "1366x768", "390x844"]),
+            "data": data,
+        }
+
+
+def _cronometrar(funcao) -> float:
+    inicio = time.perf_counter()
+    funcao()
+    return time.perf_counter() - inicio
+
+
+def medir_backend(backend: str, total: int, lote: int, diretorio: str) -> dict:
+    """Grava `total` eventos em lotes no backend e mede as consultas do dashboard"""
+    sys.path.insert(0, RAIZ)
+    from app.models.analytics import AnalyticsStorage
+    from app.models.analytics_log import dia_do_evento
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        storage = AnalyticsStorage(diretorio, os.path.join(diretorio, "sem_legado.json"), backend=backend)
+
+    # Gravação pelo mesmo caminho de save_events (log + agregados), sem construir AnalyticsEvent
+    inicio = time.perf_counter()
+    batch = []
+    for evento in gerar_eventos(total):
+        batch.append(evento)
+        if len(batch) >= lote:
+            storage.log.append(batch)
+            storage.aggregates.sync({dia_do_evento(e) for e in batch})
+            batch = []
+    if batch:
+        storage.log.append(batch)
+        storage.aggregates.sync({dia_do_evento(e) for e in batch})
+    gravacao = time.perf_counter() - inicio
+    storage.aggregates.save(force=True)
+
+    hoje = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    semana = (hoje - timedelta(days=6), hoje.replace(hour=23, minute=59, second=59))
+    avulso = (datetime.now() - timedelta(days=2, hours=5), datetime.now())
+    with contextlib.redirect_stdout(io.StringIO()):
+        return {
+            "eventos_s": total / gravacao,
+            "stats_tudo_ms": _cronometrar(storage.get_stats) * 1000,
+            "stats_semana_ms": _cronometrar(lambda: storage.get_stats(*semana)) * 1000,
+            "stats_avulso_ms": _cronometrar(lambda: storage.get_stats(*avulso)) * 1000,
+            "log_info_s": _cronometrar(storage.get_log_info),
+            "disco_mb": storage.log.size_bytes() / (1024 * 1024),
+        }
+
+
+def comparar_backends(tamanhos, lote: int, backends):
+    with tempfile.TemporaryDirectory(prefix="bench_analytics_") as trabalho:
+        for total in tamanhos:
+            print(f"\n== {total:,} eventos (lotes de {lote}) ==")
+            for backend in backends:
+                r = medir_backend(backend, total, lote, os.path.join(trabalho, f"{backend}_{total}"))
+                print(f"[{backend:<6}] gravação {r['eventos_s']:>9,.0f} eventos/s | stats: tudo {r['stats_tudo_ms']:>9.1f} ms, "
+                      f"7 dias {r['stats_semana_ms']:>9.1f} ms, avulso {r['stats_avulso_ms']:>9.1f} ms | "
+                      f"log-info {r['log_info_s']:>7.2f} s | disco {r['disco_mb']:>8.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processos", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--eventos", type=int, default=2000, help="eventos por processo")
+    parser.add_argument("--lotes", type=int, nargs="+", default=[1, 50])
+    parser.add_argument("--fsync", nargs="+", default=["never", "interval", "always"])
+    parser.add_argument("--comparar", action="store_true", help="comparar os backends jsonl e sqlite")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[10000, 1000000, 10000000],
+                        help="eventos no histórico (com --comparar)")
+    parser.add_argument("--backends", nargs="+", default=["jsonl", "sqlite"])
+    # Uso interno: processo filho que grava os eventos
+    parser.add_argument("--escritor", type=int)
+    args = parser.parse_args()
+
+    if args.escritor is not None:
+        print(json.dumps(executar_escritor(args.escritor, args.eventos, args.lotes[0])))
+        return
+    if args.comparar:
+        comparar_backends(args.tamanhos, max(args.lotes), args.backends)
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bench_analytics_") as trabalho:
+        for processos in args.processos:
+            print(f"\n== {processos} processo(s) x {args.eventos:,} eventos ==")
+            for lote in args.lotes:
+                for fsync in args.fsync:
+                    diretorio = os.path.join(trabalho, f"p{processos}_l{lote}_{fsync}")
+                    r = _rodar(processos, args.eventos, lote, fsync, diretorio)
+                    status = "ok" if not (r["perdidos"] or r["duplicados"] or r["invalidas"]) else (
+                        f"ERRO: {r['perdidos']} perdidos, {r['duplicados']} duplicados, {r['invalidas']} linhas inválidas"
+                    )
+                    print(f"[lote {lote:>3} | fsync {fsync:<8}] {r['eventos_s']:>9,.0f} eventos/s | "
+                          f"lote p50 {r['lote_p50_ms']:.2f} ms p99 {r['lote_p99_ms']:.2f} ms | {status}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Benchmark dos backends do catálogo de materiais (memoria x sqlite)
+
+Gera catálogos sintéticos a partir do CSV real (palavras das descrições recombinadas)
+e mede, para cada tamanho e backend, em processos separados:
+
+- construção: CSV -> índice + snapshot
+- partida a frio: carga do snapshot já existente
+- memória: pico de RSS de cada fase
+- latência média de validação, descrição e busca
+
+Uso (na pasta corteus-fastapi):
+    python -m benchmarks.benchmark_materiais
+    python -m benchmarks.benchmark_materiais --tamanhos 1000 100000 --backends sqlite
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_REAL = os.path.join(RAIZ, "materiais_unidade_M_descresumida.csv")
+
+TERMOS_BUSCA = ["tubo", "a36", "2005", "cantoneira 3", "pol)", "1/2 pol", "ac", "zzzz"]
+# Com erros de digitação/acentos, buscados com fuzzy=True
+TERMOS_APROXIMADOS = ["cantonera", "barra chta", "aço carbono"]
+REPETICOES = 200
+
+
+def gerar_csv(caminho: str, tamanho: int, semente: int = 42):
+    """Catálogo sintético com a mesma distribuição de palavras do CSV real"""
+    with open(CSV_REAL, encoding="utf-8") as arquivo:
+        linhas = list(csv.DictReader(arquivo, delimiter=";"))
+    descricoes = [linha["Descrição Resumida"].split() for linha in linhas]
+    # Famílias reais (3 primeiros dígitos) + sequencial: códigos únicos de 10 dígitos
+    prefixos = sorted({linha["Código"][:3] for linha in linhas})
+
+    aleatorio = random.Random(semente)
+    with open(caminho, "w", encoding="utf-8", newline="") as arquivo:
+        arquivo.write("Código;Descrição Resumida\n")
+        for i in range(tamanho):
+            codigo = f"{aleatorio.choice(prefixos)}{i:07d}"
+            base = aleatorio.choice(descricoes)
+            extra = aleatorio.choice(descricoes)
+            palavras = base[:aleatorio.randint(1, len(base))] + extra[aleatorio.randint(0, len(extra) - 1):]
+            arquivo.write(f'"{codigo}";"{" ".join(palavras)}"\n')
+
+
+def _pico_rss_mb() -> float:
+    # ru_maxrss em KiB no Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _media_us(funcao, argumentos) -> float:
+    inicio = time.perf_counter()
+    for _ in range(REPETICOES):
+        for argumento in argumentos:
+            funcao(argumento)
+    return (time.perf_counter() - inicio) / (REPETICOES * len(argumentos)) * 1e6
+
+
+def executar_fase(fase: str) -> dict:
+    """
+    Roda em um processo filho, com as variáveis MATERIAIS_* apontando para o catálogo
+    sintético: mede a criação da instância global, como na partida do servidor
+    """
+    sys.path.insert(0, RAIZ)
+    # Dependências do pacote app.services (reportlab etc.) ficam fora da medição
+    import Modulação.pdf_utils  # noqa: F401
+
+    inicio = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app.services.material_service import material_service as servico
+    resultado = {
+        "segundos": time.perf_counter() - inicio,
+        "origem": servico.catalogo.origem,
+        "total": servico.total_materiais(),
+        # Medido antes das consultas (que carregam a lista de códigos para sortear)
+        "pico_rss_mb": _pico_rss_mb(),
+    }
+
+    if fase == "carga":
+        aleatorio = random.Random(7)
+        codigos = [c for c, _ in servico.indice.amostra(servico.total_materiais())]
+        existentes = aleatorio.sample(codigos, min(50, len(codigos)))
+        consultas = existentes + [f"99{i:08d}" for i in range(50)]
+        resultado["validar_us"] = _media_us(servico.validar_codigo_material, consultas)
+        resultado["descricao_us"] = _media_us(servico.obter_descricao_material, existentes)
+        resultado["buscar_us"] = {
+            termo: _media_us(lambda t: servico.buscar_materiais(t, 10), [termo]) for termo in TERMOS_BUSCA
+        }
+        resultado["fuzzy_us"] = {
+            termo: _media_us(lambda t: servico.buscar_materiais(t, 10, fuzzy=True), [termo])
+            for termo in TERMOS_APROXIMADOS
+        }
+
+    return resultado
+
+
+def _rodar_filho(fase: str, backend: str, csv_path: str, diretorio: str) -> dict:
+    env = dict(
+        os.environ, MATERIAIS_CSV=csv_path, MATERIAIS_BACKEND=backend,
+        MATERIAIS_SNAPSHOT_DIR=diretorio, MATERIAIS_RELOAD_INTERVAL="0",
+        # Mede a busca no índice, não o cache de resultados
+        MATERIAIS_CACHE_ITENS="0"
+    )
+    saida = subprocess.run(
+        [sys.executable, "-m", "benchmarks.benchmark_materiais", "--fase", fase],
+        cwd=RAIZ, env=env, capture_output=True, text=True, check=True
+    )
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[1000, 100000, 1000000])
+    parser.add_argument("--backends", nargs="+", default=["memoria", "sqlite"])
+    # Uso interno: execução de uma fase no processo filho
+    parser.add_argument("--fase", choices=["construcao", "carga"])
+    args = parser.parse_args()
+
+    if args.fase:
+        print(json.dumps(executar_fase(args.fase)))
+        return
+
+    with tempfile.TemporaryDirectory(prefix="bench_materiais_") as trabalho:
+        for tamanho in args.tamanhos:
+            csv_path = os.path.join(trabalho, f"materiais_{tamanho}.csv")
+            gerar_csv(csv_path, tamanho)
+            tamanho_csv = os.path.getsize(csv_path) / 1024 / 1024
+            print(f"\n== {tamanho:,} materiais (CSV {tamanho_csv:.1f} MB) ==")
+
+            for backend in args.backends:
+                diretorio = os.path.join(trabalho, f"{backend}_{tamanho}")
+                construcao = _rodar_filho("construcao", backend, csv_path, diretorio)
+                carga = _rodar_filho("carga", backend, csv_path, diretorio)
+                snapshot = sum(os.path.getsize(os.path.join(diretorio, n)) for n in os.listdir(diretorio))
+
+                print(f"[{backend}] construção {construcao['segundos']:.2f}s (pico {construcao['pico_rss_mb']:.0f} MB) | "
+                      f"partida a frio {carga['segundos'] * 1000:.1f} ms (pico {carga['pico_rss_mb']:.0f} MB) | "
+                      f"snapshot {snapshot / 1024 / 1024:.1f} MB")
+                print(f"    validar {carga['validar_us']:.1f} µs | descrição {carga['descricao_us']:.1f} µs")
+                buscas = ", ".join(f"{termo!r} {us:.0f}" for termo, us in carga["buscar_us"].items())
+                print(f"    buscar (µs, limite 10): {buscas}")
+                aproximadas = ", ".join(f"{termo!r} {us:.0f}" for termo, us in carga["fuzzy_us"].items())
+                print(f"    buscar fuzzy (µs, limite 10): {aproximadas}")
+
+
+if __name__ == "__main__":
+    main()